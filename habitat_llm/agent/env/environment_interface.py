@@ -6,7 +6,7 @@ import glob
 import json
 import os
 from collections import OrderedDict, defaultdict
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 import cv2
 import gym
@@ -25,7 +25,8 @@ from habitat_baselines.utils.common import batch_obs, get_num_actions
 from habitat_sim.utils.viz_utils import depth_to_rgb
 
 from habitat_llm.agent.env.sensors import SENSOR_MAPPINGS
-from habitat_llm.perception import PerceptionObs, PerceptionSim
+from habitat_llm.concept_graphs.trajectory_shards import TrajectoryShardWriter
+from habitat_llm.perception import PerceptionFrame, PerceptionObs, PerceptionSim
 from habitat_llm.sims.metadata_interface import get_metadata_dict_from_config
 from habitat_llm.utils.core import separate_agent_idx
 
@@ -39,6 +40,8 @@ else:
 
 # LOGGING THE GRAPHS
 from habitat_llm.agent.env.log_graph import LogSystem
+from habitat_llm.agent.env.trajectory_writer import TrajectoryWriter
+
 
 def camera_spec_to_intrinsics(camera_spec):
     def f(length, fov):
@@ -53,6 +56,30 @@ def camera_spec_to_intrinsics(camera_spec):
     return np.array([[fx, fy, cx, cy]])
 
 
+def write_trajectory_frame(
+    save_path: str,
+    trajectory_idx: int,
+    pose: np.ndarray,
+    rgb: Optional[np.ndarray] = None,
+    depth: Optional[np.ndarray] = None,
+    panoptic: Optional[np.ndarray] = None,
+):
+    """
+    Saves the images and camera pose of an agent at a trajectory step as
+    arrays, along with images to look at, in the agent's trajectory directory
+    """
+    if rgb is not None:
+        np.save(f"{save_path}/rgb/{trajectory_idx}.npy", rgb)
+        imageio.imwrite(f"{save_path}/rgb/{trajectory_idx}.jpg", rgb)
+    if depth is not None:
+        cv2.imwrite(f"{save_path}/depth/{trajectory_idx}.png", depth_to_rgb(depth))
+        np.save(f"{save_path}/depth/{trajectory_idx}.npy", depth)
+    if panoptic is not None:
+        cv2.imwrite(f"{save_path}/panoptic/{trajectory_idx}.png", panoptic)
+        np.save(f"{save_path}/panoptic/{trajectory_idx}.npy", panoptic)
+    np.save(f"{save_path}/pose/{trajectory_idx}.npy", pose)
+
+
 class EnvironmentInterface:
     def __init__(
         self, conf, dataset=None, init_wg=True, init_env=True, gym_habitat_env=None
@@ -140,8 +167,17 @@ class EnvironmentInterface:
         self.trajectory_save_prefix: str = None
         self._trajectory_idx: int = None
         self._setup_current_episode_logging: bool = False
+        # Set per agent when trajectories are saved as shards rather than one
+        # file per frame, see trajectory_shards.py
+        self.trajectory_shard_writers: Dict[str, TrajectoryShardWriter] = None
+        # Writes the trajectory frames in the background, see save_trajectory_step
+        self.trajectory_writer = TrajectoryWriter(
+            num_workers=self.conf.trajectory.get("num_writer_workers", 2),
+            max_queued_frames=self.conf.trajectory.get("max_queued_frames", 16),
+        )
 
-        self.logger = LogSystem()
+        # world_graph_log holds the LogSystem arguments, e.g. output_dir
+        self.logger = LogSystem(**self.conf.get("world_graph_log", {}))
 
     def initialize_perception_and_world_graph(self):
         """
@@ -151,7 +187,11 @@ class EnvironmentInterface:
         if self.perception_mode == "gt":
             self.perception = PerceptionSim(self.sim, self.metadata_dict)
         else:
-            self.perception = PerceptionObs(self.sim, self.metadata_dict)
+            self.perception = PerceptionObs(
+                self.sim,
+                self.metadata_dict,
+                keyframe_config=self.conf.world_model.get("keyframe", None),
+            )
         # Set the partial observability flag
         self.partial_obs = self.conf.world_model.partial_obs
 
@@ -334,7 +374,18 @@ class EnvironmentInterface:
             dtype=torch.bool,
         )
 
+    def finish_trajectory(self):
+        """
+        Writes the frames of the episode's trajectory that are not saved yet
+        """
+        if self.trajectory_shard_writers is not None:
+            for shard_writer in self.trajectory_shard_writers.values():
+                shard_writer.close()
+        self.trajectory_writer.flush()
+
     def reset_logging(self):
+        # finish writing the trajectory of the previous episode
+        self.finish_trajectory()
         # empty variables to store the trajectory data initialized in
         # setup_logging_for_current_episode when save_trajectory is True
         self.save_options = None
@@ -342,8 +393,18 @@ class EnvironmentInterface:
         self.trajectory_save_paths = None
         self.trajectory_save_prefix = None
         self._trajectory_idx = None
+        self.trajectory_shard_writers = None
         self._setup_current_episode_logging = False
 
+    def close(self):
+        """
+        Finishes the trajectory and logs of the run, call it once the last
+        episode is done
+        """
+        self.finish_trajectory()
+        self.trajectory_writer.close()
+        self.logger.close()
+
     def reset_composite_action_response(self):
         """resets _composite_action_response to empty"""
         self._composite_action_response = {}
@@ -367,6 +428,9 @@ class EnvironmentInterface:
             self.save_options = self.conf.trajectory.save_options
             self._trajectory_idx = 0
             self.trajectory_save_paths = {}
+            save_shards = self.conf.trajectory.get("layout", "files") == "shards"
+            if save_shards:
+                self.trajectory_shard_writers = {}
 
             # create a parent directory for given episode/scene combo
             # then create agent-specific directories within it for each agent
@@ -397,25 +461,37 @@ class EnvironmentInterface:
                         intrinsics_array,
                     )
 
-                    # create other sub-directories
-                    if "rgb" in self.save_options:
-                        os.makedirs(
-                            os.path.join(self.trajectory_save_paths[curr_agent], "rgb")
-                        )
-                    if "depth" in self.save_options:
-                        os.makedirs(
-                            os.path.join(
-                                self.trajectory_save_paths[curr_agent], "depth"
+                    # create other sub-directories, shards have their own
+                    if not save_shards:
+                        if "rgb" in self.save_options:
+                            os.makedirs(
+                                os.path.join(
+                                    self.trajectory_save_paths[curr_agent], "rgb"
+                                )
                             )
-                        )
-                    if "panoptic" in self.save_options:
-                        os.makedirs(
-                            os.path.join(
-                                self.trajectory_save_paths[curr_agent], "panoptic"
+                        if "depth" in self.save_options:
+                            os.makedirs(
+                                os.path.join(
+                                    self.trajectory_save_paths[curr_agent], "depth"
+                                )
+                            )
+                        if "panoptic" in self.save_options:
+                            os.makedirs(
+                                os.path.join(
+                                    self.trajectory_save_paths[curr_agent], "panoptic"
+                                )
                             )
+                        os.makedirs(
+                            os.path.join(self.trajectory_save_paths[curr_agent], "pose")
                         )
-                    os.makedirs(
-                        os.path.join(self.trajectory_save_paths[curr_agent], "pose")
+                if save_shards:
+                    self.trajectory_shard_writers[curr_agent] = TrajectoryShardWriter(
+                        self.trajectory_save_paths[curr_agent],
+                        frames_per_shard=self.conf.trajectory.get(
+                            "frames_per_shard", 100
+                        ),
+                        compress=self.conf.trajectory.get("compress_shards", True),
+                        submit=self.trajectory_writer.submit,
                     )
 
     def get_final_action_vector(
@@ -448,10 +524,23 @@ class EnvironmentInterface:
         Additionally, saves this trajectory step if trajectory_logger is enabled
         """
 
+        # Under the simulated graph regime, query the sim once per step and
+        # derive the ground truth graph and both agents' subgraphs from it
+        perception_frame = None
+        if self.conf.world_model.type == "gt_graph" and not isinstance(
+            self.perception, PerceptionObs
+        ):
+            perception_frame = self.perception.get_perception_frame(
+                self._get_observing_agent_uids(), obs
+            )
+
         # Update fully observed world graph (ground truth)
         # This graph is used when planner is working under full observability
         # THis graph is also used by skills to check if a certain furniture is articulated or not etc.
-        most_recent_graph = self.perception.get_recent_graph()
+        if perception_frame is not None:
+            most_recent_graph = perception_frame.gt_graph
+        else:
+            most_recent_graph = self.perception.get_recent_graph()
         self.full_world_graph.update(
             most_recent_graph, partial_obs=False, update_mode="gt"
         )
@@ -463,20 +552,30 @@ class EnvironmentInterface:
             self.update_world_graphs_using_concept_graph(obs)
 
         # Update agents world graphs using simulator
-        elif self.conf.world_model.type == "gt_graph" and not isinstance(
-            self.perception, PerceptionObs
-        ):
-            self.update_world_graphs_using_sim(obs)
+        elif perception_frame is not None:
+            self.update_world_graphs_using_sim(obs, perception_frame)
 
         # if applicable save the data from trajectory step
         self.save_trajectory_step(obs)
 
         return
 
-    def update_world_graphs_using_sim(self, obs):
+    def _get_observing_agent_uids(self) -> List[str]:
+        """
+        Returns the uids of the agents whose observations feed the world graphs
+        under the simulated graph regime
+        """
+        if not self.partial_obs:
+            return []
+        return [str(self.robot_agent_uid), str(self.human_agent_uid)]
+
+    def update_world_graphs_using_sim(
+        self, obs, perception_frame: Optional[PerceptionFrame] = None
+    ):
         """
         This method updates world graphs for both agents using
-        simulated perception and simulated graph
+        simulated perception and simulated graph. perception_frame holds the
+        perception of the current step; it is computed if not given.
         """
 
         # Case 1: FULL OBSERVABILITY
@@ -509,15 +608,18 @@ class EnvironmentInterface:
             #     obs,
             # )
 
+            if perception_frame is None:
+                perception_frame = self.perception.get_perception_frame(
+                    self._get_observing_agent_uids(), obs
+                )
+
             # LEONA: Change this so that the robot can only have its own observation
-            most_recent_robot_subgraph = self.perception.get_recent_subgraph(
-                [str(self.robot_agent_uid)], 
-                obs
+            most_recent_robot_subgraph = self.perception.get_subgraph_from_frame(
+                perception_frame, [str(self.robot_agent_uid)]
             )
 
-            most_recent_human_subgraph = self.perception.get_recent_subgraph(
-                [str(self.human_agent_uid)],
-                obs
+            most_recent_human_subgraph = self.perception.get_subgraph_from_frame(
+                perception_frame, [str(self.human_agent_uid)]
             )
 
             # Update robot graph
@@ -593,68 +695,28 @@ class EnvironmentInterface:
 
     def save_trajectory_step(self, obs):
         # save data from this time-step; for current episode_id and scene
-        # also save the episode description in folder
+        # also save the episode description in folder. The files are written by
+        # trajectory_writer in the background, finish_trajectory waits for them
         if self.save_trajectory and self.trajectory_agent_names is not None:
             for curr_agent, camera_source in zip(
                 self.trajectory_agent_names, self.conf.trajectory.camera_prefixes
             ):
-                if "rgb" in self.save_options:
-                    if self._single_agent_mode:
-                        rgb = obs[f"{camera_source}_rgb"]
-                    else:
-                        rgb = obs[f"{curr_agent}_{camera_source}_rgb"]
-                    np.save(
-                        f"{self.trajectory_save_paths[curr_agent]}/rgb/{self._trajectory_idx}.npy",
-                        rgb,
-                    )
-                    imageio.imwrite(
-                        f"{self.trajectory_save_paths[curr_agent]}/rgb/{self._trajectory_idx}.jpg",
-                        rgb,
-                    )
-                if "depth" in self.save_options:
-                    if self._single_agent_mode:
-                        depth = obs[f"{camera_source}_depth"]
-                    else:
-                        depth = obs[f"{curr_agent}_{camera_source}_depth"]
-                    depth_image = depth_to_rgb(depth)
-                    cv2.imwrite(
-                        f"{self.trajectory_save_paths[curr_agent]}/depth/{self._trajectory_idx}.png",
-                        depth_image,
-                    )
-                    np.save(
-                        f"{self.trajectory_save_paths[curr_agent]}/depth/{self._trajectory_idx}.npy",
-                        depth,
-                    )
-                if "panoptic" in self.save_options:
-                    if self._single_agent_mode:
-                        panoptic = obs[f"{camera_source}_panoptic"]
-                    else:
-                        panoptic = obs[f"{curr_agent}_{camera_source}_panoptic"]
-                    cv2.imwrite(
-                        f"{self.trajectory_save_paths[curr_agent]}/panoptic/{self._trajectory_idx}.png",
-                        panoptic,
-                    )
-                    np.save(
-                        f"{self.trajectory_save_paths[curr_agent]}/panoptic/{self._trajectory_idx}.npy",
-                        panoptic,
-                    )
-                # NOTE: this assumes poses for head_rgb and head_depth are the exact
-                # same
                 if self._single_agent_mode:
-                    pose = np.linalg.inv(
-                        self.sim.agents[0]
-                        ._sensors[f"{camera_source}_rgb"]
-                        .render_camera.camera_matrix
-                    )
+                    sensor_prefix = camera_source
                 else:
-                    pose = np.linalg.inv(
-                        self.sim.agents[0]
-                        ._sensors[f"{curr_agent}_{camera_source}_rgb"]
-                        .render_camera.camera_matrix
-                    )
-                np.save(
-                    f"{self.trajectory_save_paths[curr_agent]}/pose/{self._trajectory_idx}.npy",
-                    pose,
+                    sensor_prefix = f"{curr_agent}_{camera_source}"
+                # observations are copied as the simulator may reuse them
+                images = {
+                    modality: np.array(obs[f"{sensor_prefix}_{modality}"])
+                    for modality in ["rgb", "depth", "panoptic"]
+                    if modality in self.save_options
+                }
+                # NOTE: this assumes poses for head_rgb and head_depth are the exact
+                # same
+                pose = np.linalg.inv(
+                    self.sim.agents[0]
+                    ._sensors[f"{sensor_prefix}_rgb"]
+                    .render_camera.camera_matrix
                 )
                 # NOTE: another way of accessing camera pose
                 # fixed_pose = get_camera_transform(
@@ -665,6 +727,18 @@ class EnvironmentInterface:
                 # )
                 # inv_T = self.sim._default_agent.scene_node.transformation
                 # fixed_pose = inv_T @ fixed_pose
+                if self.trajectory_shard_writers is not None:
+                    self.trajectory_shard_writers[curr_agent].add_frame(
+                        self._trajectory_idx, pose, **images
+                    )
+                else:
+                    self.trajectory_writer.submit(
+                        write_trajectory_frame,
+                        self.trajectory_save_paths[curr_agent],
+                        self._trajectory_idx,
+                        pose,
+                        **images,
+                    )
             self._trajectory_idx += 1
 
     @property
@@ -1,27 +1,82 @@
-import argparse
-from habitat_llm.world_model import DynamicWorldGraph, WorldGraph
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
 import datetime
-import os
 import json
+import os
 import re
+from typing import Any, Dict, List, Optional
+
+# Keys of the logged graphs in each step record
+GRAPH_KEYS = ["WorldGraph", "RobotWorldGraph", "HumanWorldGraph"]
+
+# Start of the JSON line of a step record, as written by LogSystem. Records of
+# logs written before delta encoding have no Keyframe key.
+_RECORD_HEADER = re.compile(r'\{"Step": (\d+)(?:, "Keyframe": (true|false))?')
 
-class LogSystem():
-    def __init__(self):
+
+class LogSystem:
+    """
+    Logs the world graphs of every step of an episode. Each step appends one
+    JSON record to a JSON Lines file and the graph descriptions to a text file,
+    so that the cost of logging a step does not grow with the episode.
+
+    Every keyframe_interval steps, a keyframe record holds the edges of each
+    graph. The records in between only hold the changes since the previous
+    step, see iter_world_graph_log and replay_world_graph_log to read them back.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "outputs/world_graphs",
+        run_name: Optional[str] = None,
+        fsync_interval: int = 50,
+        keyframe_interval: int = 50,
+    ):
+        """
+        :param output_dir: Directory of the log files, created if needed
+        :param run_name: Name of the log files, the current time by default. Logging
+            to existing files continues from their last step.
+        :param fsync_interval: Number of steps between flushes of the files to disk,
+            0 to leave it to the OS. Records are written out after every step.
+        :param keyframe_interval: Number of steps between keyframe records, 1 to
+            log the whole graphs every step
+        """
+        if fsync_interval < 0:
+            raise ValueError(
+                f"fsync_interval should be non-negative, received: {fsync_interval}"
+            )
+        if keyframe_interval < 1:
+            raise ValueError(
+                f"keyframe_interval should be positive, received: {keyframe_interval}"
+            )
         print("Graph logger is initialized!")
-        self.output_dir = "/home/proactiveproject/ProactiveProject/WorldGraphs"
+        self.output_dir = output_dir
+        self.fsync_interval = fsync_interval
+        self.keyframe_interval = keyframe_interval
+        # Edges logged at the previous step, None until the first keyframe
+        self._last_edge_lists: Optional[Dict[str, Dict[str, List]]] = None
+        self._num_deltas = 0
         os.makedirs(self.output_dir, exist_ok=True)
-        
-        # Generate the timestamp for the filename
-        current_time = datetime.datetime.now()
-        time_string = current_time.strftime("%d-%m-%y-%H:%M")  # Format: DD-MM-YY-HH:MM
-        self.output_txt_file = os.path.join(self.output_dir, f"{time_string}.txt")
-        self.output_json_file = os.path.join(self.output_dir, f"{time_string}.json")
-        self.num_of_step = self._get_last_step() + 1
 
+        if run_name is None:
+            # Generate the timestamp for the filename
+            current_time = datetime.datetime.now()
+            run_name = current_time.strftime("%d-%m-%y-%H:%M")  # Format: DD-MM-YY-HH:MM
+        self.output_txt_file = os.path.join(self.output_dir, f"{run_name}.txt")
+        self.output_json_file = os.path.join(self.output_dir, f"{run_name}.jsonl")
+        self.num_of_step = self._get_last_step() + 1
+        self._drop_partial_record()
+        # Kept open across steps, closed by close
+        self._json_file = open(self.output_json_file, "a")  # noqa: SIM115
+        self._txt_file = open(self.output_txt_file, "a")  # noqa: SIM115
 
-    def dot_to_json(self, dot_str):
+    @staticmethod
+    def dot_to_json(dot_str):
         """
-        Converts a DOT graph representation into a structured JSON format.
+        Converts a DOT graph representation into a structured JSON format, the
+        same as Graph.to_edge_lists for graphs whose names have no quotes.
 
         Parameters:
             dot_str (str): The DOT format string from the world graph.
@@ -44,20 +99,40 @@ class LogSystem():
 
     def _get_last_step(self):
         """Retrieve the last step number from the JSON log if it exists."""
+        last_step = 0
         if os.path.exists(self.output_json_file):
-            try:
-                with open(self.output_json_file, "r") as file:
-                    data = json.load(file)
-                    return max([entry["Step"] for entry in data], default=0)
-            except (json.JSONDecodeError, KeyError, FileNotFoundError):
-                return 0  # If file is corrupt or empty, restart from step 1
-        return 0
-    
+            for line in _iter_log_lines(self.output_json_file):
+                # Lines of a corrupt log are not reused
+                match = _RECORD_HEADER.match(line)
+                if match is not None:
+                    last_step = max(last_step, int(match[1]))
+        return last_step
+
+    def _drop_partial_record(self, block_size: int = 4096):
+        """
+        Truncates a last record cut short, e.g. by a crash during the write, so
+        that new records start on their own line
+        """
+        if not os.path.exists(self.output_json_file):
+            return
+        with open(self.output_json_file, "rb+") as file:
+            end = file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(position - block_size, 0)
+                file.seek(start)
+                newline = file.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                file.truncate(position)
 
     def log_world_graphs(self, world_graph, robot_world_graph, human_world_graph):
         """
-        Logs the descriptions and DOT representations of the given world graphs
-        into a text file.
+        Logs the descriptions of the given world graphs into the text file, and
+        their edges into the JSON Lines file.
 
         Parameters:
             world_graph (WorldGraph): The overall world graph.
@@ -67,87 +142,195 @@ class LogSystem():
 
         try:
             world_descr = world_graph.get_world_descr()
-            world_dot = world_graph.to_dot()
+            world_json = world_graph.to_edge_lists()
         except Exception as e:
             world_descr = f"Error retrieving world description: {str(e)}"
-            world_dot = f"Error converting world graph to DOT: {str(e)}"
+            world_json = {}
 
         try:
             robot_world_descr = robot_world_graph.get_world_descr()
-            robot_world_dot = robot_world_graph.to_dot()
+            robot_world_json = robot_world_graph.to_edge_lists()
         except Exception as e:
             robot_world_descr = f"Error retrieving robot world description: {str(e)}"
-            robot_world_dot = f"Error converting robot world graph to DOT: {str(e)}"
+            robot_world_json = {}
 
         try:
             human_world_descr = human_world_graph.get_world_descr(is_human_wg=True)
-            human_world_dot = human_world_graph.to_dot()
+            human_world_json = human_world_graph.to_edge_lists()
         except Exception as e:
             human_world_descr = f"Error retrieving human world description: {str(e)}"
-            human_world_dot = f"Error converting human world graph to DOT: {str(e)}"
-        
+            human_world_json = {}
+
         # Track number of steps
         step_header = f"<<<<<<<<<<<Step #{self.num_of_step}>>>>>>>>>>>>>>>>>>>\n"
         self.num_of_step += 1
 
+        # Append one line to the JSON Lines log, with the whole graphs for
+        # keyframes and only their changes otherwise
+        edge_lists = dict(
+            zip(GRAPH_KEYS, [world_json, robot_world_json, human_world_json])
+        )
+        is_keyframe = (
+            self._last_edge_lists is None
+            or self._num_deltas + 1 >= self.keyframe_interval
+        )
+        json_data = {"Step": self.num_of_step - 1, "Keyframe": is_keyframe}
+        if is_keyframe:
+            json_data.update(edge_lists)
+            self._num_deltas = 0
+        else:
+            for key in GRAPH_KEYS:
+                json_data[key] = get_edge_lists_delta(
+                    self._last_edge_lists[key], edge_lists[key]
+                )
+            self._num_deltas += 1
+        self._last_edge_lists = edge_lists
+        self._json_file.write(json.dumps(json_data) + "\n")
 
-        # Convert DOT to JSON
-        world_json = self.dot_to_json(world_dot)
-        robot_world_json = self.dot_to_json(robot_world_dot)
-        human_world_json = self.dot_to_json(human_world_dot)
-
-        # # Write to text file
-        # with open(output_txt_file, "w") as f:
-        #     f.write(step_header)
-        #     f.write("=== World Graph ===\n")
-        #     f.write("Description:\n")
-        #     f.write(world_descr + "\n\n")
-        #     f.write("DOT Representation:\n")
-        #     f.write(world_dot + "\n\n")
-
-        #     f.write("=== Robot World Graph ===\n")
-        #     f.write("Description:\n")
-        #     f.write(robot_world_descr + "\n\n")
-        #     f.write("DOT Representation:\n")
-        #     f.write(robot_world_dot + "\n\n")
-
-        #     f.write("=== Human World Graph ===\n")
-        #     f.write("Description:\n")
-        #     f.write(human_world_descr + "\n\n")
-        #     f.write("DOT Representation:\n")
-        #     f.write(human_world_dot + "\n\n")
-
-        # Write to JSON file
-        json_data = {
-            "Step": self.num_of_step - 1,
-            "WorldGraph": world_json,
-            "RobotWorldGraph": robot_world_json,
-            "HumanWorldGraph": human_world_json,
-        }
+        # Append descriptions to the text log
+        self._txt_file.write(step_header)
+        self._txt_file.write("=== World Graph Description ===\n")
+        self._txt_file.write(world_descr + "\n\n")
+        self._txt_file.write("=== Robot World Graph Description ===\n")
+        self._txt_file.write(robot_world_descr + "\n\n")
+        self._txt_file.write("=== Human World Graph Description ===\n")
+        self._txt_file.write(human_world_descr + "\n\n")
+        self._txt_file.write("=" * 50 + "\n\n")
 
+        self.flush(
+            sync=self.fsync_interval > 0
+            and (self.num_of_step - 1) % self.fsync_interval == 0
+        )
 
-        if os.path.exists(self.output_json_file):
-            try:
-                with open(self.output_json_file, "r") as file:
-                    existing_data = json.load(file)
-            except (json.JSONDecodeError, FileNotFoundError):
-                existing_data = []
-        else:
-            existing_data = []
-        existing_data.append(json_data)
+    def flush(self, sync: bool = True):
+        """
+        Writes the logged steps out to the files, and to disk if sync is True
+        """
+        for file in [self._json_file, self._txt_file]:
+            if file.closed:
+                continue
+            file.flush()
+            if sync:
+                os.fsync(file.fileno())
 
-        with open(self.output_json_file, "w") as json_file:
-            json.dump(existing_data, json_file, indent=4)
+    def close(self):
+        """
+        Flushes the logged steps to disk and closes the files
+        """
+        self.flush()
+        self._json_file.close()
+        self._txt_file.close()
 
-        # Append descriptions to the text log
-        with open(self.output_txt_file, "a") as txt_file:
-            txt_file.write(step_header)
-            txt_file.write("=== World Graph Description ===\n")
-            txt_file.write(world_descr + "\n\n")
-            txt_file.write("=== Robot World Graph Description ===\n")
-            txt_file.write(robot_world_descr + "\n\n")
-            txt_file.write("=== Human World Graph Description ===\n")
-            txt_file.write(human_world_descr + "\n\n")
-            txt_file.write("=" * 50 + "\n\n")
-        
-        # print(f"Step #{self.num_of_step} recorded in {self.output_json_file} and {self.output_txt_file}")
\ No newline at end of file
+    def __del__(self):
+        # The files are only missing if __init__ failed
+        if hasattr(self, "_txt_file"):
+            self.close()
+
+
+def get_edge_lists_delta(
+    previous: Dict[str, List], current: Dict[str, List]
+) -> Dict[str, Any]:
+    """
+    Returns the changes from the previous to the current edge lists of a graph,
+    see Graph.to_edge_lists: the edge lists of the nodes that were added or
+    whose edges changed, and the nodes that were removed
+    """
+    return {
+        "changed": {
+            node: edges
+            for node, edges in current.items()
+            if previous.get(node) != edges
+        },
+        "removed": [node for node in previous if node not in current],
+    }
+
+
+def _iter_log_lines(path: str):
+    """
+    Yields the lines of a JSON Lines log. A last line cut short, e.g. by a
+    crash during the write, is skipped.
+    """
+    with open(path, "r") as file:
+        for line in file:
+            # Only the last line can miss its newline
+            if not line.endswith("\n"):
+                try:
+                    json.loads(line)
+                except json.JSONDecodeError:
+                    return
+            yield line
+
+
+def _apply_record(
+    edge_lists: Dict[str, Dict[str, List]], record: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Updates edge_lists, the edges of each logged graph, with a keyframe or delta
+    record, and returns the step record with the whole graphs
+    """
+    if record.get("Keyframe", True):
+        for key in GRAPH_KEYS:
+            edge_lists[key] = dict(record[key])
+    else:
+        if not edge_lists:
+            raise ValueError(f"Step {record['Step']} has no keyframe before it")
+        for key in GRAPH_KEYS:
+            graph_edge_lists = edge_lists[key]
+            for node in record[key]["removed"]:
+                del graph_edge_lists[node]
+            graph_edge_lists.update(record[key]["changed"])
+    return {
+        "Step": record["Step"],
+        **{key: dict(edge_lists[key]) for key in GRAPH_KEYS},
+    }
+
+
+def iter_world_graph_log(path: str):
+    """
+    Yields the step records of a log written by LogSystem in order, with the
+    whole graphs of each step. A last line cut short, e.g. by a crash during
+    the write, is skipped.
+    """
+    edge_lists: Dict[str, Dict[str, List]] = {}
+    for line in _iter_log_lines(path):
+        yield _apply_record(edge_lists, json.loads(line))
+
+
+def replay_world_graph_log(path: str, step: int) -> Dict[str, Any]:
+    """
+    Returns the step record of a log written by LogSystem at the given step,
+    with the whole graphs. Only the records from the last keyframe before the
+    step on are parsed.
+    """
+    if path.endswith(".json"):
+        records = [
+            record for record in load_world_graph_log(path) if record["Step"] == step
+        ]
+    else:
+        lines: List[str] = []
+        for line in _iter_log_lines(path):
+            match = _RECORD_HEADER.match(line)
+            if match is None:
+                raise ValueError(f"Unexpected record in {path}: {line[:80]}")
+            if int(match[1]) > step:
+                break
+            if match[2] != "false":
+                lines = []
+            lines.append(line)
+        edge_lists: Dict[str, Dict[str, List]] = {}
+        records = [_apply_record(edge_lists, json.loads(line)) for line in lines]
+        records = records[-1:] if records and records[-1]["Step"] == step else []
+    if not records:
+        raise ValueError(f"Step {step} is not in {path}")
+    return records[-1]
+
+
+def load_world_graph_log(path: str) -> List[Dict[str, Any]]:
+    """
+    Returns the step records of a log written by LogSystem, the same list the
+    JSON log of previous versions held. Reads both formats.
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as file:
+            return json.load(file)
+    return list(iter_world_graph_log(path))
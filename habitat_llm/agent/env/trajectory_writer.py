@@ -0,0 +1,111 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import atexit
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+
+class TrajectoryWriter:
+    """
+    Runs the writes of trajectory frames on background threads, so that encoding
+    and saving them does not stall stepping the simulation. At most
+    max_queued_frames writes wait in the queue; submitting more blocks until
+    one of them is done. Pending writes are finished by flush, close, and when
+    the interpreter exits, including after an uncaught exception.
+    """
+
+    def __init__(self, num_workers: int = 2, max_queued_frames: int = 16):
+        """
+        :param num_workers: Number of writer threads, 0 to write on the calling
+            thread as frames are submitted
+        :param max_queued_frames: Number of writes that can wait in the queue
+        """
+        if num_workers < 0:
+            raise ValueError(
+                f"num_workers should be non-negative, received: {num_workers}"
+            )
+        if max_queued_frames < 1:
+            raise ValueError(
+                f"max_queued_frames should be positive, received: {max_queued_frames}"
+            )
+        self.num_workers = num_workers
+        self.max_queued_frames = max_queued_frames
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(max_queued_frames)
+        # Started on the first submitted write
+        self._workers: List[threading.Thread] = []
+        self._errors: List[BaseException] = []
+        self._errors_lock = threading.Lock()
+        self.num_written = 0
+
+    def _start_workers(self):
+        # Pending writes are finished before daemon threads are stopped at exit
+        atexit.register(self.close)
+        for _ in range(self.num_workers):
+            worker = threading.Thread(target=self._run_worker, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _run_worker(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._write(*task)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, write_fn: Callable, args: tuple, kwargs: dict):
+        try:
+            write_fn(*args, **kwargs)
+        except BaseException as e:
+            # Raised again on the calling thread by the next flush
+            with self._errors_lock:
+                self._errors.append(e)
+        else:
+            with self._errors_lock:
+                self.num_written += 1
+
+    def submit(self, write_fn: Callable, *args: Any, **kwargs: Any):
+        """
+        Queues write_fn(*args, **kwargs), blocking while the queue is full. The
+        arguments should not be modified afterwards, e.g. arrays of observations
+        reused by the simulator should be copied.
+        """
+        if self.num_workers == 0:
+            self._write(write_fn, args, kwargs)
+            self._raise_errors()
+            return
+        if not self._workers:
+            self._start_workers()
+        self._queue.put((write_fn, args, kwargs))
+
+    def flush(self):
+        """
+        Waits for all submitted writes to be done, and raises the first error
+        of any of them
+        """
+        if self._workers:
+            self._queue.join()
+        self._raise_errors()
+
+    def _raise_errors(self):
+        with self._errors_lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """
+        Finishes all submitted writes and stops the writer threads
+        """
+        workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+        atexit.unregister(self.close)
+        self._raise_errors()
@@ -16,6 +16,10 @@ from natsort import natsorted
 from scipy.spatial.transform import Rotation as R
 
 from habitat_llm.concept_graphs import datautils
+from habitat_llm.concept_graphs.trajectory_shards import (
+    TrajectoryShardReader,
+    has_trajectory_shards,
+)
 from habitat_llm.concept_graphs.typecasting_utils import to_scalar
 
 
@@ -243,24 +247,35 @@ class GradSLAMDataset(torch.utils.data.Dataset):
         """
         raise NotImplementedError
 
+    def read_color(self, color_path) -> np.ndarray:
+        """
+        Read a color image given its entry of color_paths
+        """
+        if ".npy" in color_path:
+            return np.load(color_path)
+        return np.asarray(imageio.imread(color_path), dtype=float)
+
+    def read_depth(self, depth_path) -> np.ndarray:
+        """
+        Read a depth image given its entry of depth_paths
+        """
+        if ".png" in depth_path:
+            # depth_data = cv2.imread(depth_path, cv2.IMREAD_UNCHANGED)
+            return np.asarray(imageio.imread(depth_path), dtype=np.int64)
+        elif ".npy" in depth_path:
+            return np.load(depth_path)
+        else:
+            raise NotImplementedError
+
     def __getitem__(self, index):
         color_path = self.color_paths[index]
         depth_path = self.depth_paths[index]
         print(color_path)
         print(depth_path)
-        if ".npy" in color_path:
-            color = np.load(color_path)
-        else:
-            color = np.asarray(imageio.imread(color_path), dtype=float)
+        color = self.read_color(color_path)
         color = self._preprocess_color(color)
         color = torch.from_numpy(color)
-        if ".png" in depth_path:
-            # depth_data = cv2.imread(depth_path, cv2.IMREAD_UNCHANGED)
-            depth = np.asarray(imageio.imread(depth_path), dtype=np.int64)
-        elif ".npy" in depth_path:
-            depth = np.load(depth_path)
-        else:
-            raise NotImplementedError
+        depth = self.read_depth(depth_path)
 
         K = as_intrinsics_matrix([self.fx, self.fy, self.cx, self.cy])
         K = torch.from_numpy(K)
@@ -345,6 +360,11 @@ class HabitatDataset(GradSLAMDataset):
         self._use_rgb_color_paths: bool = False
         if "detector" in kwargs and kwargs["detector"] == "yolo":
             self._use_rgb_color_paths = True
+        # Trajectories saved as shards rather than one file per frame, see
+        # trajectory_shards.py
+        self._shard_reader: Optional[TrajectoryShardReader] = None
+        if has_trajectory_shards(self.input_folder):
+            self._shard_reader = TrajectoryShardReader(self.input_folder)
         super().__init__(
             config_dict,
             stride=stride,
@@ -373,6 +393,10 @@ class HabitatDataset(GradSLAMDataset):
         self.cy = camera_params[0, 3]
 
     def get_filepaths(self):
+        if self._shard_reader is not None:
+            # frames are addressed by their position in the shards
+            frames = list(range(len(self._shard_reader)))
+            return frames, list(frames), None
         # apparently this gives a naturally sorted list
         if not self._use_rgb_color_paths:
             rgb_paths = natsorted(glob.glob(os.path.join(self.rgb_subdir, "*.npy")))
@@ -382,7 +406,22 @@ class HabitatDataset(GradSLAMDataset):
         depth_paths = natsorted(glob.glob(os.path.join(self.depth_subdir, "*.npy")))
         return rgb_paths, depth_paths, None
 
+    def read_color(self, color_path) -> np.ndarray:
+        if self._shard_reader is not None:
+            return self._shard_reader.get("rgb", color_path)
+        return super().read_color(color_path)
+
+    def read_depth(self, depth_path) -> np.ndarray:
+        if self._shard_reader is not None:
+            return self._shard_reader.get("depth", depth_path)
+        return super().read_depth(depth_path)
+
     def load_poses(self):
+        if self._shard_reader is not None:
+            return [
+                torch.from_numpy(self.opengl_to_opencv(pose))
+                for pose in self._shard_reader.get_all("pose")
+            ]
         pose_paths = natsorted(glob.glob(os.path.join(self.pose_subdir, "*.npy")))
         poses = []
         for pp in pose_paths:
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+"""
+Episode-level container for agent trajectories, as an alternative to one file
+per sensor per frame. The frames of an agent are stored in npz shards of
+consecutive frames, in a shards/ directory next to intrinsics.npy:
+
+    agent_0/
+        intrinsics.npy
+        shards/
+            frames_000000-000099.npz
+            frames_000100-000149.npz
+
+Each shard holds the arrays "trajectory_idx" (N,) and "pose" (N, 4, 4), and
+"rgb", "depth" and "panoptic" (N, H, W, C) for the saved modalities. Only numpy
+is needed to write and read them.
+"""
+
+import atexit
+import glob
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SHARD_SUBDIR = "shards"
+
+_SHARD_NAME = re.compile(r"frames_(\d+)-(\d+)\.npz$")
+
+
+def has_trajectory_shards(agent_dir: str) -> bool:
+    """
+    Returns whether the trajectory of an agent was saved as shards
+    """
+    return bool(glob.glob(os.path.join(agent_dir, SHARD_SUBDIR, "frames_*.npz")))
+
+
+def write_trajectory_shard(path: str, arrays: Dict[str, np.ndarray], compress: bool):
+    """
+    Writes the arrays of a shard. The shard is written under a temporary name
+    and renamed, so that readers never see a partial shard.
+    """
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.tmp.npz")
+    if compress:
+        np.savez_compressed(temp_path, **arrays)
+    else:
+        np.savez(temp_path, **arrays)
+    os.replace(temp_path, path)
+
+
+class TrajectoryShardWriter:
+    """
+    Collects the frames of an agent's trajectory and writes them as shards of
+    frames_per_shard frames. The frames collected since the last shard are
+    written by close, or when the interpreter exits if close is not called.
+    """
+
+    def __init__(
+        self,
+        agent_dir: str,
+        frames_per_shard: int = 100,
+        compress: bool = True,
+        submit: Optional[Callable] = None,
+    ):
+        """
+        :param agent_dir: Trajectory directory of the agent
+        :param frames_per_shard: Number of frames in each shard
+        :param compress: Whether the shards are compressed
+        :param submit: Called as submit(write_trajectory_shard, *args) to write a
+            shard, e.g. TrajectoryWriter.submit to write it in the background. The
+            shard is written right away by default.
+        """
+        if frames_per_shard < 1:
+            raise ValueError(
+                f"frames_per_shard should be positive, received: {frames_per_shard}"
+            )
+        self.shard_dir = os.path.join(agent_dir, SHARD_SUBDIR)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.frames_per_shard = frames_per_shard
+        self.compress = compress
+        self._submit = submit
+        self._frames: List[Dict[str, np.ndarray]] = []
+
+    def add_frame(
+        self,
+        trajectory_idx: int,
+        pose: np.ndarray,
+        rgb: Optional[np.ndarray] = None,
+        depth: Optional[np.ndarray] = None,
+        panoptic: Optional[np.ndarray] = None,
+    ):
+        """
+        Adds the images and camera pose of a trajectory step. The arrays are kept
+        until the shard is written, and should not be modified afterwards.
+        """
+        frame = {"trajectory_idx": np.asarray(trajectory_idx), "pose": pose}
+        for modality, image in [("rgb", rgb), ("depth", depth), ("panoptic", panoptic)]:
+            if image is not None:
+                frame[modality] = image
+        if self._frames and frame.keys() != self._frames[0].keys():
+            raise ValueError(
+                f"Frames of a shard should have the same modalities, received: "
+                f"{list(frame)} after {list(self._frames[0])}"
+            )
+        if not self._frames:
+            atexit.register(self._close_at_exit)
+        self._frames.append(frame)
+        if len(self._frames) >= self.frames_per_shard:
+            self._write_shard()
+
+    def _write_shard(self):
+        if not self._frames:
+            return
+        frames, self._frames = self._frames, []
+        atexit.unregister(self._close_at_exit)
+        arrays = {key: np.stack([frame[key] for frame in frames]) for key in frames[0]}
+        indices = arrays["trajectory_idx"]
+        path = os.path.join(
+            self.shard_dir, f"frames_{indices[0]:06d}-{indices[-1]:06d}.npz"
+        )
+        if self._submit is None:
+            write_trajectory_shard(path, arrays, self.compress)
+        else:
+            self._submit(write_trajectory_shard, path, arrays, self.compress)
+
+    def close(self):
+        """
+        Writes the frames collected since the last shard
+        """
+        self._write_shard()
+
+    def _close_at_exit(self):
+        # The background writer may already be stopped at exit
+        self._submit = None
+        self.close()
+
+
+class TrajectoryShardReader:
+    """
+    Reads the frames of an agent's trajectory saved by TrajectoryShardWriter.
+    Frames are addressed by their position in the trajectory, 0 to len - 1. The
+    arrays of the last shard read are kept, so reading frames in order
+    decompresses each shard once.
+    """
+
+    def __init__(self, agent_dir: str):
+        """
+        :param agent_dir: Trajectory directory of the agent
+        """
+        shards: List[Tuple[int, int, str]] = []
+        for path in glob.glob(os.path.join(agent_dir, SHARD_SUBDIR, "frames_*.npz")):
+            match = _SHARD_NAME.search(path)
+            if match is not None:
+                shards.append((int(match[1]), int(match[2]), path))
+        if not shards:
+            raise ValueError(f"No trajectory shards in {agent_dir}")
+        shards.sort()
+        self.shard_paths = [path for _, _, path in shards]
+        self._shard_starts = np.cumsum(
+            [0] + [last - first + 1 for first, last, _ in shards]
+        )
+        self._cached_shard: Optional[int] = None
+        self._cached_arrays: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return int(self._shard_starts[-1])
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """
+        Returns the shard holding a frame and the frame's position in it
+        """
+        if not 0 <= position < len(self):
+            raise ValueError(f"Frame {position} is out of range for {len(self)} frames")
+        shard = int(np.searchsorted(self._shard_starts, position, side="right")) - 1
+        return shard, position - int(self._shard_starts[shard])
+
+    def _get_shard_array(self, shard: int, key: str) -> np.ndarray:
+        if shard != self._cached_shard:
+            self._cached_shard = shard
+            self._cached_arrays = {}
+        if key not in self._cached_arrays:
+            with np.load(self.shard_paths[shard]) as arrays:
+                if key not in arrays:
+                    raise ValueError(
+                        f"{key} was not saved in {self.shard_paths[shard]}"
+                    )
+                self._cached_arrays[key] = arrays[key]
+        return self._cached_arrays[key]
+
+    def get(self, key: str, position: int) -> np.ndarray:
+        """
+        Returns an array of a frame: "rgb", "depth", "panoptic", "pose" or
+        "trajectory_idx"
+        """
+        shard, offset = self._locate(position)
+        return self._get_shard_array(shard, key)[offset]
+
+    def get_frame(self, position: int) -> Dict[str, np.ndarray]:
+        """
+        Returns all the arrays of a frame
+        """
+        shard, _ = self._locate(position)
+        with np.load(self.shard_paths[shard]) as arrays:
+            keys = list(arrays.keys())
+        return {key: self.get(key, position) for key in keys}
+
+    def get_all(self, key: str) -> np.ndarray:
+        """
+        Returns an array of every frame, stacked, e.g. all the camera poses
+        """
+        arrays = []
+        for path in self.shard_paths:
+            with np.load(path) as shard_arrays:
+                arrays.append(shard_arrays[key])
+        return np.concatenate(arrays)
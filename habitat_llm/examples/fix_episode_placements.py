@@ -768,6 +768,7 @@ def fix_episode_placements(config: omegaconf.DictConfig) -> None:
         cprint("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!", color="green")
         # initialize the next episode
         env_interface.reset_environment()
+    env_interface.close()
 
     # save the validation results in a csv file
     export_results_csv(
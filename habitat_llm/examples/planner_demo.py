@@ -388,6 +388,7 @@ def run_planner(config, dataset: CollaborationDatasetV0 = None, conn=None):
         else:
             conn.send(stats_episodes)
 
+    env_interface.close()
     env_interface.env.close()
     del env_interface
 
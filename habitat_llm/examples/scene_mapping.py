@@ -165,6 +165,7 @@ def run_planner():
         if eval_runner.frames:
             eval_runner._make_video(scene_id)
         processed_scenes.add(str(scene_id))
+    env_interface.close()
     env_interface.sim.close()
 
 
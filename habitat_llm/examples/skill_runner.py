@@ -209,6 +209,7 @@ def run_skills(config: omegaconf.DictConfig) -> None:
             for ix, t in enumerate(command_history):
                 print(f" [{ix}]: '{t[0]}' -> '{t[1]}'")
             print("==========================")
+            env_interface.close()
             exit()
         elif user_input == help_skill:
             cprint(help_text, "green")
@@ -220,6 +220,7 @@ def run_verifier(config, dataset: CollaborationDatasetV0 = None, conn=None):
     if conn is not None:
         conn.send([0])
 
+    env_interface.close()
     env_interface.env.close()
     del env_interface
 
@@ -43,12 +43,7 @@ def get_world_descr(
     :return: A string description of the environment, including rooms and their furniture, objects held by the agent, and locations of objects in the house.
     """
     ## house description -- rooms and their furniture list
-    furn_room = world_graph.group_furniture_by_room()
-    house_info = ""
-    for k, v in furn_room.items():
-        furn_names = [furn.name for furn in v]
-        all_furn = ", ".join(furn_names)
-        house_info += k + ": " + all_furn + "\n"
+    house_info = world_graph.get_furniture_descr()
 
     all_furniture = world_graph.get_all_furnitures()
     furn_with_faucets = [
@@ -101,52 +96,60 @@ def get_objects_descr(
     all_objs = world_graph.get_all_objects()
     if not all_objs:
         return "No objects found yet"
-    else:
-        obj_strings = []
-        for obj in all_objs:
-            obj_info = ""
-            rooms_path = world_graph.find_path(root_node=obj, end_node_types=[Room])
-            if rooms_path is None:
+
+    def describe_object(obj):
+        obj_info = ""
+        rooms_path = world_graph.find_path(root_node=obj, end_node_types=[Room])
+        if rooms_path is None:
+            room_name = "an unknown room"
+        else:
+            rooms = [x for x in rooms_path if isinstance(x, Room)]
+            if len(rooms) == 0:
                 room_name = "an unknown room"
             else:
-                rooms = [x for x in rooms_path if isinstance(x, Room)]
-                if len(rooms) == 0:
-                    room_name = "an unknown room"
-                else:
-                    if len(rooms) > 1:
-                        raise ValueError(
-                            f"Multiple rooms detected for object {obj.name}"
-                        )
-                    room_name = rooms[0].name
-            if not centralized and (
-                world_graph.is_object_with_robot(obj)
-                and int(agent_uid) == 0
-                or (world_graph.is_object_with_human(obj) and int(agent_uid) == 1)
-            ):
-                obj_info += obj.name + ": held by the agent"
-            elif not centralized and (
-                world_graph.is_object_with_human(obj)
-                and int(agent_uid) == 0
-                or (world_graph.is_object_with_robot(obj) and int(agent_uid) == 1)
-            ):
-                obj_info += obj.name + ": held by the other agent"
-            elif centralized and world_graph.is_object_with_robot(obj):
-                obj_info += obj.name + ": held by Agent 0 (Robot)"
-            elif centralized and world_graph.is_object_with_human(obj):
-                obj_info += obj.name + ": held by Agent 1 (Human)"
+                if len(rooms) > 1:
+                    raise ValueError(f"Multiple rooms detected for object {obj.name}")
+                room_name = rooms[0].name
+        if not centralized and (
+            world_graph.is_object_with_robot(obj)
+            and int(agent_uid) == 0
+            or (world_graph.is_object_with_human(obj) and int(agent_uid) == 1)
+        ):
+            obj_info += obj.name + ": held by the agent"
+        elif not centralized and (
+            world_graph.is_object_with_human(obj)
+            and int(agent_uid) == 0
+            or (world_graph.is_object_with_robot(obj) and int(agent_uid) == 1)
+        ):
+            obj_info += obj.name + ": held by the other agent"
+        elif centralized and world_graph.is_object_with_robot(obj):
+            obj_info += obj.name + ": held by Agent 0 (Robot)"
+        elif centralized and world_graph.is_object_with_human(obj):
+            obj_info += obj.name + ": held by Agent 1 (Human)"
+        else:
+            furn_node = world_graph.find_furniture_for_object(obj)
+            furn_name = "unknown" if furn_node is None else furn_node.name
+            if include_room_name:
+                obj_info += obj.name + ": " + furn_name + " in " + room_name
             else:
-                furn_node = world_graph.find_furniture_for_object(obj)
-                furn_name = "unknown" if furn_node is None else furn_node.name
-                if include_room_name:
-                    obj_info += obj.name + ": " + furn_name + " in " + room_name
-                else:
-                    obj_info += obj.name + ": " + furn_name
-            if (add_state_info) and ("states" in obj.properties):
-                state_string = state_dict_to_string(obj.properties["states"])
-                if len(state_string) > 0:
-                    obj_info += ". States: " + state_string
-            obj_strings.append(obj_info)
-        return "\n".join(obj_strings)
+                obj_info += obj.name + ": " + furn_name
+        return obj_info
+
+    # Locations only change with the graph's edges and are cached per room by
+    # the world graph; states are edited in place so they are read every time
+    obj_locations = world_graph.describe_nodes(
+        ("objects_descr", str(agent_uid), include_room_name, centralized),
+        all_objs,
+        describe_object,
+    )
+    obj_strings = []
+    for obj, obj_info in zip(all_objs, obj_locations):
+        if (add_state_info) and ("states" in obj.properties):
+            state_string = state_dict_to_string(obj.properties["states"])
+            if len(state_string) > 0:
+                obj_info += ". States: " + state_string
+        obj_strings.append(obj_info)
+    return "\n".join(obj_strings)
 
 
 def get_rearranged_objects_descr(
@@ -2,6 +2,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree
 
+from habitat_llm.perception.keyframe_policy import KeyframePolicy
 from habitat_llm.perception.perception import Perception
 from habitat_llm.perception.perception_obs import PerceptionObs
-from habitat_llm.perception.perception_sim import PerceptionSim
+from habitat_llm.perception.perception_sim import PerceptionFrame, PerceptionSim
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+"""This module contains KeyframePolicy, which decides which frames of the agents
+update the non-privileged world-graph with their object detections."""
+
+
+from typing import Dict, Set
+
+import numpy as np
+
+
+class KeyframePolicy:
+    """
+    Gates the object detections of each agent. A frame is a keyframe when the
+    camera moved or turned enough since the agent's last keyframe, when the
+    set of panoptic ids in view changed, or after max_skipped_steps frames in a
+    row were skipped. Only keyframes are worth detecting, unprojecting and
+    associating objects for; other frames only update the agent's location.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        min_translation: float = 0.1,
+        min_rotation: float = 10.0,
+        min_changed_ids: int = 1,
+        max_skipped_steps: int = 10,
+    ):
+        """
+        :param enabled: Every frame is a keyframe when False
+        :param min_translation: Camera displacement in meters making a keyframe
+        :param min_rotation: Camera rotation in degrees making a keyframe
+        :param min_changed_ids: Number of panoptic ids appearing or disappearing
+            making a keyframe, 0 to ignore the ids in view
+        :param max_skipped_steps: Largest number of frames in a row that are skipped
+        """
+        for name, value in [
+            ("min_translation", min_translation),
+            ("min_rotation", min_rotation),
+            ("min_changed_ids", min_changed_ids),
+            ("max_skipped_steps", max_skipped_steps),
+        ]:
+            if value < 0:
+                raise ValueError(f"{name} should be non-negative, received: {value}")
+        self.enabled = enabled
+        self.min_translation = min_translation
+        self.min_rotation = min_rotation
+        self.min_changed_ids = min_changed_ids
+        self.max_skipped_steps = max_skipped_steps
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the last keyframes, e.g. at the start of an episode
+        """
+        self._keyframe_poses: Dict[int, np.ndarray] = {}
+        self._keyframe_ids: Dict[int, Set[int]] = {}
+        self._skipped_steps: Dict[int, int] = {}
+        self.num_frames = 0
+        self.num_keyframes = 0
+
+    def _has_moved(self, pose: np.ndarray, camera_pose: np.ndarray) -> bool:
+        """
+        Returns whether camera_pose is far enough from pose, both 4x4 camera-to-world
+        """
+        translation = np.linalg.norm(camera_pose[:3, 3] - pose[:3, 3])
+        if translation >= self.min_translation:
+            return True
+        relative_rotation = pose[:3, :3].T @ camera_pose[:3, :3]
+        cos_angle = np.clip((np.trace(relative_rotation) - 1.0) / 2.0, -1.0, 1.0)
+        return np.degrees(np.arccos(cos_angle)) >= self.min_rotation
+
+    def is_keyframe(
+        self, uid: int, camera_pose: np.ndarray, instance_ids: np.ndarray
+    ) -> bool:
+        """
+        Returns whether the current frame of agent uid is a keyframe, and if so
+        makes it the agent's last keyframe
+
+        :param uid: The agent's uid
+        :param camera_pose: 4x4 camera-to-world pose of the frame
+        :param instance_ids: Ids in the frame's panoptic image, see get_panoptic_ids
+        """
+        self.num_frames += 1
+        ids = set(np.asarray(instance_ids).tolist())
+        is_keyframe = (
+            not self.enabled
+            or uid not in self._keyframe_poses
+            or self._skipped_steps[uid] >= self.max_skipped_steps
+            or self._has_moved(self._keyframe_poses[uid], camera_pose)
+            or (
+                self.min_changed_ids > 0
+                and len(ids ^ self._keyframe_ids[uid]) >= self.min_changed_ids
+            )
+        )
+        if is_keyframe:
+            self._keyframe_poses[uid] = np.array(camera_pose, dtype=float)
+            self._keyframe_ids[uid] = ids
+            self._skipped_steps[uid] = 0
+            self.num_keyframes += 1
+        else:
+            self._skipped_steps[uid] += 1
+        return is_keyframe
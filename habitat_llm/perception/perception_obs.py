@@ -10,15 +10,16 @@ based on GT panoptic sensors coupled with depth images of the observations."""
 
 
 import re
-from typing import TYPE_CHECKING, Any, Dict, List
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple
 
 if TYPE_CHECKING:
     from habitat_sim import Simulator
 
-import cv2
 import numpy as np
 from habitat_sim.utils.viz_utils import depth_to_rgb
 
+from habitat_llm.perception.keyframe_policy import KeyframePolicy
 from habitat_llm.perception.perception_sim import PerceptionSim
 
 
@@ -40,18 +41,113 @@ def as_intrinsics_matrix(intrinsics: list) -> np.ndarray:
     return K
 
 
+@dataclass
+class PanopticInstances:
+    """
+    The instances of a panoptic image, in increasing id order. Pixels are
+    flat indices into the (H, W) image, in row-major order.
+    """
+
+    ids: np.ndarray
+    # Flat pixel indices of each instance
+    pixel_indices: List[np.ndarray]
+    pixel_counts: np.ndarray
+    # (K, 4) inclusive pixel bounds as x_min, y_min, x_max, y_max
+    bboxes: np.ndarray
+
+
+def get_panoptic_ids(panoptic: np.ndarray) -> np.ndarray:
+    """
+    Returns the instance ids found in a panoptic image in increasing order,
+    without the background id 0 and without splitting the image into instances
+    """
+    counts = np.bincount(panoptic.reshape(-1))
+    counts[:1] = 0
+    return np.flatnonzero(counts)
+
+
+def decompose_panoptic_image(
+    panoptic: np.ndarray, output_shape: Optional[Tuple[int, int]] = None
+) -> PanopticInstances:
+    """
+    Splits a panoptic image into the pixels of each instance in one pass,
+    sorting the non-background pixels by instance. Id 0 is background.
+
+    :param panoptic: (H, W) or (H, W, 1) image of non-negative instance ids
+    :param output_shape: (H, W) to resample the image to with nearest neighbor
+        first, e.g. the resolution of the depth image
+    """
+    panoptic = panoptic.reshape(panoptic.shape[:2])
+    if output_shape is not None and tuple(output_shape) != panoptic.shape:
+        rows = np.arange(output_shape[0]) * panoptic.shape[0] // output_shape[0]
+        cols = np.arange(output_shape[1]) * panoptic.shape[1] // output_shape[1]
+        panoptic = panoptic[rows[:, None], cols]
+    width = panoptic.shape[1]
+    flat = panoptic.reshape(-1)
+
+    counts = np.bincount(flat)
+    counts[:1] = 0
+    ids = np.flatnonzero(counts)
+    pixel_counts = counts[ids]
+    if len(ids) == 0:
+        return PanopticInstances(
+            ids=ids,
+            pixel_indices=[],
+            pixel_counts=pixel_counts,
+            bboxes=np.zeros((0, 4), dtype=np.intp),
+        )
+
+    foreground = np.flatnonzero(flat)
+    # Compact labels sort in linear time with the stable (radix) sort
+    labels = np.zeros(len(counts), dtype=np.min_scalar_type(len(ids)))
+    labels[ids] = np.arange(len(ids))
+    sorted_pixels = foreground[np.argsort(labels[flat[foreground]], kind="stable")]
+
+    ends = np.cumsum(pixel_counts)
+    starts = ends - pixel_counts
+    ys, xs = np.divmod(sorted_pixels, width)
+    bboxes = np.stack(
+        [
+            np.minimum.reduceat(xs, starts),
+            np.minimum.reduceat(ys, starts),
+            np.maximum.reduceat(xs, starts),
+            np.maximum.reduceat(ys, starts),
+        ],
+        axis=1,
+    )
+    return PanopticInstances(
+        ids=ids,
+        pixel_indices=np.split(sorted_pixels, ends[:-1]),
+        pixel_counts=pixel_counts,
+        bboxes=bboxes,
+    )
+
+
 class PerceptionObs(PerceptionSim):
     """
     This class uses only the simulated panoptic sensors to detect objects and
     grounds the location based on depth images being streamed by the agents.
     """
 
-    def __init__(self, sim, metadata_dict: Dict[str, str], *args, **kwargs):
+    def __init__(
+        self,
+        sim,
+        metadata_dict: Dict[str, str],
+        *args,
+        keyframe_config: Optional[Mapping[str, Any]] = None,
+        **kwargs,
+    ):
+        """
+        :param keyframe_config: Arguments of the KeyframePolicy gating object
+            detections, e.g. world_model.keyframe from the Hydra config. Every
+            frame is detected when None.
+        """
         super().__init__(sim, metadata_dict=metadata_dict, detectors=["gt_panoptic"])
 
         # a list of cached images for debugging
         self._iteration = 0
         self._verbose = True
+        self.keyframe_policy = KeyframePolicy(**(keyframe_config or {}))
 
     def preprocess_obs_for_non_privileged_graph_update(
         self,
@@ -153,7 +249,7 @@ class PerceptionObs(PerceptionSim):
         return processed_obs
 
     def get_sim_handle_and_key_from_panoptic_image(
-        self, obs: np.ndarray
+        self, obs: np.ndarray, instance_ids: Optional[np.ndarray] = None
     ) -> Dict[int, str]:
         """
         This method uses the instance segmentation output to create a list of handles of all
@@ -162,6 +258,8 @@ class PerceptionObs(PerceptionSim):
         panoptic image
 
         :param obs: Panoptic sensor output from an agent's sensor
+        :param instance_ids: The ids found in obs, if already known, e.g. from
+        decompose_panoptic_image
 
         :return idx_to_handle_map: A dictionary mapping object-index found in the panoptic
         image to its sim-handle registered in Habitat.
@@ -169,7 +267,9 @@ class PerceptionObs(PerceptionSim):
 
         idx_to_handle_map: Dict[int, str] = {}
 
-        unique_obj_ids = np.unique(obs)
+        if instance_ids is None:
+            instance_ids = np.unique(obs)
+        unique_obj_ids = instance_ids.tolist()
         # 100 gets added to object IDs that are recognized by ROM/AOM in sim/lab
         # subtracting 100 here to get the original object ID
         unique_obj_ids = [idx - 100 for idx in unique_obj_ids if idx != 0]
@@ -220,7 +320,8 @@ class PerceptionObs(PerceptionSim):
         :param input_obs: Structured observations as returned by preprocess_obs_for_non_privileged_graph_update
 
         :return object_detections: A dictionary mapping agent-uid to description of all object detected
-        in agent's FoV
+        in agent's FoV. Frames that are not keyframes, see KeyframePolicy, only hold
+        the camera pose and no detections.
 
         NOTE: We calculate location for objects seen by robot using RGB-D images and
         camera intrinsics + extrinsics. For Human we use sim information as there is a
@@ -233,11 +334,26 @@ class PerceptionObs(PerceptionSim):
             # in_img = obs["rgb"]
             depth = obs["depth"]
 
+            if self.keyframe_policy.enabled and not self.keyframe_policy.is_keyframe(
+                uid, obs["camera_pose"], get_panoptic_ids(out_img)
+            ):
+                object_detections[uid] = {
+                    "is_keyframe": False,
+                    "object_pixel_indices": {},
+                    "object_category_mapping": {},
+                    "object_handle_mapping": {},
+                    "camera_pose": obs["camera_pose"],
+                }
+                continue
+
             depth_to_rgb(depth)
 
+            # Pixels of each instance, at the resolution of the depth image
+            instances = decompose_panoptic_image(out_img, depth.shape[:2])
+
             # Get handles of all objects and receptacles in agent's FOVs
             id_to_handle_mapping = self.get_sim_handle_and_key_from_panoptic_image(
-                out_img
+                out_img, instances.ids
             )
 
             idx_to_name_mapping = {}
@@ -247,24 +363,21 @@ class PerceptionObs(PerceptionSim):
 
             id_to_object_mapping = self._sim_handles_to_categories(id_to_handle_mapping)
 
-            # semantic_input is a dictionary with object index as key and mask as
-            # value. masks are of shape (H, W, 1) with 1s at the location of object
-
-            semantic_input: Dict[int, np.ndarray] = {}
+            # Per object index: flat indices of its pixels in the depth image,
+            # number of pixels and 2D bounding box
+            pixel_indices: Dict[int, np.ndarray] = {}
+            pixel_counts: Dict[int, int] = {}
+            bboxes: Dict[int, np.ndarray] = {}
             locations = {}
 
             # TODO: add a centered-obj heuristic. Don't consider objects on the boundary
             # of the image
-            for _, obj_idx in enumerate(id_to_object_mapping):
-                mask = (out_img == obj_idx).astype(np.uint8)
-                mask_H, mask_W, _ = mask.shape
-                img_H, img_W, _ = depth.shape
-                if mask_H != img_H or mask_W != img_W:
-                    mask = np.expand_dims(
-                        cv2.resize(mask, (img_H, img_W), interpolation=cv2.INTER_AREA),
-                        axis=2,
-                    )
-                semantic_input[obj_idx] = mask
+            for instance, obj_idx in enumerate(instances.ids.tolist()):
+                if obj_idx not in id_to_object_mapping:
+                    continue
+                pixel_indices[obj_idx] = instances.pixel_indices[instance]
+                pixel_counts[obj_idx] = int(instances.pixel_counts[instance])
+                bboxes[obj_idx] = instances.bboxes[instance]
                 if uid == 1:
                     # TODO: remove after bug-fix in KinematicHumanoid class
                     object_name = idx_to_name_mapping[obj_idx]
@@ -273,7 +386,10 @@ class PerceptionObs(PerceptionSim):
                     ).properties["translation"]
             # create an output dict to be used by graph updater
             object_detections[uid] = {
-                "object_masks": semantic_input,
+                "is_keyframe": True,
+                "object_pixel_indices": pixel_indices,
+                "object_pixel_counts": pixel_counts,
+                "object_bboxes": bboxes,
                 "out_img": out_img,
                 "object_category_mapping": id_to_object_mapping,
                 "object_handle_mapping": id_to_handle_mapping,
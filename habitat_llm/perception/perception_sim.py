@@ -11,7 +11,8 @@ simulator partial-observation condition which generates ground-truth world-graph
 only the entities discovered so far by the agents."""
 
 import copy
-from typing import TYPE_CHECKING, Dict, List, Optional, Set, Union
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Union
 
 if TYPE_CHECKING:
     pass
@@ -30,6 +31,7 @@ from magnum import Vector3
 
 from habitat_llm.perception.perception import Perception
 from habitat_llm.sims.metadata_interface import MetadataInterface
+from habitat_llm.sims.region_grid import RegionGrid
 from habitat_llm.utils.sim import get_faucet_points, get_receptacle_dict
 from habitat_llm.world_model import (
     Floor,
@@ -48,6 +50,21 @@ HUMAN_SEMANTIC_ID = 100  # special semantic ID reserved for humanoids
 UNKNOWN_SEMANTIC_ID = 0  # special semantic ID reserved for unknown object class
 
 
+@dataclass
+class PerceptionFrame:
+    """
+    Sim-derived perception of one step, computed once and shared by all agents.
+    gt_graph is a snapshot of the ground truth graph for this step and
+    names_per_agent maps each agent uid to the names of the nodes it sees or
+    holds, including its own node. gt_graph_version is the version of the
+    live ground truth graph the snapshot was taken from.
+    """
+
+    gt_graph: WorldGraph
+    names_per_agent: Dict[str, List[str]]
+    gt_graph_version: int
+
+
 class PerceptionSim(Perception):
     """
     This class represents simulated perception stack of the agents.
@@ -78,10 +95,27 @@ class PerceptionSim(Perception):
         # Container to map region ids to rooms
         self.region_id_to_name: Dict[str, str] = {}
 
+        # Lookup of the region containing a point
+        self.region_grid = RegionGrid(self.sim.semantic_scene.regions)
+
+        # Articulated object link map of the scene named _ao_link_map_scene
+        self._ao_link_map: Dict[int, int] = None
+        self._ao_link_map_scene: str = None
+
         # Fetch the rigid and articulated object manager
         self.rom = sim.get_rigid_object_manager()
         self.aom = sim.get_articulated_object_manager()
 
+        # Cache of receptacle names containing objects.
+        self._obj_to_rec_cache: Dict[str, str] = {}
+
+        # Cache of object positions.
+        self._obj_position_cache: Dict[str, Vector3] = {}
+
+        # Cache of the object states last written to the graph, mapping
+        # state name to sim handle to value
+        self._object_states_cache: Dict[str, Dict[str, Any]] = {}
+
         # Container to store ground truth sim graph
         self.gt_graph = WorldGraph()
 
@@ -104,12 +138,6 @@ class PerceptionSim(Perception):
         # This together with the above command completes the scene initialization.
         self.add_agents_to_gt_graph()
 
-        # Cache of receptacle names containing objects.
-        self._obj_to_rec_cache: Dict[str, str] = {}
-
-        # Cache of object positions.
-        self._obj_position_cache: Dict[str, Vector3] = {}
-
     @property
     def receptacles(self) -> Dict[str, HabReceptacle]:
         """
@@ -141,24 +169,16 @@ class PerceptionSim(Perception):
 
         :return: String value of the furniture' property as initialized in metadata
         """
-        # Declare default
-        property_value = "unknown"
-
         # get hash from handle
         # handle_hash = handle.split(".", 1)[0] if "." in handle else handle.split("_", 1)[0]
         handle_hash = (
             handle.split(".")[0] if "." in handle else handle.rpartition("_")[0]
         )
 
-        # Use loc to locate the row with the specific key
-        object_row = self.metadata.loc[self.metadata["handle"] == handle_hash]
-
-        # Extract the value from the object_row
-        if not object_row.empty:
-            # Make sure the property value is not nan or empty
-            if object_row[prop].notna().any() and (object_row[prop] != "").any():
-                property_value = object_row[prop].values[0]
-        else:
+        property_value = self.metadata_interface.get_property_from_hash(
+            handle_hash, prop
+        )
+        if property_value is None:
             raise ValueError(f"Handle {handle} not found in the metadata.")
 
         return property_value
@@ -173,9 +193,10 @@ class PerceptionSim(Perception):
 
         :raises ValueError: If the object is not in any region.
         """
-        ao_link_map = sutils.get_ao_link_id_map(self.sim)
         regions = sutils.get_object_regions(
-            self.sim, get_obj_from_handle(self.sim, handle), ao_link_map=ao_link_map
+            self.sim,
+            get_obj_from_handle(self.sim, handle),
+            ao_link_map=self.get_ao_link_map(),
         )
         if len(regions) == 0:
             # raise ValueError(f"Object is not in any region: {handle}")
@@ -186,6 +207,31 @@ class PerceptionSim(Perception):
             room_name = self.region_id_to_name[region_id]
         return room_name
 
+    def get_ao_link_map(self) -> Dict[int, int]:
+        """
+        Returns the map from articulated object link ids to articulated object
+        ids, computed once per scene.
+        """
+        scene_name = self.sim.curr_scene_name
+        if self._ao_link_map is None or self._ao_link_map_scene != scene_name:
+            self._ao_link_map = sutils.get_ao_link_id_map(self.sim)
+            self._ao_link_map_scene = scene_name
+        return self._ao_link_map
+
+    def get_room_name_at(self, point: List[float]) -> Optional[str]:
+        """
+        Get the name of the room whose region contains a point.
+
+        :param point: The point in sim coordinates.
+
+        :return: The name of the room, or None if the point is not in any region.
+        """
+        region_index = self.region_grid.get_region_index(point)
+        if region_index is None:
+            return None
+        region_id = self.sim.semantic_scene.regions[region_index].id
+        return self.region_id_to_name[region_id]
+
     def get_latest_objects_to_receptacle_map(self) -> Dict[str, str]:
         """
         This method returns a dict which maps objects
@@ -196,7 +242,20 @@ class PerceptionSim(Perception):
         :return: Dict mapping an object' str object-UID to the str name of receptacle
         associated with it
         """
-        objects = self.gt_graph.get_all_objects()
+        self._refresh_receptacle_cache(self.gt_graph.get_all_objects())
+
+        return self._obj_to_rec_cache
+
+    def _refresh_receptacle_cache(self, objects: List[Object]) -> List[str]:
+        """
+        Recomputes the cached receptacle of the given objects whose position
+        changed since it was last computed.
+
+        :param objects: Object nodes to check
+
+        :return: Names of the objects whose receptacle was recomputed
+        """
+        refreshed = []
         for obj in objects:
             obj_name = obj.name
             obj_pos = obj.properties["translation"]
@@ -209,8 +268,8 @@ class PerceptionSim(Perception):
                     rec_name = "unknown_room"
                 self._obj_position_cache[obj_name] = obj_pos
                 self._obj_to_rec_cache[obj_name] = rec_name
-
-        return self._obj_to_rec_cache
+                refreshed.append(obj_name)
+        return refreshed
 
     def add_house_to_graph(self) -> None:
         """
@@ -476,11 +535,7 @@ class PerceptionSim(Perception):
             self.sim_handle_to_name[agent_name] = agent_name
 
             # Fetch room for this agent
-            room_name = None
-            for region in self.sim.semantic_scene.regions:
-                if region.contains(agent.properties["translation"]):
-                    room_name = self.region_id_to_name[region.id]
-                    break
+            room_name = self.get_room_name_at(agent.properties["translation"])
 
             # Add agent to unknown room if a valid room is not found
             if room_name == None:
@@ -517,9 +572,14 @@ class PerceptionSim(Perception):
             # Get agent position
             current_pos = list(articulated_agent.base_pos)
 
-            # Update the translation of agent node in the graph
+            # The room only changes when the agent moves
             agent_node = self.gt_graph.get_node_from_name(agent_name)
-            agent_node.properties["translation"] = current_pos
+            if agent_node.properties.get("translation") == current_pos:
+                continue
+
+            # Update the translation of agent node in the graph
+            agent_node = self.gt_graph.get_writable_node(agent_node)
+            self.gt_graph.set_node_translation(agent_node, current_pos)
 
             # Get old room of the agent
             old_rooms = self.gt_graph.get_neighbors_of_type(agent_node, Room)
@@ -531,15 +591,11 @@ class PerceptionSim(Perception):
                 )
 
             # Fetch new room for this agent
-            new_room = None
-            for region in self.sim.semantic_scene.regions:
-                if region.contains(agent_node.properties["translation"]):
-                    new_room = self.region_id_to_name[region.id]
-                    break
+            new_room = self.get_room_name_at(agent_node.properties["translation"])
 
             # It was found that sometimes, agent is not found to be in any room
             # In that case we skip changing its room
-            if new_room != None:
+            if new_room != None and new_room != old_rooms[0].name:
                 # Delete edge between old room and agent
                 self.gt_graph.remove_edge(agent_node, old_rooms[0])
 
@@ -550,53 +606,99 @@ class PerceptionSim(Perception):
         """
         This method will update the associations between object and receptacles.
         This is required because we need to update the graph every time an object
-        is moved from one receptacle to another.
+        is moved from one receptacle to another. Only objects that moved since
+        the last update have their receptacle recomputed.
         """
         object_node_list = self.gt_graph.get_all_objects()
-        # Update positions of all objects
+        # Update positions of objects that moved; nodes are cloned on write
+        # while shared with a snapshot handed out by get_recent_graph
+        moved_nodes = []
+        translations = []
         for obj_node in object_node_list:
-            # Update object position
-            # obj_node = self.gt_graph.get_node_from_name(obj_name)
             translation = list(
                 self.rom.get_object_by_handle(obj_node.sim_handle).translation
             )
-            obj_node.properties["translation"] = translation
-
-        # Get latest mapping from object to rec
+            if obj_node.properties.get("translation") != translation:
+                moved_nodes.append(obj_node)
+                translations.append(translation)
+        moved_nodes = self.gt_graph.get_writable_nodes(moved_nodes)
+        for obj_node, translation in zip(moved_nodes, translations):
+            self.gt_graph.set_node_translation(obj_node, translation)
+
+        # Refresh the receptacles of moved objects, and of objects seen for the
+        # first time
         # NOTE: this call should strictly come after updating object positions
         # as it relies on positions as a mechanism for reducing computation overload
         # mixing the order here may lead to relationships dropping or being updated
         # later than expected.
-        obj_to_rec = self.get_latest_objects_to_receptacle_map()
+        refreshed = self._refresh_receptacle_cache(
+            moved_nodes
+            + [
+                obj_node
+                for obj_node in object_node_list
+                if obj_node.name not in self._obj_position_cache
+            ]
+        )
+
+        for obj_name in refreshed:
+            rec_name = self._obj_to_rec_cache[obj_name]
+            obj_node = self.gt_graph.get_node_from_name(obj_name)
+            rec_node = self.gt_graph.get_node_from_name(rec_name)
+            obj_edges = self.gt_graph.graph[obj_node]
+            rec_edge = self.gt_graph.graph[rec_node].get(obj_node)
+            if obj_edges == {rec_node: "on"} and rec_edge == flip_edge("on"):
+                # Moved within the same receptacle
+                continue
 
-        for obj_name, rec_name in obj_to_rec.items():
             # Remove all old edges of this object
-            self.gt_graph.remove_all_edges(obj_name)
+            self.gt_graph.remove_all_edges(obj_node)
 
             # Add new edge
-            self.gt_graph.add_edge(obj_name, rec_name, "on", flip_edge("on"))
+            self.gt_graph.add_edge(obj_node, rec_node, "on", flip_edge("on"))
 
     def update_object_and_furniture_states(self) -> None:
         """
         Updates object states for all objects in the ground truth graph.
+        Only states that changed since the last update are written.
         self.sim.object_state_machine must already be initialized.
         """
 
-        all_objects = self.gt_graph.get_all_nodes_of_type(Object)
         full_state_dict = self.sim.object_state_machine.get_snapshot_dict(self.sim)
 
-        if all_objects is not None:
-            for obj in all_objects:
-                for state_name, object_state_values in full_state_dict.items():
-                    if obj.sim_handle in object_state_values:
-                        obj.set_state({state_name: object_state_values[obj.sim_handle]})
+        # Collect the states that differ from the ones last written, per handle
+        states_per_handle: Dict[str, Dict[str, Any]] = {}
+        for state_name, object_state_values in full_state_dict.items():
+            cached_values = self._object_states_cache.setdefault(state_name, {})
+            for sim_handle, value in object_state_values.items():
+                if (
+                    sim_handle not in cached_values
+                    or cached_values[sim_handle] != value
+                ):
+                    cached_values[sim_handle] = value
+                    states_per_handle.setdefault(sim_handle, {})[state_name] = value
+
+        # Only touch nodes whose states changed
+        changed_nodes = []
+        changed_states = []
+        for sim_handle, states in states_per_handle.items():
+            if sim_handle not in self.sim_handle_to_name:
+                continue
+            node = self.gt_graph.get_node_from_name(self.sim_handle_to_name[sim_handle])
+            if not isinstance(node, (Object, Furniture)):
+                continue
+            node_states = node.properties.get("states", {})
+            new_states = {
+                state_name: value
+                for state_name, value in states.items()
+                if state_name not in node_states or node_states[state_name] != value
+            }
+            if new_states:
+                changed_nodes.append(node)
+                changed_states.append(new_states)
 
-        all_furniture = self.gt_graph.get_all_nodes_of_type(Furniture)
-        if all_furniture is not None:
-            for fur in all_furniture:
-                for state_name, object_state_values in full_state_dict.items():
-                    if fur.sim_handle in object_state_values:
-                        fur.set_state({state_name: object_state_values[fur.sim_handle]})
+        changed_nodes = self.gt_graph.get_writable_nodes(changed_nodes)
+        for node, new_states in zip(changed_nodes, changed_states):
+            node.set_state(new_states)
 
     def get_sim_handles_in_view(
         self,
@@ -650,66 +752,126 @@ class PerceptionSim(Perception):
 
         return handles
 
-    def get_recent_subgraph(
+    def update_gt_graph(self) -> None:
+        """
+        Updates the ground truth graph to reflect the most recent associations
+        between objects, their states and their receptacles, and agents and
+        their rooms, based on the sim info
+        """
+        self.update_object_receptacle_associations()
+        self.update_agent_room_associations()
+        self.update_object_and_furniture_states()
+
+    def get_perception_frame(
         self, agent_uids: List[str], obs: Dict[str, np.ndarray]
-    ) -> Graph:
+    ) -> PerceptionFrame:
         """
-        Method to return receptacle/agent-object associated detections from the sim
-        This returns objects in view including objects held by the agent.
+        Updates the ground truth graph once and collects what each agent sees,
+        so that the subgraphs of several agents can be derived from the same
+        step with get_subgraph_from_frame.
 
+        :param agent_uids: Agents whose observations should be processed, may be empty
         :param obs: Observation dict mapping sensor name to sensor output
-        :param agent_uids: List of all agents to consider
 
-        :return: Latest world-graph over all objects seen by agent including the one currently in hold
+        :return: PerceptionFrame of the current step
         """
 
         # Make sure that sim is not None
         if not self.sim:
             raise ValueError("Trying to get detections from sim, but sim was None")
 
-        # Make sure that the agents list is not empty or None
-        if not agent_uids:
-            raise ValueError(
-                "Trying to get detections from sim, but agent_uids was empty"
-            )
-
-        # Update ground truth graph to reflect most
-        # recent associations between objects, their states and their
-        # receptacles based on the sim info
-        self.update_object_receptacle_associations()
-        self.update_agent_room_associations()
-        self.update_object_and_furniture_states()
+        self.update_gt_graph()
 
         # Get handles of all objects and receptacles in agent's FOVs
-        handles_per_agent = self.get_sim_handles_in_view(obs, agent_uids)
+        handles_per_agent = (
+            self.get_sim_handles_in_view(obs, agent_uids) if agent_uids else {}
+        )
 
-        # Unpack handles from all agents and and make union
-        handle_set = set.union(*handles_per_agent.values())
+        names_per_agent = {}
+        for uid in agent_uids:
+            # Convert handles to names
+            names = [
+                self.sim_handle_to_name[handle]
+                for handle in handles_per_agent[uid]
+                if handle in self.sim_handle_to_name
+            ]
+
+            # Forcefully add the agent's own node
+            names.append(f"agent_{uid}")
+
+            # add held objects to the subgraph because they may not be seen
+            # by the observations
+            grasp_mgr = self.sim.agents_mgr[int(uid)].grasp_mgr
+            if grasp_mgr.is_grasped:
+                held_obj = get_obj_from_id(self.sim, grasp_mgr.snap_idx)
+                names.append(self.sim_handle_to_name[held_obj.handle])
+            names_per_agent[uid] = names
 
-        # Convert handles to names
-        names = []
-        for handle in handle_set:
-            if handle in self.sim_handle_to_name:
-                names.append(self.sim_handle_to_name[handle])
+        return PerceptionFrame(
+            self.gt_graph.snapshot(), names_per_agent, self.gt_graph.version
+        )
 
-        # Forcefully add robot and human node names
-        agent_names = [f"agent_{uid}" for uid in agent_uids]
-        names.extend(agent_names)
+    def get_subgraph_from_frame(
+        self, frame: PerceptionFrame, agent_uids: List[str]
+    ) -> Graph:
+        """
+        Returns the subgraph over everything the given agents see or hold in
+        frame. Cheap compared to get_recent_subgraph, since the sim is not
+        queried again.
+
+        :param frame: PerceptionFrame from get_perception_frame
+        :param agent_uids: Agents whose observations to combine; all of them
+        should have been passed to get_perception_frame
+
+        :return: World-graph over all objects seen by the agents including the ones currently in hold
+        """
+        if not agent_uids:
+            raise ValueError("Trying to get a subgraph, but agent_uids was empty")
 
-        # add held objects to the subgraph because they may not be seen
-        # by the observations
+        names: Dict[str, None] = {}
         for uid in agent_uids:
-            grasp_mgr = self.sim.agents_mgr[int(uid)].grasp_mgr
-            if grasp_mgr.is_grasped:
-                held_obj_id = grasp_mgr.snap_idx
-                held_obj = get_obj_from_id(self.sim, held_obj_id)
-                name = self.sim_handle_to_name[held_obj.handle]
-                names.append(name)
+            if uid not in frame.names_per_agent:
+                raise ValueError(f"Agent {uid} was not observed in the frame")
+            names.update(dict.fromkeys(frame.names_per_agent[uid]))
+
+        # Until the next update the live graph equals the snapshot, and unlike
+        # a fresh snapshot it keeps its containment tree across steps
+        if self.gt_graph.version == frame.gt_graph_version:
+            source_graph = self.gt_graph
+        else:
+            source_graph = frame.gt_graph
+
+        # Get subgraph with for the objects in view. It holds the ground truth
+        # nodes, so all graphs have to clone them before writing.
+        subgraph = source_graph.get_subgraph(list(names))
+        subgraph.mark_nodes_shared()
+        source_graph.mark_nodes_shared()
 
-        # Get subgraph with for the objects in view
-        subgraph = self.gt_graph.get_subgraph(names)
+        return subgraph
+
+    def get_recent_subgraph(
+        self, agent_uids: List[str], obs: Dict[str, np.ndarray]
+    ) -> Graph:
+        """
+        Method to return receptacle/agent-object associated detections from the sim
+        This returns objects in view including objects held by the agent.
+        When several agents need subgraphs of the same step, use
+        get_perception_frame and get_subgraph_from_frame instead.
 
-        return copy.deepcopy(subgraph)
+        :param obs: Observation dict mapping sensor name to sensor output
+        :param agent_uids: List of all agents to consider
+
+        :return: Latest world-graph over all objects seen by agent including the one currently in hold
+        """
+
+        # Make sure that the agents list is not empty or None
+        if not agent_uids:
+            raise ValueError(
+                "Trying to get detections from sim, but agent_uids was empty"
+            )
+
+        frame = self.get_perception_frame(agent_uids, obs)
+        return self.get_subgraph_from_frame(frame, agent_uids)
 
     def get_recent_graph(self) -> WorldGraph:
         """
@@ -717,15 +879,9 @@ class PerceptionSim(Perception):
 
         :return: Complete graph describing the latest state of the episode
         """
+        self.update_gt_graph()
 
-        # Update ground truth graph to reflect most
-        # recent associations between objects, their states and their
-        # receptacles based on the sim info
-        self.update_object_receptacle_associations()
-        self.update_agent_room_associations()
-        self.update_object_and_furniture_states()
-
-        return copy.deepcopy(self.gt_graph)
+        return self.gt_graph.snapshot()
 
     def get_graph_without_objects(self) -> WorldGraph:
         """
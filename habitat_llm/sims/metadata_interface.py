@@ -96,14 +96,22 @@ class MetadataInterface:
         self.affordance_info: Dict[str, List[str]] = {}
         self.metadata = self.load_metadata(self.metadata_source_dict)
 
+        # Row positions of each object hash in self.metadata, so property lookups
+        # don't scan the DataFrame, and the columns read by them so far
+        self._hash_to_rows: Dict[str, List[int]] = {}
+        for index, handle_hash in enumerate(self.metadata["handle"].tolist()):
+            self._hash_to_rows.setdefault(handle_hash, []).append(index)
+        self._column_values: Dict[str, Any] = {}
+
         self.receptacles: List[hab_receptacle.Receptacle] = None
 
         # generate a lexicon from the metadata
         self.hash_to_cat: Dict[str, str] = {}
         self.lexicon: List[str] = []  # all object classes annotated
-        for index in range(self.metadata.shape[0]):
-            cat = self.metadata.at[index, "type"]
-            self.hash_to_cat[self.metadata.at[index, "handle"]] = cat
+        for handle_hash, cat in zip(
+            self.metadata["handle"].tolist(), self.metadata["type"].tolist()
+        ):
+            self.hash_to_cat[handle_hash] = cat
             self.lexicon.append(cat)
         # deduplicate lexicon
         self.lexicon = list(set(self.lexicon))
@@ -201,11 +209,10 @@ class MetadataInterface:
         df2 = df2[["handle", "type"]]
 
         # setup the hash to source mapping
-        for index in range(df1.shape[0]):
-            self.hash_to_source[df1.at[index, "handle"]] = "hssd"
-        for index in range(df2.shape[0]):
-            cat = df2.at[index, "type"]
-            self.hash_to_source[df2.at[index, "handle"]] = "dynamic"
+        for handle_hash in df1["handle"].tolist():
+            self.hash_to_source[handle_hash] = "hssd"
+        for handle_hash, cat in zip(df2["handle"].tolist(), df2["type"].tolist()):
+            self.hash_to_source[handle_hash] = "dynamic"
             self.dynamic_lexicon.append(cat)
         self.dynamic_lexicon = list(set(self.dynamic_lexicon))
 
@@ -510,24 +517,41 @@ class MetadataInterface:
         :return: The value corresponding the requested 'metadata_field' for the passed object 'handle'.
         """
 
-        # Declare default
-        property_value = "unknown"
-
         # get hash from handle
         handle_hash = handle.rpartition("_")[0]
 
-        # Use loc to locate the row with the specific key
-        object_row = self.metadata.loc[self.metadata["handle"] == handle_hash]
-
-        # Extract the value from the object_row
-        if not object_row.empty:
-            # Make sure the property value is not nan or empty
-            if (
-                object_row[metadata_field].notna().any()
-                and (object_row[metadata_field] != "").any()
-            ):
-                property_value = object_row[metadata_field].values[0]
-        else:
+        property_value = self.get_property_from_hash(handle_hash, metadata_field)
+        if property_value is None:
             raise MetadataError(f"Handle {handle} not found in the metadata.")
 
         return property_value
+
+    def get_property_from_hash(self, handle_hash: str, metadata_field: str) -> Any:
+        """
+        Looks up a metadata field of an object hash without scanning the DataFrame.
+        When the hash has several rows the first one is used, provided any of
+        them holds a value.
+
+        :param handle_hash: The object hash, i.e. the "handle" column of the metadata.
+        :param metadata_field: The metadata field to query.
+
+        :return: The value of the field, "unknown" if it is nan or empty, or None if the hash is not in the metadata.
+        """
+
+        rows = self._hash_to_rows.get(handle_hash)
+        if rows is None:
+            return None
+
+        if metadata_field not in self._column_values:
+            self._column_values[metadata_field] = self.metadata[
+                metadata_field
+            ].to_numpy()
+        column = self._column_values[metadata_field]
+
+        # Make sure the property value is not nan or empty
+        values = [column[row] for row in rows]
+        if any(pd.notna(value) for value in values) and any(
+            value != "" for value in values
+        ):
+            return values[0]
+        return "unknown"
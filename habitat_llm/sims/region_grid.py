@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class RegionGrid:
+    """
+    Grid over the floor plan (x, z) of the semantic regions of a scene, used
+    to find the region containing a point without testing every region.
+
+    Each cell keeps the regions whose floor polygon overlaps it, in scene
+    order. A query tests only those with region.contains, so it returns the
+    same region as scanning all regions in order, usually after a single test.
+    """
+
+    def __init__(self, regions: Sequence[Any], cell_size: float = 0.1):
+        """
+        :param regions: The SemanticRegions of the scene, e.g. sim.semantic_scene.regions
+        :param cell_size: Side of the grid cells in meters
+        """
+        if cell_size <= 0:
+            raise ValueError(f"cell_size should be positive, received: {cell_size}")
+        self.regions = list(regions)
+        self.cell_size = cell_size
+
+        polygons = [
+            np.array([[point[0], point[2]] for point in region.poly_loop_points])
+            for region in self.regions
+        ]
+        polygons = [polygon.reshape(-1, 2).astype(float) for polygon in polygons]
+        all_points = [polygon for polygon in polygons if len(polygon) > 0]
+        if not all_points:
+            self._origin = np.zeros(2)
+            self._cells = np.zeros((0, 0), dtype=np.int32)
+            self._candidate_sets: List[Tuple[int, ...]] = [()]
+            return
+        points = np.concatenate(all_points)
+        self._origin = points.min(axis=0)
+        shape = np.floor((points.max(axis=0) - self._origin) / cell_size) + 1
+        # Cells hold an index into _candidate_sets; 0 is the empty set
+        self._cells = np.zeros(shape.astype(int), dtype=np.int32)
+        self._candidate_sets = [()]
+
+        # Extends a candidate set id with a region index
+        extensions: Dict[Tuple[int, int], int] = {}
+        for region_index, polygon in enumerate(polygons):
+            if len(polygon) == 0:
+                continue
+            low, high, mask = self._rasterize(polygon)
+            window = self._cells[low[0] : high[0], low[1] : high[1]]
+            for set_id in np.unique(window[mask]):
+                key = (int(set_id), region_index)
+                if key not in extensions:
+                    extensions[key] = len(self._candidate_sets)
+                    self._candidate_sets.append(
+                        self._candidate_sets[set_id] + (region_index,)
+                    )
+                window[mask & (window == set_id)] = extensions[key]
+
+    def _rasterize(self, polygon: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Any]:
+        """
+        Returns the window of cells covering polygon, as low and high cell
+        indices, and a mask over the window of the cells overlapping it
+        """
+        low = np.floor((polygon.min(axis=0) - self._origin) / self.cell_size)
+        high = np.floor((polygon.max(axis=0) - self._origin) / self.cell_size) + 1
+        low = np.maximum(low.astype(int), 0)
+        high = np.minimum(high.astype(int), self._cells.shape)
+
+        x = self._origin[0] + (np.arange(low[0], high[0]) + 0.5) * self.cell_size
+        z = self._origin[1] + (np.arange(low[1], high[1]) + 0.5) * self.cell_size
+        centers_x, centers_z = np.meshgrid(x, z, indexing="ij")
+
+        # Even-odd rule for centers inside the polygon
+        inside = np.zeros(centers_x.shape, dtype=bool)
+        # Distance from centers to the closest edge
+        closest = np.full(centers_x.shape, np.inf)
+        for start, end in zip(polygon, np.roll(polygon, -1, axis=0)):
+            edge = end - start
+            offset_x = centers_x - start[0]
+            offset_z = centers_z - start[1]
+            crosses = (start[1] > centers_z) != (end[1] > centers_z)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing_x = start[0] + offset_z * (edge[0] / edge[1])
+            inside ^= crosses & (centers_x < crossing_x)
+
+            length = float(edge @ edge)
+            projection = offset_x * edge[0] + offset_z * edge[1]
+            t = np.clip(projection / length, 0.0, 1.0) if length > 0 else 0.0
+            distance = np.hypot(offset_x - t * edge[0], offset_z - t * edge[1])
+            closest = np.minimum(closest, distance)
+
+        # A cell overlaps the polygon if its center is inside or an edge passes
+        # through it; pad the half diagonal against rounding
+        half_diagonal = self.cell_size * math.sqrt(0.5) * (1 + 1e-6) + 1e-9
+        return low, high, inside | (closest <= half_diagonal)
+
+    def get_candidate_regions(self, point: Sequence[float]) -> Tuple[int, ...]:
+        """
+        Returns the indices of the regions whose floor polygon may contain point
+        """
+        i = math.floor((point[0] - self._origin[0]) / self.cell_size)
+        j = math.floor((point[2] - self._origin[1]) / self.cell_size)
+        if not (0 <= i < self._cells.shape[0] and 0 <= j < self._cells.shape[1]):
+            return ()
+        return self._candidate_sets[self._cells[i, j]]
+
+    def get_region_index(self, point: Sequence[float]) -> Optional[int]:
+        """
+        Returns the index of the first region containing point, or None
+
+        :param point: Point in sim coordinates, y up
+        """
+        for region_index in self.get_candidate_regions(point):
+            if self.regions[region_index].contains(point):
+                return region_index
+        return None
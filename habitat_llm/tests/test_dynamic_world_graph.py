@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import copy
+import io
+import random
+from types import SimpleNamespace
+from typing import Dict, List
+
+import numpy as np
+
+from habitat_llm.utils.semantic_constants import EPISODE_OBJECTS
+from habitat_llm.world_model import (
+    DynamicWorldGraph,
+    Floor,
+    Furniture,
+    House,
+    Human,
+    Object,
+    Room,
+    SpotRobot,
+)
+from habitat_llm.world_model.graph import Graph
+from habitat_llm.world_model.world_graph import flip_edge
+
+RELATIONS = ["a on b", "b on a", "a in b", "b in a", "next to", "none of these"]
+
+
+def make_concept_graph_edges(rng: random.Random, num_objects: int) -> List[dict]:
+    """
+    Concept-graph output relating each of num_objects objects and furniture,
+    spread over a few rooms, to another one
+    """
+    rooms = ["living room", "kitchen", "bedroom", "bathroom"]
+    cg_objects = []
+    for index in range(num_objects):
+        center = [rng.uniform(-10, 10), rng.uniform(0, 2), rng.uniform(-10, 10)]
+        cg_objects.append(
+            {
+                "id": index,
+                "object_tag": rng.choice(["Table", "Cup", "Book-Shelf", "invalid"]),
+                "category_tag": "furniture" if index % 3 == 0 else "object",
+                "room_region": rng.choice(rooms),
+                "bbox_center": center,
+                "bbox_extent": [0.2, 0.2, 0.2],
+            }
+        )
+    return [
+        {
+            "object1": dict(cg_object),
+            "object2": dict(rng.choice(cg_objects)),
+            "object_relation": rng.choice(RELATIONS),
+        }
+        for cg_object in cg_objects
+    ]
+
+
+def test_create_cg_edges_indexes_entities():
+    cg_edges = make_concept_graph_edges(random.Random(0), 300)
+    graph = DynamicWorldGraph()
+    graph.create_cg_edges(cg_edges, include_objects=True)
+
+    num_valid = 0
+    for edge in cg_edges:
+        uids = [
+            graph._cg_object_to_object_uid(edge[key]) for key in ["object1", "object2"]
+        ]
+        valid = [edge[key]["object_tag"] != "invalid" for key in ["object1", "object2"]]
+        for uid, is_valid in zip(uids, valid):
+            assert graph.has_node(uid) == is_valid
+        if (
+            all(valid)
+            and uids[0] != uids[1]
+            and edge["object_relation"] in RELATIONS[:5]
+        ):
+            assert graph.has_edge(uids[0], uids[1])
+        num_valid += valid[0]
+    entities = [
+        node
+        for node in graph.graph
+        if isinstance(node, (Furniture, Object)) and not isinstance(node, Floor)
+    ]
+    assert len(entities) == num_valid
+    rooms = graph.get_all_rooms()
+    for room in rooms:
+        assert graph.has_node(f"floor_{room.name}")
+    assert len(graph.graph) == 1 + num_valid + 2 * len(rooms)
+    # Pruned rooms still count, so that names of new objects are never reused
+    assert graph._num_entities_added >= len(graph.graph)
+
+
+def test_entity_counter_survives_snapshots():
+    graph = DynamicWorldGraph()
+    graph.create_cg_edges(make_concept_graph_edges(random.Random(1), 30))
+    num_added = graph._num_entities_added
+    room = graph.get_all_rooms()[0]
+    graph.remove_node(room)
+    graph.add_node(Room(room.name, dict(room.properties)))
+    assert graph._num_entities_added == num_added + 1
+
+    assert graph.snapshot()._num_entities_added == num_added + 1
+    file = io.BytesIO()
+    graph.save_snapshot(file)
+    file.seek(0)
+    loaded = DynamicWorldGraph.load_snapshot(file)
+    assert loaded._num_entities_added == num_added + 1
+
+
+def test_full_observation_from_a_plain_graph():
+    gt_graph = Graph()
+    house = House("house", {"type": "root"}, "house_0")
+    kitchen = Room("kitchen", {"type": "room"})
+    table = Furniture("table", {"type": "table"}, "table_handle")
+    cup = Object("cup", {"type": "cup"}, "cup_handle")
+    for node in [house, kitchen, table, cup]:
+        gt_graph.add_node(node)
+    gt_graph.add_edge(kitchen, house, "inside", "contains")
+    gt_graph.add_edge(table, kitchen, "inside", "contains")
+    gt_graph.add_edge(cup, table, "on", "under")
+
+    graph = DynamicWorldGraph()
+    graph.update(gt_graph, partial_obs=False, update_mode="gt")
+    assert [node.name for node in graph.graph] == ["house", "kitchen", "table", "cup"]
+    assert graph._num_entities_added == 4
+
+    # adopting a smaller graph keeps the counter
+    graph._num_entities_added = 10
+    gt_graph.remove_node(cup)
+    graph.update(gt_graph, partial_obs=False, update_mode="gt")
+    assert not graph.has_node("cup")
+    assert graph._num_entities_added == 10
+
+
+def test_sim_handles_of_non_privileged_furniture():
+    graph = DynamicWorldGraph()
+    tables = [
+        Furniture(f"{index}_table", {"type": "table", "translation": [index, 0, 0]})
+        for index in range(2)
+    ]
+    for table in tables:
+        graph.add_node(table)
+    gt_graph = Graph()
+    for index in range(2):
+        gt_graph.add_node(
+            Furniture(
+                f"table_{index}",
+                {"type": "table", "translation": [index + 0.1, 0, 0]},
+                f"table_handle_{index}",
+            )
+        )
+    perception = SimpleNamespace(
+        gt_graph=gt_graph,
+        fur_obj_handle_to_recs={"table_handle_0": [], "table_handle_1": []},
+    )
+    snapshot = graph.snapshot()
+    graph._set_sim_handles_for_non_privileged_graph(perception)
+
+    for index in range(2):
+        table = graph.get_node_from_sim_handle(f"table_handle_{index}")
+        assert table.name == f"{index}_table"
+        assert graph._sim_object_to_detected_object_map[f"table_{index}"] is table
+    assert not graph.has_node_with_sim_handle(None)
+    # the snapshot's nodes are left alone
+    assert [table.sim_handle for table in snapshot.graph] == [None, None]
+    graph.check_consistency()
+
+
+# Camera of the robot, at the origin looking down -z
+HEIGHT, WIDTH = 48, 64
+INTRINSICS = np.array(
+    [[10.0, 0.0, WIDTH / 2], [0.0, 10.0, HEIGHT / 2], [0.0, 0.0, 1.0]]
+)
+CATEGORIES = EPISODE_OBJECTS[:4]
+
+
+def pixel_to_world(x: int, y: int, depth: float) -> List[float]:
+    # inverse intrinsics, then OpenCV to OpenGL camera axes
+    return [
+        (x - INTRINSICS[0, 2]) * depth / INTRINSICS[0, 0],
+        -(y - INTRINSICS[1, 2]) * depth / INTRINSICS[1, 1],
+        -depth,
+    ]
+
+
+def make_detection_scene() -> DynamicWorldGraph:
+    """
+    Graph with a kitchen left of the robot's camera and a bedroom right of it,
+    with a table and a few objects each, and both agents
+    """
+    graph = DynamicWorldGraph()
+    graph.add_node(House("house", {"type": "root"}))
+    for room_name, x in [("kitchen", -3.0), ("bedroom", 3.0)]:
+        room = Room(room_name, {"type": room_name, "translation": [x, 0.0, -1.5]})
+        graph.add_node(room)
+        graph.add_edge(room, "house", "inside", flip_edge("inside"))
+        table = Furniture(
+            f"table_{room_name}",
+            {
+                "type": "table",
+                "translation": [x, 0.0, -1.5],
+                "bbox_min": [x - 0.6, -1.0, -2.1],
+                "bbox_max": [x + 0.6, 0.0, -0.9],
+            },
+        )
+        graph.add_node(table)
+        graph.add_edge(table, room, "inside", flip_edge("inside"))
+        # objects known to be in the room, of a type never detected
+        for offset in [0.5, 1.5, 2.5]:
+            obj = Object(
+                f"{len(graph.graph)}_{EPISODE_OBJECTS[4]}",
+                {
+                    "type": EPISODE_OBJECTS[4],
+                    "translation": [x + np.sign(x) * offset, -0.5, -1.5],
+                },
+            )
+            graph.add_node(obj)
+            graph.add_edge(obj, room, "in", opposite_label="contains")
+    for agent_class, name, x in [(SpotRobot, "agent_0", 0.0), (Human, "agent_1", 4.0)]:
+        graph.add_agent_node_and_update_room(
+            agent_class(name, {"type": "agent", "translation": [x, 0.0, -1.5]})
+        )
+    return graph
+
+
+def sample_object_pixel(rng: random.Random) -> tuple:
+    # columns far left or far right keep the rooms more than 1.5m apart
+    x = rng.choice([rng.randrange(0, 10), rng.randrange(54, 64)])
+    return x, rng.randrange(HEIGHT // 2 - 6, HEIGHT // 2 + 6), rng.uniform(1.0, 2.0)
+
+
+def record_detection_frames(rng: random.Random, num_objects: int, num_frames: int):
+    """
+    Frames of both agents detecting objects that move around. Objects of the
+    same type stay more than 1m apart, so that each detection matches at most
+    one of them. Each frame also lists where the end-effectors are and what
+    the human holds.
+    """
+    categories = [rng.choice(CATEGORIES) for _ in range(num_objects)]
+    pixels: Dict[int, tuple] = {}
+
+    def move(index: int):
+        while True:
+            pixel = sample_object_pixel(rng)
+            position = np.array(pixel_to_world(*pixel))
+            if all(
+                (other_pixel[:2] != pixel[:2])
+                and (
+                    categories[other] != categories[index]
+                    or np.linalg.norm(np.array(pixel_to_world(*other_pixel)) - position)
+                    > 1.0
+                )
+                for other, other_pixel in pixels.items()
+                if other != index
+            ):
+                pixels[index] = pixel
+                return
+
+    for index in range(num_objects):
+        move(index)
+    frames = []
+    for _ in range(num_frames):
+        for index in rng.sample(range(num_objects), num_objects // 4):
+            if rng.random() < 0.5:
+                # small move, seen as the same object
+                x, y, depth = pixels[index]
+                pixels[index] = (x, y, depth + rng.uniform(-0.05, 0.05))
+            else:
+                move(index)
+        visible = {
+            uid: rng.sample(range(num_objects), num_objects // 2) for uid in [0, 1]
+        }
+        depth = np.zeros((HEIGHT, WIDTH, 1), dtype=np.float32)
+        for index in visible[0]:
+            x, y, object_depth = pixels[index]
+            depth[y, x] = object_depth
+        held = visible[1][0] if rng.random() < 0.3 else None
+        ee_positions = [
+            [0.0, 10.0, 0.0],
+            pixel_to_world(*pixels[held]) if held is not None else [0.0, 10.0, 0.0],
+        ]
+        detector_frames = {
+            0: {
+                "object_category_mapping": {
+                    index: categories[index] for index in visible[0]
+                },
+                "object_handle_mapping": {
+                    index: f"handle_{index}" for index in visible[0]
+                },
+                "object_pixel_indices": {
+                    index: np.array([pixels[index][1] * WIDTH + pixels[index][0]])
+                    for index in visible[0]
+                },
+                "depth": depth,
+                "camera_intrinsics": INTRINSICS,
+                "camera_pose": np.eye(4),
+            },
+            1: {
+                # the table is not an object, and one object has no pixels
+                "object_category_mapping": {
+                    **{index: categories[index] for index in visible[1]},
+                    -1: "table",
+                    -2: CATEGORIES[0],
+                },
+                "object_handle_mapping": {
+                    **{index: f"handle_{index}" for index in visible[1]},
+                    -1: "table_handle",
+                    -2: "handle_hidden",
+                },
+                "object_pixel_indices": {
+                    **{index: np.array([0]) for index in visible[1]},
+                    -1: np.array([0]),
+                    -2: np.array([], dtype=np.int64),
+                },
+                "object_locations": {
+                    index: pixel_to_world(*pixels[index]) for index in visible[1]
+                },
+                "camera_pose": np.array(
+                    [
+                        [1.0, 0.0, 0.0, 4.0],
+                        [0.0, 1.0, 0.0, 0.0],
+                        [0.0, 0.0, 1.0, -1.5],
+                        [0.0, 0.0, 0.0, 1.0],
+                    ]
+                ),
+            },
+        }
+        frames.append((detector_frames, ee_positions, held is not None))
+    return frames
+
+
+def update_with_detected_objects_sequentially(
+    graph: DynamicWorldGraph, frame_desc: dict
+):
+    """
+    Reference for update_non_privileged_graph_with_detected_objects, checking
+    each detection against the graph in turn
+    """
+    graph.update_agent_locations(frame_desc)
+    for uid, detector_frame in frame_desc.items():
+        for object_id, category in detector_frame["object_category_mapping"].items():
+            if not graph._is_object(category):
+                continue
+            new_object_node = graph.get_object_from_obs(detector_frame, object_id, uid)
+            if new_object_node is None:
+                continue
+            closest_objects = graph.get_closest_entities(
+                graph.MAX_NEIGHBORS_FOR_ROOM_ASSIGNMENT,
+                object_node=new_object_node,
+                include_furniture=False,
+                include_rooms=False,
+            )
+            (
+                redundant_object,
+                matching_object,
+            ) = graph._non_privileged_graph_check_if_object_is_redundant(
+                new_object_node,
+                closest_objects,
+                merge_threshold=0.5 if uid == 1 else 0.25,
+            )
+            (
+                held_object,
+                held_node,
+            ) = graph._non_privileged_graph_check_if_object_is_held(new_object_node)
+            if redundant_object or held_object:
+                if matching_object is None:
+                    matching_object = held_node
+                if matching_object is not None:
+                    graph.set_node_translation(
+                        matching_object, new_object_node.properties["translation"]
+                    )
+                continue
+            graph.add_node(new_object_node)
+            furniture, relation = graph._cg_check_for_relation(new_object_node)
+            if furniture is not None:
+                graph.add_edge(
+                    furniture, new_object_node, relation, flip_edge(relation)
+                )
+            else:
+                graph._assign_room_from_closest_objects(
+                    new_object_node, closest_objects
+                )
+
+
+def test_frames_that_are_not_keyframes_only_move_agents():
+    graph = make_detection_scene()
+    graph.set_articulated_agents(
+        {
+            uid: SimpleNamespace(
+                ee_transform=lambda: SimpleNamespace(translation=[0.0, 10.0, 0.0])
+            )
+            for uid in [0, 1]
+        }
+    )
+    frames = record_detection_frames(random.Random(0), num_objects=10, num_frames=2)
+    graph.update_non_privileged_graph_with_detected_objects(frames[0][0])
+    num_nodes = len(graph.graph)
+
+    frame_desc = frames[1][0]
+    camera_pose = frame_desc[1]["camera_pose"].copy()
+    camera_pose[:3, 3] = [-3.0, 0.0, -1.0]
+    frame_desc[1] = {
+        "is_keyframe": False,
+        "object_pixel_indices": {},
+        "object_category_mapping": {},
+        "object_handle_mapping": {},
+        "camera_pose": camera_pose,
+    }
+    graph.update_non_privileged_graph_with_detected_objects(frame_desc)
+    human = graph.get_node_from_name("agent_1")
+    assert human.properties["translation"] == [-3.0, 0.0, -1.0]
+    assert [room.name for room in graph.get_neighbors_of_type(human, Room)] == [
+        "kitchen"
+    ]
+    # only the robot's detections were associated
+    num_new_objects = len(graph.graph) - num_nodes
+    frame_desc[0]["is_keyframe"] = False
+    graph.update_non_privileged_graph_with_detected_objects(frame_desc)
+    assert len(graph.graph) == num_nodes + num_new_objects
+
+
+def get_detection_graph_state(graph: DynamicWorldGraph) -> dict:
+    return {
+        node.name: (
+            type(node),
+            {
+                key: np.asarray(value).tolist()
+                if key == "camera_pose_of_view"
+                else value
+                for key, value in node.properties.items()
+                if key not in ["time_of_update", "last_held_object"]
+            },
+            {neighbor.name: label for neighbor, label in edges.items()},
+        )
+        for node, edges in graph.graph.items()
+    }
+
+
+def test_batched_detection_association_matches_sequential():
+    frames = record_detection_frames(random.Random(0), num_objects=24, num_frames=15)
+    graphs = [make_detection_scene() for _ in range(2)]
+    ee_positions: List[List[float]] = [[0.0, 10.0, 0.0], [0.0, 10.0, 0.0]]
+    for graph in graphs:
+        graph.set_articulated_agents(
+            {
+                uid: SimpleNamespace(
+                    ee_transform=lambda uid=uid: SimpleNamespace(
+                        translation=ee_positions[uid]
+                    )
+                )
+                for uid in [0, 1]
+            }
+        )
+
+    num_held = 0
+    for step, (frame_desc, frame_ee_positions, is_held) in enumerate(frames):
+        ee_positions[:] = frame_ee_positions
+        for graph in graphs:
+            human = graph.get_node_from_name("agent_1")
+            human.properties["last_held_object"] = None
+            objects = graph.get_all_nodes_of_type(Object)
+            if is_held and objects:
+                held_object = objects[step % len(objects)]
+                # not moved along with the human before the detections
+                held_object.properties["time_of_update"] = None
+                if graph is graphs[1]:
+                    # agents keep the node they picked, which the graph may
+                    # have cloned since
+                    held_object = copy.copy(held_object)
+                human.properties["last_held_object"] = held_object
+                num_held += 1
+        random.seed(step)
+        update_with_detected_objects_sequentially(graphs[0], frame_desc)
+        random.seed(step)
+        graphs[1].update_non_privileged_graph_with_detected_objects(frame_desc)
+        assert get_detection_graph_state(graphs[1]) == get_detection_graph_state(
+            graphs[0]
+        ), step
+    assert num_held > 0
+    # some detections were merged, some objects added in rooms and on tables
+    objects = graphs[1].get_all_nodes_of_type(Object)
+    assert 24 < len(objects) < 15 * 24
+    assert any(graphs[1].get_neighbors_of_type(obj, Room) for obj in objects)
+    assert any(graphs[1].get_neighbors_of_type(obj, Furniture) for obj in objects)
+
+
+def test_furniture_relations_test_all_furniture():
+    rng = random.Random(0)
+    graph = DynamicWorldGraph()
+    graph.add_node(House("house", {"type": "root"}))
+    graph.add_node(Floor("floor_kitchen", {"type": "floor", "translation": [0] * 3}))
+    furniture = []
+    for index in range(40):
+        center = np.array([rng.uniform(-5, 5), rng.uniform(0, 1), rng.uniform(-5, 5)])
+        extent = np.array([rng.uniform(0.1, 2.0), 0.4, rng.uniform(0.1, 2.0)])
+        fur = Furniture(
+            f"table_{index}",
+            {
+                "type": "table",
+                "translation": center.tolist(),
+                "bbox_min": (center - extent).tolist(),
+                "bbox_max": (center + extent).tolist(),
+            },
+        )
+        graph.add_node(fur)
+        furniture.append(fur)
+    translations = np.array(
+        [
+            [rng.uniform(-6, 6), rng.uniform(-1, 3), rng.uniform(-6, 6)]
+            for _ in range(500)
+        ]
+    )
+
+    relations = graph._cg_check_for_relations(translations)
+    num_related = 0
+    for point, (related_furniture, relation) in zip(translations, relations):
+        expected = []
+        for fur in furniture:
+            bbox_min = np.array(fur.properties["bbox_min"])
+            bbox_max = np.array(fur.properties["bbox_max"])
+            distance = np.linalg.norm(point - fur.properties["translation"])
+            if np.all((point >= bbox_min) & (point <= bbox_max)):
+                expected.append((distance, fur, "in"))
+            elif (
+                np.all((point[[0, 2]] >= bbox_min[[0, 2]]))
+                and np.all(point[[0, 2]] <= bbox_max[[0, 2]])
+                and 0 < point[1] - bbox_max[1] < 1.5
+            ):
+                expected.append((distance, fur, "on"))
+        if expected:
+            _, expected_furniture, expected_relation = min(
+                expected, key=lambda item: item[0]
+            )
+            assert related_furniture is expected_furniture
+            assert relation == expected_relation
+            num_related += 1
+        else:
+            assert related_furniture is None and relation is None
+    assert 0 < num_related < len(translations)
+
+    # A large table is found even with its center further than 1.5m and more
+    # than five other furniture closer
+    point = np.array([4.0, 1.2, 0.0])
+    large_table = Furniture(
+        "large_table",
+        {
+            "type": "table",
+            "translation": [0.0, 0.5, 0.0],
+            "bbox_min": [-5.0, 0.0, -0.5],
+            "bbox_max": [5.0, 1.0, 0.5],
+        },
+    )
+    graph = DynamicWorldGraph()
+    graph.add_node(large_table)
+    for index in range(6):
+        graph.add_node(
+            Furniture(
+                f"chair_{index}",
+                {
+                    "type": "chair",
+                    "translation": (point + [0.1 * index, 0.0, 1.0]).tolist(),
+                    "bbox_min": (point + [0.1 * index - 0.2, -1.2, 0.8]).tolist(),
+                    "bbox_max": (point + [0.1 * index + 0.2, -0.8, 1.2]).tolist(),
+                },
+            )
+        )
+    node = Object("cup", {"type": "cup", "translation": point.tolist()})
+    assert graph._cg_check_for_relation(node) == (large_table, "on")
+    assert graph._cg_check_for_relations(np.zeros((0, 3))) == []
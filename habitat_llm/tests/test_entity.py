@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import copy
+import json
+import pickle
+import tracemalloc
+
+from habitat_llm.world_model.entities.floor import Floor
+from habitat_llm.world_model.entities.furniture import Furniture
+from habitat_llm.world_model.entity import Entity, Object, Room
+
+
+def make_properties(index: int) -> dict:
+    # parsed from json so that repeated strings are distinct objects, as when
+    # loaded from scene metadata
+    return json.loads(
+        json.dumps(
+            {
+                "type": f"table_{index % 20}",
+                "is_articulated": False,
+                "translation": [float(index), 0.5, -float(index)],
+                "states": {"is_clean": False, "is_powered_on": True},
+            }
+        )
+    )
+
+
+def test_entity_copies_keep_class_and_properties():
+    table = Furniture("table", {"type": "table", "translation": [1.0, 2.0, 3.0]}, "h")
+    floor = Floor("floor", {"type": "floor"})
+    for entity in [table, floor, Room("kitchen", {"type": "room"})]:
+        for clone in [
+            copy.copy(entity),
+            copy.deepcopy(entity),
+            pickle.loads(pickle.dumps(entity)),
+        ]:
+            assert type(clone) is type(entity)
+            assert clone == entity
+            assert clone.sim_handle == entity.sim_handle
+            assert clone.properties == entity.properties
+            assert clone.properties is not entity.properties
+    assert not hasattr(table, "__dict__")
+
+    # entities pickled with an instance __dict__ still load
+    old_state = {"name": "cup", "properties": {"type": "cup"}, "sim_handle": "c"}
+    cup = Object.__new__(Object)
+    cup.__setstate__(old_state)
+    assert cup.name == "cup" and cup.sim_handle == "c"
+
+    # property values are interned
+    assert (
+        Furniture("a", make_properties(0)).properties["type"]
+        is Furniture("b", make_properties(20)).properties["type"]
+    )
+
+
+def test_entity_memory_per_10k_entities():
+    class DictEntity:
+        # the layout of Entity before it had __slots__ and interned values
+        def __init__(self, name, properties, sim_handle=None):
+            self.name = name
+            self.properties = properties
+            self.sim_handle = sim_handle
+
+    def measure(entity_class) -> int:
+        tracemalloc.start()
+        entities = [
+            entity_class(f"table_{index}", make_properties(index), f"handle_{index}")
+            for index in range(10000)
+        ]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(entities) == 10000
+        return size
+
+    before = measure(DictEntity)
+    after = measure(Furniture)
+    # about 9% smaller (11.6 MB to 10.6 MB), most of it is the properties dicts
+    assert after < 0.95 * before
+    assert issubclass(Furniture, Entity)
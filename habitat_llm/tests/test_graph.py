@@ -4,10 +4,25 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree
 
+import copy
+import io
+from types import SimpleNamespace
+
+import magnum as mn
+import numpy as np
 import pytest
 
-from habitat_llm.world_model.entity import Entity
+from habitat_llm.world_model.entities.floor import Floor
+from habitat_llm.world_model.entities.furniture import Furniture
+from habitat_llm.world_model.entity import Entity, House, Human, Object, Room
 from habitat_llm.world_model.graph import Graph
+from habitat_llm.world_model.world_graph import WorldGraph
+
+
+@pytest.fixture(autouse=True)
+def check_graph_consistency(monkeypatch):
+    # verify the graph lookup indices after every mutation in these tests
+    monkeypatch.setattr(Graph, "consistency_checks_enabled", True)
 
 
 def test_get_node_from_name():
@@ -127,3 +142,409 @@ def test_remove_edge():
     assert len(graph.graph[test_nodes[2]]) == 0
     assert len(graph.graph[test_nodes[3]]) == 0
     assert len(graph.graph[test_nodes[4]]) == 0
+
+
+def test_lookup_indices_stay_consistent():
+    graph = Graph()
+    test_nodes = []
+    for index in range(5):
+        test_nodes.append(
+            Entity(f"test{index}", {"type": "test_node"}, sim_handle=f"handle{index}")
+        )
+        graph.add_node(test_nodes[-1])
+    graph.add_edge(test_nodes[1], test_nodes[0], "test_edge")
+
+    # removing and popping nodes drops them from the indices
+    graph.remove_node("test1")
+    graph.pop_node(test_nodes[2])
+    assert not graph.has_node("test1")
+    assert not graph.has_node("test2")
+    assert not graph.has_node_with_sim_handle("handle1")
+    with pytest.raises(ValueError):
+        graph.get_node_from_sim_handle("handle2")
+    assert graph.get_node_from_name("test3") == test_nodes[3]
+
+    # nodes sharing a sim_handle resolve to the first one inserted
+    duplicate = Entity("duplicate", {"type": "test_node"}, sim_handle="handle0")
+    graph.add_node(duplicate)
+    assert graph.get_node_from_sim_handle("handle0") is test_nodes[0]
+    graph.remove_node(test_nodes[0])
+    assert graph.get_node_from_sim_handle("handle0") is duplicate
+
+    # reassigned sim_handle is found, and the old one is not
+    assert graph.set_node_sim_handle("test4", "new_handle") is test_nodes[4]
+    assert graph.get_node_from_sim_handle("new_handle") is test_nodes[4]
+    assert not graph.has_node_with_sim_handle("handle4")
+    assert not graph.has_node_with_sim_handle("missing")
+
+    # merged-in nodes and deep copies are indexed
+    other_graph = Graph()
+    other_graph.add_node(Entity("other", {"type": "test_node"}, sim_handle="other"))
+    graph.merge(other_graph)
+    assert graph.get_node_from_sim_handle("other").name == "other"
+    graph_copy = copy.deepcopy(graph)
+    for node in graph.graph:
+        assert graph_copy.get_node_from_name(node.name) is not node
+        assert graph_copy.get_node_from_sim_handle(node.sim_handle).name == node.name
+
+
+def test_get_all_nodes_of_type_keeps_graph_order():
+    graph = Graph()
+    test_nodes = [
+        Furniture("table", {"type": "test_node"}),
+        Floor("floor", {"type": "test_node"}),
+        Object("cup", {"type": "test_node"}),
+        Furniture("chair", {"type": "test_node"}),
+        Floor("floor_kitchen", {"type": "test_node"}),
+    ]
+    for node in test_nodes:
+        graph.add_node(node)
+
+    # subclasses are included and interleaved in insertion order
+    assert graph.get_all_nodes_of_type(Furniture) == [
+        node for node in graph.graph if isinstance(node, Furniture)
+    ]
+    assert graph.get_all_nodes_of_type(Floor) == [test_nodes[1], test_nodes[4]]
+    assert graph.get_all_nodes_of_type((Object, Floor)) == test_nodes[1:3] + [
+        test_nodes[4]
+    ]
+    assert graph.count_nodes_of_type(Furniture) == 4
+    assert graph.get_all_nodes_of_type(Human) is None
+
+    graph.remove_node("table")
+    graph.pop_node("floor_kitchen")
+    assert graph.get_all_nodes_of_type(Furniture) == [test_nodes[1], test_nodes[3]]
+    assert graph.count_nodes_of_type(Floor) == 1
+
+    # re-added nodes move to the end, like in the adjacency dict
+    graph.add_node(test_nodes[0])
+    assert graph.get_all_nodes_of_type(Entity) == list(graph.graph)
+
+
+def test_merge_reports_changes():
+    graph = Graph()
+    table = Furniture("table", {"type": "test_node", "translation": [0, 0, 0]})
+    chair = Furniture("chair", {"type": "test_node", "translation": [1, 0, 0]})
+    cup = Object("cup", {"type": "test_node", "translation": [0, 1, 0]})
+    for node in [table, chair, cup]:
+        graph.add_node(node)
+    graph.add_edge(cup, table, "on", "under")
+
+    # the cup moved from the table to the chair and a new plate appeared
+    other_graph = Graph()
+    new_cup = Object("cup", {"type": "test_node", "translation": [1, 1, 0]})
+    plate = Object("plate", {"type": "test_node", "translation": [1, 1, 1]})
+    new_chair = Furniture("chair", {"type": "test_node", "translation": [1, 0, 0]})
+    for node in [new_cup, plate, new_chair]:
+        other_graph.add_node(node)
+    other_graph.add_edge(new_cup, new_chair, "on", "under")
+    other_graph.add_edge(plate, new_chair, "on", "under")
+
+    changes = graph.merge(other_graph, return_changes=True)
+    assert changes.added_nodes == [plate]
+    assert changes.modified_nodes == [cup]
+    assert changes.removed_edges == [(cup, table, "on")]
+    assert changes.added_edges == [(cup, chair, "on"), (plate, chair, "on")]
+    # existing nodes are kept and only their translation is updated
+    assert graph.get_node_from_name("cup") is cup
+    assert cup.properties["translation"] == [1, 1, 0]
+    assert graph.get_neighbors(cup) == {chair: "on"}
+    assert graph.get_neighbors(table) == {}
+
+    # merging the same graph again is a no-op
+    assert graph.merge(other_graph, return_changes=True).is_empty()
+    assert graph.merge(other_graph) is None
+
+
+def test_reverse_adjacency():
+    # start from a raw adjacency dict with a one-directional edge
+    table = Furniture("table", {"type": "test_node"})
+    cup = Object("cup", {"type": "test_node"})
+    plate = Object("plate", {"type": "test_node"})
+    graph = Graph({table: {}, cup: {table: "on"}, plate: {}})
+    graph.add_edge(plate, table, "on", "under")
+    graph.add_edge(plate, cup, "next to", "next to")
+
+    graph.remove_all_edges(plate)
+    assert graph.get_neighbors(table) == {}
+    assert graph.get_neighbors(cup) == {table: "on"}
+
+    graph.add_edge(plate, table, "on", "under")
+    graph.remove_node(table)
+    assert graph.get_neighbors(cup) == {}
+    assert graph.get_neighbors(plate) == {}
+
+    graph.add_edge(plate, cup, "on", "under")
+    assert graph.pop_node(cup) == {plate: "under"}
+    assert graph.get_neighbors(plate) == {}
+
+    # direct writes to the adjacency dict are caught by the checker
+    graph.graph[plate][table] = "on"
+    with pytest.raises(ValueError) as e:
+        graph.check_consistency()
+    assert "reverse edge" in str(e.value)
+
+
+def test_snapshot_copy_on_write():
+    table = Furniture("table", {"type": "test_node", "region": object()})
+    chair = Furniture("chair", {"type": "test_node"})
+    cup = Object(
+        "cup", {"type": "test_node", "translation": [0, 0, 0], "states": {}}, "cup_0"
+    )
+    plate = Object("plate", {"type": "test_node", "translation": [1, 0, 0]})
+    graph = Graph()
+    for node in [table, chair, cup, plate]:
+        graph.add_node(node)
+    graph.add_edge(cup, table, "on", "under")
+    graph.add_edge(plate, table, "on", "under")
+
+    # readers share nodes and adjacency rows
+    snapshot = graph.snapshot()
+    assert snapshot.get_node_from_name("cup") is cup
+    assert snapshot.graph[table] is graph.graph[table]
+
+    # writers clone only the nodes and rows they touch, keeping graph order
+    writable_cup = graph.get_writable_node("cup")
+    writable_cup.properties["translation"][0] = 5
+    writable_cup.set_state({"is_clean": True})
+    graph.remove_all_edges(writable_cup)
+    graph.add_edge(writable_cup, chair, "on", "under")
+    assert writable_cup is not cup
+    assert list(graph.graph) == [table, chair, writable_cup, plate]
+    assert graph.get_node_from_sim_handle("cup_0") is writable_cup
+    assert graph.get_all_nodes_of_type(Object) == [writable_cup, plate]
+    assert next(iter(graph.graph[chair])) is writable_cup
+    assert snapshot.graph[plate] is graph.graph[plate]
+    assert graph.get_writable_node(writable_cup) is writable_cup
+
+    # the snapshot still sees the old state
+    assert cup.properties == {
+        "type": "test_node",
+        "translation": [0, 0, 0],
+        "states": {},
+    }
+    assert snapshot.get_neighbors(cup) == {table: "on"}
+    assert snapshot.get_neighbors(table) == {cup: "under", plate: "under"}
+    assert snapshot.get_neighbors(chair) == {}
+
+    # writes to the snapshot don't leak back either
+    snapshot.remove_node(plate)
+    assert graph.get_neighbors(table) == {plate: "under"}
+
+    # adopting shared nodes through merge clones them
+    other_graph = Graph()
+    other_graph.merge(snapshot)
+    assert other_graph.get_node_from_name("chair") is not chair
+
+    # regions are shared by deep copies instead of being copied
+    graph_copy = copy.deepcopy(graph)
+    copied_table = graph_copy.get_node_from_name("table")
+    assert copied_table is not table
+    assert copied_table.properties["region"] is table.properties["region"]
+    assert "region" in table.properties
+
+
+def test_containment_tree():
+    graph = Graph()
+    house = House("house", {"type": "root"})
+    kitchen = Room("kitchen", {"type": "room"})
+    bedroom = Room("bedroom", {"type": "room"})
+    table = Furniture("table", {"type": "furniture"})
+    cup = Object("cup", {"type": "object"})
+    human = Human("human", {"type": "agent"})
+    for node in [house, kitchen, bedroom, table, cup, human]:
+        graph.add_node(node)
+    graph.add_edge(kitchen, house, "inside", "has")
+    graph.add_edge(bedroom, house, "inside", "has")
+    graph.add_edge(table, kitchen, "inside", "contains")
+    graph.add_edge(human, bedroom, "inside", "contains")
+    graph.add_edge(cup, table, "on", "under")
+
+    assert graph.get_parent(cup) == table
+    assert graph.get_parent(house) is None
+    assert graph.get_path_to_root("cup") == [cup, table, kitchen, house]
+    assert graph.get_common_ancestor(cup, human) == house
+    assert graph.get_common_ancestor(cup, "table") == table
+
+    # the parent is the closest enclosing level, whatever the edge order
+    graph.add_edge(cup, kitchen, "in", "contains")
+    assert graph.get_parent(cup) == table
+
+    # parent pointers follow edge changes
+    graph.remove_edge(cup, table)
+    assert graph.get_parent(cup) == kitchen
+    graph.remove_all_edges(cup)
+    graph.add_edge(cup, human, "held_by", "holding")
+    assert graph.get_path_to_root(cup) == [cup, human, bedroom, house]
+    graph.remove_node(bedroom)
+    assert graph.get_path_to_root(cup) == [cup, human]
+    assert graph.get_common_ancestor(cup, table) is None
+
+    # snapshots keep their own tree
+    snapshot = graph.snapshot()
+    snapshot.add_edge(human, kitchen, "inside", "contains")
+    assert snapshot.get_path_to_root(cup)[-1] == house
+    assert graph.get_path_to_root(cup)[-1] == human
+
+
+def test_room_versions():
+    graph = Graph()
+    house = House("house", {"type": "root"})
+    kitchen = Room("kitchen", {"type": "room"})
+    bedroom = Room("bedroom", {"type": "room"})
+    table = Furniture("table", {"type": "furniture"})
+    cup = Object("cup", {"type": "object"})
+    for node in [house, kitchen, bedroom, table, cup]:
+        graph.add_node(node)
+    graph.add_edge(kitchen, house, "inside", "has")
+    graph.add_edge(bedroom, house, "inside", "has")
+    graph.add_edge(table, kitchen, "inside", "contains")
+    room_versions = graph.get_room_versions()
+    version = graph.version
+
+    # re-adding an existing edge changes nothing
+    graph.add_edge(table, kitchen, "inside", "contains")
+    assert graph.version == version
+    assert room_versions == {}
+
+    graph.add_edge(cup, table, "on", "under")
+    assert graph.version > version
+    assert set(room_versions) == {None, "kitchen"}
+
+    # moving the table marks both the room it left and the one it entered
+    version = graph.version
+    graph.remove_edge(table, kitchen)
+    graph.add_edge(table, bedroom, "inside", "contains")
+    assert graph.get_room_name(cup) == "bedroom"
+    assert room_versions["kitchen"] > version
+    assert room_versions["bedroom"] > version
+
+    # replacing the adjacency dict starts over
+    graph.graph = dict(graph.graph)
+    assert graph.get_room_versions() is not room_versions
+
+
+def assert_same_properties(loaded_node: Entity, node: Entity):
+    assert list(loaded_node.properties) == list(node.properties)
+    for key, value in node.properties.items():
+        loaded_value = loaded_node.properties[key]
+        if isinstance(value, np.ndarray):
+            assert loaded_value.dtype == value.dtype
+            np.testing.assert_array_equal(loaded_value, value)
+        elif isinstance(value, Entity):
+            assert type(loaded_value) is type(value)
+            assert loaded_value.name == value.name
+        elif isinstance(value, np.generic):
+            assert loaded_value == value
+        else:
+            assert type(loaded_value) is type(value)
+            assert loaded_value == value
+
+
+def test_snapshot_file_round_trip(tmp_path):
+    graph = WorldGraph()
+    graph.world_model_type = "concept_graph"
+    kitchen_region = SimpleNamespace(id="kitchen_region")
+    house = House("house", {"type": "root"}, "house_0")
+    kitchen = Room("kitchen", {"type": "room", "translation": [1.0, 0.0, 2.5]})
+    table = Furniture(
+        "table",
+        {
+            "type": "table",
+            "is_articulated": False,
+            "translation": mn.Vector3(1.0, 0.5, 2.0),
+            "bbox_min": np.zeros(3, dtype=np.float32),
+            "components": [],
+            "states": {"is_clean": True, "is_filled": False},
+            "region": kitchen_region,
+            "sampler": object(),
+        },
+        "table_handle",
+    )
+    sink = Furniture(
+        "sink",
+        {
+            "type": "sink",
+            "is_articulated": True,
+            "translation": mn.Vector3(3.0, 0.5, 2.0),
+            "bbox_min": np.ones(3, dtype=np.float32),
+            "components": ["faucet", "drain"],
+            "region": kitchen_region,
+        },
+        "sink_handle",
+    )
+    floor = Floor("floor_kitchen", {"type": "floor", "extent": (1, 2)})
+    cup = Object(
+        "cup",
+        {
+            "type": "cup",
+            "translation": [1.0, 1.0, 2.0],
+            "states": {"is_clean": False},
+            "time_of_update": 12.5,
+            "count": 3,
+        },
+    )
+    plate = Object(
+        "plate",
+        {
+            "translation": [1.5, 1.0, 2.0],
+            "type": "plate",
+            "states": {"is_filled": True, "is_clean": True},
+            "count": 2**70,
+        },
+    )
+    human = Human(
+        "agent_1", {"type": "agent", "last_held_object": cup, "steps": np.int64(4)}
+    )
+    for node in [house, kitchen, table, sink, floor, cup, plate, human]:
+        graph.add_node(node)
+    graph.add_edge(kitchen, house, "inside", "contains")
+    graph.add_edge(table, kitchen, "inside", "contains")
+    graph.add_edge(sink, kitchen, "inside", "contains")
+    graph.add_edge(floor, kitchen, "inside", None)
+    graph.add_edge(cup, table, "on", "under")
+    graph.add_edge(plate, table, "on", "under")
+
+    path = str(tmp_path / "graph.snapshot")
+    dropped = graph.save_snapshot(path)
+    assert dropped == {"table": ["sampler"]}
+    del table.properties["sampler"]
+    # sim regions are reattached from the scene
+    with pytest.raises(ValueError) as e:
+        WorldGraph.load_snapshot(path)
+    assert "Can't find the region kitchen_region" in str(e.value)
+    loaded = WorldGraph.load_snapshot(path, {"kitchen_region": kitchen_region})
+
+    assert loaded.world_model_type == "concept_graph"
+    assert [node.name for node in loaded.graph] == [node.name for node in graph.graph]
+    for node, edges in graph.graph.items():
+        loaded_node = loaded.get_node_from_name(node.name)
+        assert type(loaded_node) is type(node)
+        assert loaded_node.sim_handle == node.sim_handle
+        assert {n.name: label for n, label in loaded.graph[loaded_node].items()} == {
+            n.name: label for n, label in edges.items()
+        }
+        if node.name != "floor_kitchen":
+            assert_same_properties(loaded_node, node)
+    assert loaded.get_node_from_name("floor_kitchen").properties["extent"] == [1, 2]
+    assert loaded.get_node_from_name("cup").properties["count"] == 3
+    assert loaded.get_node_from_name("table").properties["region"] is kitchen_region
+    # entity-valued properties refer to the loaded nodes
+    last_held_object = loaded.get_node_from_name("agent_1").properties[
+        "last_held_object"
+    ]
+    assert last_held_object is loaded.get_node_from_name("cup")
+    assert loaded.get_node_from_sim_handle("floor") == floor
+
+    # snapshots from a newer format are rejected
+    buffer = io.BytesIO()
+    Graph().save_snapshot(buffer)
+    buffer.seek(0)
+    archive = dict(np.load(buffer))
+    archive["metadata"] = np.frombuffer(b'{"format_version": 99}', dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez(buffer, **archive)
+    buffer.seek(0)
+    with pytest.raises(ValueError) as e:
+        Graph.load_snapshot(buffer)
+    assert "Unsupported world graph snapshot version 99" in str(e.value)
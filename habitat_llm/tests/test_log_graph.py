@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import json
+import random
+
+import pytest
+
+from habitat_llm.agent.env.log_graph import (
+    GRAPH_KEYS,
+    LogSystem,
+    load_world_graph_log,
+    replay_world_graph_log,
+)
+from habitat_llm.world_model import (
+    Furniture,
+    House,
+    Human,
+    Object,
+    Room,
+    SpotRobot,
+    WorldGraph,
+)
+from habitat_llm.world_model.world_graph import flip_edge
+
+
+def make_logged_graph(rng: random.Random, num_objects: int) -> WorldGraph:
+    """
+    Graph of a house with two rooms, a table in each, both agents in the kitchen
+    and objects on random tables
+    """
+    graph = WorldGraph()
+    graph.add_node(House("house", {"type": "root"}))
+    for room_name in ["kitchen", "bedroom"]:
+        room = Room(room_name, {"type": room_name})
+        graph.add_node(room)
+        graph.add_edge(room, "house", "inside", flip_edge("inside"))
+        table = Furniture(f"table_{room_name}", {"type": "table"})
+        graph.add_node(table)
+        graph.add_edge(table, room, "inside", flip_edge("inside"))
+    for agent in [SpotRobot("agent_0", {"type": "agent"}), Human("agent_1", {})]:
+        graph.add_node(agent)
+        graph.add_edge(agent, "kitchen", "in", flip_edge("in"))
+    for index in range(num_objects):
+        obj = Object(f"cup_{index}", {"type": "cup"})
+        graph.add_node(obj)
+        table = rng.choice(["table_kitchen", "table_bedroom"])
+        graph.add_edge(obj, table, "on", flip_edge("on"))
+    return graph
+
+
+def test_log_system_appends_steps(tmp_path):
+    rng = random.Random(0)
+    logger = LogSystem(str(tmp_path), run_name="episode", fsync_interval=4)
+    expected = []
+    for step in range(1, 11):
+        graphs = [make_logged_graph(rng, rng.randrange(5)) for _ in range(3)]
+        logger.log_world_graphs(*graphs)
+        expected.append(
+            {
+                "Step": step,
+                **{
+                    key: logger.dot_to_json(graph.to_dot())
+                    for key, graph in zip(
+                        ["WorldGraph", "RobotWorldGraph", "HumanWorldGraph"], graphs
+                    )
+                },
+            }
+        )
+        # each step is readable as soon as it is logged
+        assert load_world_graph_log(logger.output_json_file) == expected
+    logger.close()
+
+    # a log cut short during a write keeps its complete steps, and logging to
+    # it again continues from its last step
+    with open(logger.output_json_file, "a") as file:
+        file.write('{"Step": 11, "WorldGr')
+    assert load_world_graph_log(logger.output_json_file) == expected
+    logger = LogSystem(str(tmp_path), run_name="episode")
+    assert logger.num_of_step == 11
+    logger.log_world_graphs(*graphs)
+    logger.close()
+    records = load_world_graph_log(logger.output_json_file)
+    assert records == expected + [dict(expected[-1], Step=11)]
+
+    with open(logger.output_txt_file) as file:
+        text = file.read()
+    assert all(f"<<<<<<<<<<<Step #{step}>>>" in text for step in range(1, 12))
+    assert "Error" not in text and expected[0]["WorldGraph"]
+
+
+def test_edge_lists_match_parsed_dot(tmp_path):
+    rng = random.Random(1)
+    logger = LogSystem(str(tmp_path), run_name="episode")
+    graph = WorldGraph()
+    assert graph.to_edge_lists() == logger.dot_to_json(graph.to_dot()) == {}
+    for num_objects in [0, 1, 20]:
+        graph = make_logged_graph(rng, num_objects)
+        # nodes without edges are left out of both
+        graph.add_node(Object("isolated_cup", {"type": "cup"}))
+        graph.remove_all_edges("table_bedroom")
+        edge_lists = graph.to_edge_lists()
+        parsed = logger.dot_to_json(graph.to_dot())
+        assert edge_lists == parsed
+        assert list(edge_lists) == list(parsed)
+    logger.close()
+
+
+def test_delta_log_replays_every_step(tmp_path):
+    rng = random.Random(2)
+    graph = make_logged_graph(rng, 10)
+    logger = LogSystem(str(tmp_path), run_name="episode", keyframe_interval=4)
+    expected = []
+    for step in range(1, 11):
+        # move, add and remove objects between steps
+        cup = graph.get_node_from_name(f"cup_{rng.randrange(10)}")
+        graph.remove_all_edges(cup)
+        table = rng.choice(["table_kitchen", "table_bedroom"])
+        graph.add_edge(cup, table, "on", flip_edge("on"))
+        new_cup = Object(f"new_cup_{step}", {"type": "cup"})
+        graph.add_node(new_cup)
+        graph.add_edge(new_cup, "table_kitchen", "on", flip_edge("on"))
+        if step % 3 == 0:
+            graph.remove_node(graph.get_node_from_name(f"new_cup_{step - 1}"))
+        logger.log_world_graphs(graph, graph, graph)
+        expected.append(
+            {"Step": step, **{key: graph.to_edge_lists() for key in GRAPH_KEYS}}
+        )
+    logger.close()
+    # a new logger starts from a keyframe
+    logger = LogSystem(str(tmp_path), run_name="episode", keyframe_interval=4)
+    logger.log_world_graphs(graph, graph, graph)
+    logger.close()
+    expected.append(dict(expected[-1], Step=11))
+
+    with open(logger.output_json_file) as file:
+        records = [json.loads(line) for line in file]
+    assert [record["Keyframe"] for record in records] == [
+        *[True, False, False, False] * 2,
+        True,
+        False,
+        True,
+    ]
+    assert records[1]["WorldGraph"]["removed"] == []
+    assert records[2]["WorldGraph"]["removed"] == ["Object[name=new_cup_2, type=cup]"]
+    assert len(records[1]["WorldGraph"]["changed"]) < len(expected[1]["WorldGraph"])
+
+    assert load_world_graph_log(logger.output_json_file) == expected
+    for record in expected:
+        assert replay_world_graph_log(logger.output_json_file, record["Step"]) == record
+    with pytest.raises(ValueError):
+        replay_world_graph_log(logger.output_json_file, 12)
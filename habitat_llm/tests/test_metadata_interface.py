@@ -4,10 +4,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree
 
+import os
+import random
 from os import path as osp
+from typing import Dict, List, Tuple
 
 import habitat.datasets.rearrange.samplers.receptacle as hab_receptacle
 import habitat.sims.habitat_simulator.sim_utilities as sutils
+import pandas as pd
 import pytest
 from habitat_sim import Simulator
 from habitat_sim.metadata import MetadataMediator
@@ -15,7 +19,37 @@ from habitat_sim.utils.settings import default_sim_settings, make_cfg
 
 # use this for the additional object paths
 from dataset_generation.benchmark_generation.generate_episodes import default_gen_config
-from habitat_llm.sims.metadata_interface import MetadataInterface, default_metadata_dict
+from habitat_llm.sims.metadata_interface import (
+    MetadataError,
+    MetadataInterface,
+    default_metadata_dict,
+)
+
+
+def write_metadata_files(
+    folder: str, static_rows: List[Tuple[str, str]], object_rows: List[Tuple[str, str]]
+) -> Dict[str, str]:
+    """
+    Writes metadata files with the given (handle, type) rows of furniture and
+    objects to folder and returns the matching metadata dict
+    """
+    pd.DataFrame(static_rows, columns=["id", "main_category"]).to_csv(
+        os.path.join(folder, "fpmodels.csv"), index=False
+    )
+    pd.DataFrame(object_rows, columns=["id", "clean_category"]).to_csv(
+        os.path.join(folder, "objects.csv"), index=False
+    )
+    with open(os.path.join(folder, "room_objects.json"), "w") as f:
+        f.write('{"Kitchen": ["cup"]}')
+    with open(os.path.join(folder, "affordances.csv"), "w") as f:
+        f.write("is_clean,,cup\n")
+    return {
+        "metadata_folder": folder,
+        "obj_metadata": "objects.csv",
+        "room_objects_json": "room_objects.json",
+        "staticobj_metadata": "fpmodels.csv",
+        "object_affordances": "affordances.csv",
+    }
 
 
 @pytest.mark.skipif(
@@ -143,3 +177,39 @@ def test_ovmm_source_objects():
     assert (
         len(unfound_objects) == 0
     ), f"Found {len(unfound_objects)}/{len(dynamic_object_hashes)} hashes without templates in dynamic asset sets: {unfound_objects}"
+
+
+def test_metadata_property_lookups_match_dataframe(tmp_path):
+    rng = random.Random(0)
+    types = ["table", "chair", "", None]
+    static_rows = [(f"hash{index}", rng.choice(types)) for index in range(200)]
+    # some hashes appear in both files or twice in one
+    object_rows = [(f"hash{rng.randrange(300)}", rng.choice(types)) for _ in range(200)]
+    mi = MetadataInterface(
+        write_metadata_files(str(tmp_path), static_rows, object_rows)
+    )
+
+    def lookup_with_dataframe(handle: str, metadata_field: str):
+        # the lookup as it was done before hashes were indexed
+        handle_hash = handle.rpartition("_")[0]
+        object_row = mi.metadata.loc[mi.metadata["handle"] == handle_hash]
+        if object_row.empty:
+            raise MetadataError(f"Handle {handle} not found in the metadata.")
+        if (
+            object_row[metadata_field].notna().any()
+            and (object_row[metadata_field] != "").any()
+        ):
+            return object_row[metadata_field].values[0]
+        return "unknown"
+
+    for index in range(350):
+        handle = f"hash{index}_:0000"
+        for field in ["type", "handle"]:
+            try:
+                expected = lookup_with_dataframe(handle, field)
+            except MetadataError:
+                with pytest.raises(MetadataError):
+                    mi.get_object_property_from_metadata(handle, field)
+                continue
+            value = mi.get_object_property_from_metadata(handle, field)
+            assert value == expected or (pd.isna(value) and pd.isna(expected))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import numpy as np
+import pytest
+import torch
+
+from habitat_llm.perception.keyframe_policy import KeyframePolicy
+from habitat_llm.perception.perception_obs import (
+    decompose_panoptic_image,
+    get_panoptic_ids,
+)
+from habitat_llm.utils.geometric import (
+    _get_ray_grid,
+    unproject_depth_at_pixel_indices,
+    unproject_depth_instances,
+    unproject_masked_depth_to_xyz_coordinates,
+)
+
+
+def make_panoptic_image(
+    rng: np.random.Generator, height: int, width: int, num_instances: int
+) -> np.ndarray:
+    """
+    (H, W, 1) panoptic image of overlapping rectangles, with sim object ids
+    offset by 100 as in the panoptic sensor
+    """
+    panoptic = np.zeros((height, width, 1), dtype=np.int32)
+    for index in range(num_instances):
+        y, x = rng.integers(0, height), rng.integers(0, width)
+        h, w = rng.integers(1, height // 4 + 2), rng.integers(1, width // 4 + 2)
+        panoptic[y : y + h, x : x + w] = 101 + 3 * index
+    return panoptic
+
+
+@pytest.mark.parametrize("num_instances", [0, 1, 50])
+def test_decompose_panoptic_image_matches_masks(num_instances):
+    rng = np.random.default_rng(num_instances)
+    panoptic = make_panoptic_image(rng, 48, 64, num_instances)
+    instances = decompose_panoptic_image(panoptic)
+
+    expected_ids = [idx for idx in np.unique(panoptic).tolist() if idx != 0]
+    assert instances.ids.tolist() == expected_ids
+    assert get_panoptic_ids(panoptic).tolist() == expected_ids
+    assert len(instances.pixel_indices) == len(expected_ids)
+    for instance, obj_idx in enumerate(expected_ids):
+        mask = panoptic[..., 0] == obj_idx
+        assert instances.pixel_indices[instance].tolist() == (
+            np.flatnonzero(mask).tolist()
+        )
+        assert instances.pixel_counts[instance] == mask.sum()
+        ys, xs = np.nonzero(mask)
+        assert instances.bboxes[instance].tolist() == [
+            xs.min(),
+            ys.min(),
+            xs.max(),
+            ys.max(),
+        ]
+
+    # Resampled to another resolution with nearest neighbor
+    resampled = decompose_panoptic_image(panoptic, (96, 32))
+    expected = np.repeat(panoptic[:, ::2, 0], 2, axis=0)
+    for obj_idx, pixels in zip(resampled.ids.tolist(), resampled.pixel_indices):
+        assert pixels.tolist() == np.flatnonzero(expected == obj_idx).tolist()
+
+
+def test_unproject_pixel_indices_matches_masked_unprojection():
+    rng = np.random.default_rng(0)
+    height, width = 48, 64
+    instances = decompose_panoptic_image(make_panoptic_image(rng, height, width, 5))
+    depth = rng.uniform(0.5, 5.0, size=(height, width, 1)).astype(np.float32)
+    pose = np.eye(4)
+    pose[:3, :3] = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+    pose[:3, 3] = rng.normal(size=3)
+    inv_intrinsics = np.linalg.inv(
+        np.array([[40.0, 0.0, width / 2], [0.0, 40.0, height / 2], [0.0, 0.0, 1.0]])
+    )
+
+    _get_ray_grid.cache_clear()
+    all_points, centroids = unproject_depth_instances(
+        torch.from_numpy(depth[..., 0]),
+        torch.from_numpy(pose),
+        torch.from_numpy(inv_intrinsics),
+        [torch.from_numpy(pixels) for pixels in instances.pixel_indices],
+    )
+    assert len(all_points) == len(instances.pixel_indices) == len(centroids)
+
+    for instance, pixels in enumerate(instances.pixel_indices):
+        mask = np.ones((1, 1, height, width), dtype=bool)
+        mask.reshape(-1)[pixels] = False
+        expected = unproject_masked_depth_to_xyz_coordinates(
+            torch.from_numpy(depth.reshape(1, 1, height, width)),
+            torch.from_numpy(pose.reshape(1, 4, 4)),
+            torch.from_numpy(inv_intrinsics.reshape(1, 3, 3)),
+            torch.from_numpy(mask),
+        )
+        xyz = unproject_depth_at_pixel_indices(
+            torch.from_numpy(depth[..., 0]),
+            torch.from_numpy(pose),
+            torch.from_numpy(inv_intrinsics),
+            torch.from_numpy(pixels),
+        )
+        assert torch.allclose(xyz, expected)
+        assert torch.allclose(all_points[instance], expected)
+        assert torch.allclose(centroids[instance], expected.mean(dim=0))
+    # The rays are computed once for the camera
+    assert _get_ray_grid.cache_info().misses == 1
+
+    points, centroids = unproject_depth_instances(
+        torch.from_numpy(depth[..., 0]),
+        torch.from_numpy(pose),
+        torch.from_numpy(inv_intrinsics),
+        [],
+    )
+    assert points == [] and centroids.shape == (0, 3)
+
+
+def make_camera_pose(x: float, yaw: float) -> np.ndarray:
+    """
+    Camera at (x, 1, 0) turned by yaw degrees around the vertical axis
+    """
+    pose = np.eye(4)
+    angle = np.radians(yaw)
+    pose[:3, :3] = [
+        [np.cos(angle), 0.0, np.sin(angle)],
+        [0.0, 1.0, 0.0],
+        [-np.sin(angle), 0.0, np.cos(angle)],
+    ]
+    pose[:3, 3] = [x, 1.0, 0.0]
+    return pose
+
+
+def test_keyframe_policy():
+    policy = KeyframePolicy(
+        enabled=True,
+        min_translation=0.1,
+        min_rotation=10.0,
+        min_changed_ids=2,
+        max_skipped_steps=3,
+    )
+    ids = np.array([101, 102, 103])
+    # first frame of each agent
+    assert policy.is_keyframe(0, make_camera_pose(0.0, 0.0), ids)
+    assert policy.is_keyframe(1, make_camera_pose(5.0, 0.0), ids)
+    # small moves add up from the last keyframe
+    assert not policy.is_keyframe(0, make_camera_pose(0.05, 0.0), ids)
+    assert policy.is_keyframe(0, make_camera_pose(0.1, 0.0), ids)
+    assert not policy.is_keyframe(0, make_camera_pose(0.1, 9.0), ids)
+    assert policy.is_keyframe(0, make_camera_pose(0.1, 10.5), ids)
+    # one id appearing is not enough, one appearing and one disappearing is
+    assert not policy.is_keyframe(0, make_camera_pose(0.1, 10.5), ids[:2])
+    assert policy.is_keyframe(0, make_camera_pose(0.1, 10.5), [101, 102, 104])
+    # at most max_skipped_steps frames in a row are skipped
+    decisions = [
+        policy.is_keyframe(0, make_camera_pose(0.1, 10.5), [101, 102, 104])
+        for _ in range(8)
+    ]
+    assert decisions == [False, False, False, True] * 2
+    # agent 1 still compares to its own keyframe
+    assert not policy.is_keyframe(1, make_camera_pose(5.05, 0.0), ids)
+    assert policy.num_frames == 17 and policy.num_keyframes == 7
+
+    policy.reset()
+    assert policy.is_keyframe(1, make_camera_pose(5.05, 0.0), ids)
+
+    disabled = KeyframePolicy(enabled=False)
+    assert all(
+        disabled.is_keyframe(0, make_camera_pose(0.0, 0.0), ids) for _ in range(5)
+    )
+    with pytest.raises(ValueError):
+        KeyframePolicy(min_rotation=-1.0)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import copy
+import random
+from types import SimpleNamespace
+
+from habitat_llm.perception.perception_sim import PerceptionSim
+from habitat_llm.world_model import Furniture, Object, Receptacle, Room
+from habitat_llm.world_model.world_graph import flip_edge
+
+NUM_FURNITURE = 10
+NUM_OBJECTS = 30
+# objects above this height lie on the floor of their room
+FLOOR_HEIGHT = 5.0
+
+
+class FakeRigidObjectManager:
+    def __init__(self):
+        self.objects = {}
+
+    def get_object_by_handle(self, handle):
+        return self.objects[handle]
+
+
+class FakeAgentsManager:
+    def __init__(self, agent_names, agent_data):
+        self.agent_names = agent_names
+        self._all_agent_data = agent_data
+
+    def __getitem__(self, agent_id):
+        return self._all_agent_data[agent_id]
+
+
+class FakeRegion:
+    """
+    Region spanning min_x <= x < max_x and -5 <= z <= 5
+    """
+
+    def __init__(self, region_id, min_x, max_x):
+        self.id = region_id
+        self.min_x = min_x
+        self.max_x = max_x
+        self.poly_loop_points = [
+            [min_x, 0.0, -5.0],
+            [max_x, 0.0, -5.0],
+            [max_x, 0.0, 5.0],
+            [min_x, 0.0, 5.0],
+        ]
+
+    def contains(self, point):
+        return self.min_x <= point[0] < self.max_x and -5.0 <= point[2] <= 5.0
+
+
+def make_fake_sim(
+    rng: random.Random,
+    num_objects: int = NUM_OBJECTS,
+    num_furniture: int = NUM_FURNITURE,
+):
+    """
+    Builds the parts of a RearrangeSim that PerceptionSim updates from: object
+    poses, agent poses, regions and object states. Furniture i stands at
+    x = 2 * i, and the scene is split into two regions at x = num_furniture.
+    """
+    rom = FakeRigidObjectManager()
+    for index in range(num_objects):
+        rom.objects[f"object_{index}"] = SimpleNamespace(
+            translation=random_object_position(rng, num_furniture)
+        )
+    agents = [
+        SimpleNamespace(
+            articulated_agent=SimpleNamespace(base_pos=[x, 0.0, 0.0]),
+            grasp_mgr=SimpleNamespace(is_grasped=False),
+        )
+        for x in [1.0, 1.5 * num_furniture]
+    ]
+    states = {
+        "is_clean": {
+            handle: rng.random() < 0.5
+            for handle in list(rom.objects) + ["furniture_0", "furniture_1"]
+        },
+        "is_powered_on": {
+            f"furniture_{index}": rng.random() < 0.5 for index in range(3)
+        },
+    }
+    return SimpleNamespace(
+        num_furniture=num_furniture,
+        rom=rom,
+        get_rigid_object_manager=lambda: rom,
+        get_articulated_object_manager=lambda: None,
+        semantic_scene=SimpleNamespace(
+            regions=[
+                FakeRegion("region_0", -5.0, float(num_furniture)),
+                FakeRegion("region_1", float(num_furniture), 2.0 * num_furniture + 5),
+            ]
+        ),
+        agents_mgr=FakeAgentsManager(["agent_0", "agent_1"], agents),
+        states=states,
+        object_state_machine=SimpleNamespace(
+            get_snapshot_dict=lambda sim: copy.deepcopy(sim.states)
+        ),
+    )
+
+
+def random_object_position(
+    rng: random.Random, num_furniture: int = NUM_FURNITURE
+) -> list:
+    x = 2.0 * rng.randrange(num_furniture) + rng.uniform(-0.4, 0.4)
+    y = FLOOR_HEIGHT + 1.0 if rng.random() < 0.2 else 1.0
+    return [x, y, rng.uniform(-0.4, 0.4)]
+
+
+class FakePerceptionSim(PerceptionSim):
+    """
+    PerceptionSim whose scene and receptacle matching come from the fake sim.
+    The sim handles each agent sees are read from obs["visible_handles"].
+    """
+
+    def __init__(self, sim):
+        self.num_receptacle_queries = 0
+        super().__init__(sim)
+
+    def add_rooms_to_gt_graph(self):
+        for region in self.sim.semantic_scene.regions:
+            room_name = f"room_{region.id}"
+            self.region_id_to_name[region.id] = room_name
+            room = Room(
+                room_name,
+                {"type": "room", "translation": [region.min_x, 0.0, 0.0]},
+                room_name,
+            )
+            self.gt_graph.add_node(room)
+            self.gt_graph.add_edge(room, "house", "inside", flip_edge("inside"))
+        unknown_room = Room("unknown_room", {"type": "unknown"}, "unknown_room")
+        self.gt_graph.add_node(unknown_room)
+        self.gt_graph.add_edge(unknown_room, "house", "inside", flip_edge("inside"))
+
+    def add_furniture_and_receptacles_to_gt_graph(self):
+        for index in range(self.sim.num_furniture):
+            handle = f"furniture_{index}"
+            furniture = Furniture(
+                f"table_{index}",
+                {"type": "table", "translation": [2.0 * index, 0.0, 0.0]},
+                handle,
+            )
+            self.gt_graph.add_node(furniture)
+            self.sim_handle_to_name[handle] = furniture.name
+            room_name = self.get_room_name_at(furniture.properties["translation"])
+            self.gt_graph.add_edge(furniture, room_name, "inside", flip_edge("inside"))
+            rec = Receptacle(f"rec_table_{index}_0", {"type": "on"}, f"rec_{index}")
+            self.gt_graph.add_node(rec)
+            self.sim_handle_to_name[rec.sim_handle] = rec.name
+            self.gt_graph.add_edge(rec, furniture, "joint", "joint")
+
+    def add_objects_to_gt_graph(self):
+        for index, handle in enumerate(self.rom.objects):
+            obj = Object(
+                f"cup_{index}",
+                {
+                    "type": "cup",
+                    "translation": list(
+                        self.rom.get_object_by_handle(handle).translation
+                    ),
+                    "states": {},
+                },
+                handle,
+            )
+            self.gt_graph.add_node(obj)
+            self.sim_handle_to_name[handle] = obj.name
+            rec_name = self._get_current_receptacle_name(handle)
+            self.gt_graph.add_edge(obj, rec_name, "on", flip_edge("on"))
+        self.update_object_and_furniture_states()
+
+    def get_room_name(self, handle):
+        translation = self.rom.get_object_by_handle(handle).translation
+        return self.get_room_name_at(translation) or "unknown_room"
+
+    def get_sim_handles_in_view(self, obs, agent_uids, save_object_masks=False):
+        return {uid: set(obs["visible_handles"][uid]) for uid in agent_uids}
+
+    def _get_current_receptacle_name(self, object_handle):
+        self.num_receptacle_queries += 1
+        x, y, _ = self.rom.get_object_by_handle(object_handle).translation
+        if y > FLOOR_HEIGHT:
+            return f"floor_{self.get_room_name(object_handle)}"
+        return f"rec_table_{round(x / 2.0)}_0"
+
+
+def get_graph_state(graph) -> dict:
+    return {
+        node.name: (
+            type(node),
+            node.properties,
+            {neighbor.name: label for neighbor, label in edges.items()},
+        )
+        for node, edges in graph.graph.items()
+    }
+
+
+def test_incremental_updates_match_full_recompute():
+    rng = random.Random(0)
+    sim = make_fake_sim(rng)
+    perception = FakePerceptionSim(sim)
+    handles = list(sim.rom.objects)
+
+    for step in range(60):
+        for handle in rng.sample(handles, rng.randrange(4)):
+            if rng.random() < 0.3:
+                # move within the same receptacle
+                sim.rom.objects[handle].translation[2] += 0.01
+            else:
+                sim.rom.objects[handle].translation = random_object_position(rng)
+        for agent_data in sim.agents_mgr._all_agent_data:
+            if rng.random() < 0.3:
+                agent_data.articulated_agent.base_pos = [rng.uniform(0, 20), 0.0, 0.0]
+        for values in sim.states.values():
+            for handle in rng.sample(list(values), rng.randrange(3)):
+                values[handle] = not values[handle]
+
+        graph = perception.get_recent_graph()
+        # A fresh PerceptionSim has no cached poses or states, so it computes
+        # every association from scratch
+        expected = FakePerceptionSim(sim).get_recent_graph()
+        assert get_graph_state(graph) == get_graph_state(expected), step
+
+    # Nothing moved, so nothing is recomputed or written
+    version = perception.gt_graph.version
+    num_queries = perception.num_receptacle_queries
+    perception.get_recent_graph()
+    assert perception.gt_graph.version == version
+    assert perception.num_receptacle_queries == num_queries
+
+
+def test_perception_frame_matches_separate_subgraphs():
+    frame_sim = make_fake_sim(random.Random(0))
+    separate_sim = make_fake_sim(random.Random(0))
+    rng = random.Random(1)
+    frame_perception = FakePerceptionSim(frame_sim)
+    separate_perception = FakePerceptionSim(separate_sim)
+    handles = list(frame_sim.rom.objects)
+
+    for _ in range(20):
+        for handle in rng.sample(handles, 3):
+            position = random_object_position(rng)
+            frame_sim.rom.objects[handle].translation = list(position)
+            separate_sim.rom.objects[handle].translation = list(position)
+        obs = {
+            "visible_handles": {
+                "0": rng.sample(handles, 5) + ["furniture_1", "rec_2"],
+                "1": rng.sample(handles, 5),
+            }
+        }
+
+        frame = frame_perception.get_perception_frame(["0", "1"], obs)
+        for agent_uids in [["0"], ["1"], ["0", "1"]]:
+            subgraph = frame_perception.get_subgraph_from_frame(frame, agent_uids)
+            expected = separate_perception.get_recent_subgraph(agent_uids, obs)
+            assert get_graph_state(subgraph) == get_graph_state(expected)
+        assert get_graph_state(frame.gt_graph) == get_graph_state(
+            separate_perception.get_recent_graph()
+        )
+
+    # A frame keeps describing its own step after later updates
+    subgraph = frame_perception.get_subgraph_from_frame(frame, ["0"])
+    seen_object = frame_sim.rom.objects[obs["visible_handles"]["0"][0]]
+    # onto the next furniture
+    x = 2.0 * ((round(seen_object.translation[0] / 2.0) + 1) % NUM_FURNITURE)
+    seen_object.translation = [x, 1.0, 0.0]
+    frame_perception.get_recent_graph()
+    stale_subgraph = frame_perception.get_subgraph_from_frame(frame, ["0"])
+    assert get_graph_state(stale_subgraph) == get_graph_state(subgraph)
+    new_frame = frame_perception.get_perception_frame(["0"], obs)
+    new_subgraph = frame_perception.get_subgraph_from_frame(new_frame, ["0"])
+    assert get_graph_state(new_subgraph) != get_graph_state(subgraph)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import random
+from typing import List, Optional
+
+import pytest
+
+from habitat_llm.sims.region_grid import RegionGrid
+
+
+class FakeSemanticRegion:
+    """
+    Floor polygon extruded upwards from floor_height, like a SemanticRegion
+    """
+
+    def __init__(self, polygon: List[List[float]], floor_height: float):
+        self.poly_loop_points = [[x, floor_height, z] for x, z in polygon]
+        self.floor_height = floor_height
+
+    def contains(self, point) -> bool:
+        x, y, z = point
+        if not self.floor_height <= y <= self.floor_height + 2.5:
+            return False
+        inside = False
+        loop = self.poly_loop_points
+        for (x1, _, z1), (x2, _, z2) in zip(loop, loop[1:] + loop[:1]):
+            if (z1 > z) != (z2 > z) and x < x1 + (z - z1) * (x2 - x1) / (z2 - z1):
+                inside = not inside
+        return inside
+
+
+def make_random_regions(rng: random.Random) -> List[FakeSemanticRegion]:
+    regions = []
+    for floor_height in [0.0, 3.0]:
+        for _ in range(8):
+            x, z = rng.uniform(-10, 10), rng.uniform(-10, 10)
+            w, d = rng.uniform(1, 6), rng.uniform(1, 6)
+            shape = rng.choice(["rectangle", "l_shape", "triangle"])
+            if shape == "rectangle":
+                polygon = [[x, z], [x + w, z], [x + w, z + d], [x, z + d]]
+            elif shape == "l_shape":
+                polygon = [
+                    [x, z],
+                    [x + w, z],
+                    [x + w, z + d / 2],
+                    [x + w / 2, z + d / 2],
+                    [x + w / 2, z + d],
+                    [x, z + d],
+                ]
+            else:
+                polygon = [[x, z], [x + w, z + rng.uniform(-2, 2)], [x, z + d]]
+            regions.append(FakeSemanticRegion(polygon, floor_height))
+    # a region without a floor plan
+    regions.append(FakeSemanticRegion([], 0.0))
+    return regions
+
+
+def find_region_by_scan(regions, point) -> Optional[int]:
+    for region_index, region in enumerate(regions):
+        if region.contains(point):
+            return region_index
+    return None
+
+
+@pytest.mark.parametrize("cell_size", [0.05, 0.3, 2.0])
+def test_region_grid_matches_region_contains(cell_size):
+    rng = random.Random(0)
+    regions = make_random_regions(rng)
+    grid = RegionGrid(regions, cell_size=cell_size)
+
+    points = [
+        [rng.uniform(-12, 18), rng.choice([0.5, 3.5, 7.0]), rng.uniform(-12, 18)]
+        for _ in range(5000)
+    ]
+    # points on and right next to the region borders
+    for region in regions[:-1]:
+        loop = region.poly_loop_points
+        for (x1, y, z1), (x2, _, z2) in zip(loop, loop[1:] + loop[:1]):
+            for _ in range(20):
+                t = rng.random()
+                offset = rng.choice([0.0, 1e-4, -1e-4])
+                points.append(
+                    [
+                        x1 + t * (x2 - x1) + offset,
+                        y + 0.5,
+                        z1 + t * (z2 - z1) - offset,
+                    ]
+                )
+
+    for point in points:
+        assert grid.get_region_index(point) == find_region_by_scan(regions, point)
+
+    # Points are tested against few regions
+    num_candidates = [len(grid.get_candidate_regions(point)) for point in points]
+    print(f"Average candidates per point: {sum(num_candidates) / len(points):.2f}")
+    assert sum(num_candidates) < len(points) * len(regions) / 2
+
+
+def test_region_grid_without_regions():
+    grid = RegionGrid([])
+    assert grid.get_region_index([0.0, 0.0, 0.0]) is None
+    with pytest.raises(ValueError):
+        RegionGrid([], cell_size=0)
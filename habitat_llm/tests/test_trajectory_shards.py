@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+import torch
+
+from habitat_llm.agent.env.trajectory_writer import TrajectoryWriter
+from habitat_llm.concept_graphs.hab_dataset import HabitatDataset
+from habitat_llm.concept_graphs.trajectory_shards import (
+    TrajectoryShardReader,
+    TrajectoryShardWriter,
+    has_trajectory_shards,
+)
+
+HEIGHT, WIDTH = 24, 32
+
+
+def make_trajectory_frames(rng: np.random.Generator, num_frames: int):
+    """
+    Random RGB, depth and panoptic images and camera poses of a trajectory
+    """
+    frames = []
+    for _ in range(num_frames):
+        pose = np.eye(4)
+        pose[:3, :3] = np.linalg.qr(rng.normal(size=(3, 3)))[0]
+        pose[:3, 3] = rng.normal(size=3)
+        frames.append(
+            {
+                "pose": pose,
+                "rgb": rng.integers(0, 255, size=(HEIGHT, WIDTH, 3), dtype=np.uint8),
+                "depth": rng.uniform(0.5, 5, (HEIGHT, WIDTH, 1)).astype(np.float32),
+                "panoptic": rng.integers(0, 200, size=(HEIGHT, WIDTH, 1)),
+            }
+        )
+    return frames
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_trajectory_shards_round_trip(tmp_path, num_workers):
+    rng = np.random.default_rng(num_workers)
+    frames = make_trajectory_frames(rng, 10)
+    background_writer = TrajectoryWriter(num_workers=num_workers)
+    writer = TrajectoryShardWriter(
+        str(tmp_path), frames_per_shard=4, submit=background_writer.submit
+    )
+    for trajectory_idx, frame in enumerate(frames):
+        writer.add_frame(trajectory_idx, **frame)
+    writer.close()
+    background_writer.close()
+    # frames of a shard have the same modalities
+    writer.add_frame(10, frames[0]["pose"])
+    with pytest.raises(ValueError):
+        writer.add_frame(11, **frames[0])
+
+    assert has_trajectory_shards(str(tmp_path))
+    assert sorted(os.listdir(tmp_path / "shards")) == [
+        "frames_000000-000003.npz",
+        "frames_000004-000007.npz",
+        "frames_000008-000009.npz",
+    ]
+    reader = TrajectoryShardReader(str(tmp_path))
+    assert len(reader) == len(frames)
+    # frames in any order
+    for position in [0, 9, 4, 5, 3]:
+        frame = reader.get_frame(position)
+        assert frame.keys() == {"trajectory_idx", *frames[position]}
+        assert frame["trajectory_idx"] == position
+        for key, array in frames[position].items():
+            assert np.array_equal(frame[key], array)
+            assert frame[key].dtype == array.dtype
+    assert np.array_equal(
+        reader.get_all("pose"), np.stack([frame["pose"] for frame in frames])
+    )
+    with pytest.raises(ValueError):
+        reader.get("rgb", 10)
+
+
+def test_trajectory_shards_written_at_exit(tmp_path):
+    # a trajectory shorter than a shard, whose writer is never closed, e.g. the
+    # last episode of a run
+    script = textwrap.dedent(
+        f"""
+        import os
+
+        import numpy as np
+
+        from habitat_llm.agent.env.trajectory_writer import TrajectoryWriter
+        from habitat_llm.concept_graphs.trajectory_shards import TrajectoryShardWriter
+
+        background_writer = TrajectoryWriter(num_workers=2)
+        writers = [
+            TrajectoryShardWriter(
+                os.path.join({str(tmp_path)!r}, agent),
+                frames_per_shard=4,
+                submit=background_writer.submit,
+            )
+            for agent in ["agent_0", "agent_1"]
+        ]
+        for writer, num_frames in zip(writers, [3, 6]):
+            for trajectory_idx in range(num_frames):
+                writer.add_frame(trajectory_idx, np.eye(4) * trajectory_idx)
+        """
+    )
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+    for agent, num_frames in [("agent_0", 3), ("agent_1", 6)]:
+        reader = TrajectoryShardReader(str(tmp_path / agent))
+        assert len(reader) == num_frames
+        assert np.array_equal(
+            reader.get_all("pose"), np.stack([np.eye(4) * i for i in range(num_frames)])
+        )
+
+
+def test_habitat_dataset_reads_shards(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = make_trajectory_frames(rng, 7)
+    intrinsics = np.array([[20.0, 20.0, WIDTH / 2, HEIGHT / 2]])
+    # the same trajectory, with one file per frame and as shards
+    for layout in ["files", "shards"]:
+        agent_dir = tmp_path / layout / "agent_0"
+        os.makedirs(agent_dir)
+        np.save(agent_dir / "intrinsics.npy", intrinsics)
+        if layout == "shards":
+            writer = TrajectoryShardWriter(str(agent_dir), frames_per_shard=3)
+            for trajectory_idx, frame in enumerate(frames):
+                writer.add_frame(trajectory_idx, **frame)
+            writer.close()
+            continue
+        for modality in ["rgb", "depth", "pose"]:
+            os.makedirs(agent_dir / modality)
+            for trajectory_idx, frame in enumerate(frames):
+                np.save(agent_dir / modality / f"{trajectory_idx}.npy", frame[modality])
+
+    config_dict = {
+        "dataset_name": "habitat",
+        "relative_pose": True,
+        "camera_params": {
+            "png_depth_scale": 1.0,
+            "image_height": HEIGHT,
+            "image_width": WIDTH,
+            "fx": 20.0,
+            "fy": 20.0,
+            "cx": WIDTH / 2,
+            "cy": HEIGHT / 2,
+        },
+    }
+    datasets = [
+        HabitatDataset(
+            config_dict,
+            str(tmp_path / layout),
+            "agent_0",
+            stride=2,
+            desired_height=HEIGHT,
+            desired_width=WIDTH,
+            device="cpu",
+        )
+        for layout in ["files", "shards"]
+    ]
+    assert len(datasets[0]) == len(datasets[1]) == 4
+    assert torch.equal(datasets[0].poses, datasets[1].poses)
+    for index in range(len(datasets[0])):
+        for expected, value in zip(datasets[0][index], datasets[1][index]):
+            assert torch.equal(expected, value)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from habitat_llm.agent.env.trajectory_writer import TrajectoryWriter
+
+
+def write_frame(path, frame: np.ndarray, delay: float = 0.0):
+    time.sleep(delay)
+    np.save(path, frame)
+
+
+@pytest.mark.parametrize("num_workers", [0, 1, 3])
+def test_trajectory_writer_loses_no_frames(tmp_path, num_workers):
+    rng = np.random.default_rng(num_workers)
+    writer = TrajectoryWriter(num_workers=num_workers, max_queued_frames=2)
+    frames = [rng.integers(0, 255, size=(8, 8, 3)) for _ in range(100)]
+    for index, frame in enumerate(frames):
+        writer.submit(
+            write_frame, tmp_path / f"{index}.npy", frame, delay=rng.uniform(0, 1e-3)
+        )
+    writer.flush()
+    assert writer.num_written == len(frames)
+    for index, frame in enumerate(frames):
+        assert np.array_equal(np.load(tmp_path / f"{index}.npy"), frame)
+
+    # frames submitted after a flush are written by close, which stops the threads
+    writer.submit(write_frame, tmp_path / "last.npy", frames[0], delay=0.05)
+    workers = list(writer._workers)
+    writer.close()
+    assert np.array_equal(np.load(tmp_path / "last.npy"), frames[0])
+    assert len(workers) == num_workers
+    assert not any(worker.is_alive() for worker in workers)
+
+
+def test_trajectory_writer_bounds_the_queue():
+    writer = TrajectoryWriter(num_workers=1, max_queued_frames=2)
+    release = threading.Event()
+    writer.submit(release.wait)
+    # the worker is blocked on the first write, so two more fill the queue
+    writer.submit(lambda: None)
+    writer.submit(lambda: None)
+    submitter = threading.Thread(target=writer.submit, args=(lambda: None,))
+    submitter.start()
+    submitter.join(timeout=0.1)
+    assert submitter.is_alive()
+    release.set()
+    submitter.join()
+    writer.close()
+    assert writer.num_written == 4
+
+
+def test_trajectory_writer_raises_write_errors(tmp_path):
+    writer = TrajectoryWriter(num_workers=2)
+    writer.submit(write_frame, tmp_path / "missing" / "0.npy", np.zeros(3))
+    writer.submit(write_frame, tmp_path / "1.npy", np.ones(3))
+    with pytest.raises(FileNotFoundError):
+        writer.flush()
+    # other frames are still written, and the writer keeps working
+    writer.submit(write_frame, tmp_path / "2.npy", np.ones(3))
+    writer.close()
+    assert (tmp_path / "1.npy").exists() and (tmp_path / "2.npy").exists()
+
+    with pytest.raises(ValueError):
+        TrajectoryWriter(max_queued_frames=0)
@@ -4,12 +4,14 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree
 
+import copy
 import gc
 import random
 from typing import Tuple
 
 import habitat.sims.habitat_simulator.sim_utilities as sutils
 import magnum as mn
+import numpy as np
 import pytest
 
 from habitat_llm.agent.env.dataset import CollaborationDatasetV0
@@ -317,6 +319,208 @@ def test_find_furniture_for_receptacle():
         graph3.find_furniture_for_receptacle(receptacle)
 
 
+def test_get_closest_entities_matches_brute_force():
+    def brute_force(graph, location, n, dist_threshold, class_types):
+        entities = []
+        for class_type in class_types:
+            entities += [
+                x
+                for x in graph.get_all_nodes_of_type(class_type) or []
+                if "translation" in x.properties
+            ]
+        location = np.array(location)
+        closest = sorted(
+            entities,
+            key=lambda x: np.linalg.norm(
+                location - np.array(x.properties["translation"])
+            ),
+        )[:n]
+        if dist_threshold > 0.0:
+            return [
+                x
+                for x in closest
+                if np.linalg.norm(location - np.array(x.properties["translation"]))
+                < dist_threshold
+            ]
+        return closest
+
+    rng = random.Random(0)
+    graph = WorldGraph()
+    nodes = []
+    for index in range(300):
+        node_class = rng.choice([Room, Furniture, Object, Object])
+        # round so that ties in distance are common
+        translation = [round(rng.uniform(-10, 10)), 0.0, round(rng.uniform(-10, 10))]
+        nodes.append(
+            node_class(
+                f"node_{index}", {"type": "test_node", "translation": translation}
+            )
+        )
+        graph.add_node(nodes[-1])
+    graph.add_node(Object("no_translation", {"type": "test_node"}))
+
+    for step in range(100):
+        location = [rng.uniform(-12, 12), 0.0, rng.uniform(-12, 12)]
+        n = rng.choice([1, 3, 10, 500])
+        dist_threshold = rng.choice([-1.0, 0.5, 1.5, 5.0])
+        include = [rng.random() < 0.7 for _ in range(3)]
+        class_types = [
+            class_type
+            for class_type, included in zip([Room, Furniture, Object], include)
+            if included
+        ]
+        assert graph.get_closest_entities(
+            n,
+            location=location,
+            dist_threshold=dist_threshold,
+            include_rooms=include[0],
+            include_furniture=include[1],
+            include_objects=include[2],
+        ) == brute_force(graph, location, n, dist_threshold, class_types)
+
+        # move, add and remove entities between queries
+        moved = rng.choice(nodes)
+        graph.set_node_translation(
+            moved, [rng.uniform(-10, 10), 0.0, rng.uniform(-10, 10)]
+        )
+        if step % 10 == 0:
+            removed = nodes.pop(rng.randrange(len(nodes)))
+            graph.remove_node(removed)
+            nodes.append(
+                Object(f"new_{step}", {"type": "test_node", "translation": [0, 0, 0]})
+            )
+            graph.add_node(nodes[-1])
+
+    obj_node = graph.get_all_objects()[0]
+    assert graph.get_closest_object_or_furniture(obj_node, 5) == brute_force(
+        graph, obj_node.properties["translation"], 5, 1.5, [Object, Furniture]
+    )
+    assert graph.get_closest_object_or_furniture(obj_node, 5, dist_threshold=0) == []
+
+
+def test_world_descr_is_updated_incrementally():
+    def full_world_descr(graph):
+        # the description as generated from scratch before it was cached
+        house_info = ""
+        for k, v in graph.group_furniture_by_room().items():
+            house_info += k + ": " + ", ".join(furn.name for furn in v) + "\n"
+        objs_info = ""
+        for obj in graph.get_all_objects():
+            if graph.is_object_with_agent(obj, agent_type="robot"):
+                objs_info += obj.name + ": " + graph.get_spot_robot().name + "\n"
+            elif graph.is_object_with_agent(obj, agent_type="human"):
+                objs_info += obj.name + ": " + graph.get_human().name + "\n"
+            else:
+                furniture = graph.find_furniture_for_object(obj)
+                furniture_name = "unknown" if furniture is None else furniture.name
+                objs_info += obj.name + ": " + furniture_name + "\n"
+        return f"Furniture:\n{house_info}\nObjects:\n{objs_info}"
+
+    rng = random.Random(0)
+    graph = WorldGraph()
+    graph.world_model_type = "concept_graph"
+    house = House("house", {"type": "root"})
+    graph.add_node(house)
+    rooms = [Room(f"room_{index}", {"type": "room"}) for index in range(4)]
+    furnitures = [Furniture(f"table_{index}", {"type": "table"}) for index in range(8)]
+    receptacles = [Receptacle(f"rec_{index}", {"type": "rec"}) for index in range(8)]
+    agents = [
+        SpotRobot("agent_0", {"type": "agent"}),
+        Human("agent_1", {"type": "agent"}),
+    ]
+    objects = [Object(f"cup_{index}", {"type": "cup"}) for index in range(20)]
+    for room in rooms:
+        graph.add_node(room)
+        graph.add_edge(room, house, "inside", "contains")
+    for furniture, receptacle in zip(furnitures, receptacles):
+        graph.add_node(furniture)
+        graph.add_edge(furniture, rng.choice(rooms), "inside", "contains")
+        graph.add_node(receptacle)
+        graph.add_edge(receptacle, furniture, "joint", "joint")
+    for agent in agents:
+        graph.add_node(agent)
+        graph.add_edge(agent, rng.choice(rooms), "inside", "contains")
+    for obj in objects:
+        graph.add_node(obj)
+        graph.add_edge(obj, rng.choice(furnitures + receptacles), "on", "under")
+
+    for step in range(300):
+        version = graph.version
+        assert graph.get_world_descr() == full_world_descr(graph)
+        assert graph.version == version
+
+        action = rng.randrange(5)
+        if action == 0:
+            # move, pick up or strand an object
+            obj = rng.choice(objects)
+            graph.remove_all_edges(obj)
+            parents = furnitures + receptacles + agents + [None]
+            parent = rng.choice(parents)
+            if parent is not None:
+                graph.add_edge(obj, parent, "on", "under")
+        elif action == 1:
+            # move an agent or furniture to another room
+            node = rng.choice(agents + furnitures)
+            graph.remove_edge(node, graph.get_neighbors_of_type(node, Room)[0])
+            graph.add_edge(node, rng.choice(rooms), "inside", "contains")
+        elif action == 2:
+            # furniture listed in a second room
+            graph.add_edge(rng.choice(furnitures), rng.choice(rooms), "in", "contains")
+        elif action == 3:
+            obj = objects.pop(rng.randrange(len(objects)))
+            graph.remove_node(obj)
+            objects.append(Object(f"new_cup_{step}", {"type": "cup"}))
+            graph.add_node(objects[-1])
+            graph.add_edge(objects[-1], rng.choice(furnitures), "on", "under")
+        else:
+            # a replan without any change
+            pass
+
+
+def test_room_descriptions_are_cached_across_updates():
+    gt_graph = WorldGraph()
+    house = House("house", {"type": "root"})
+    gt_graph.add_node(house)
+    tables = []
+    for index in range(2):
+        room = Room(f"room_{index}", {"type": "room"})
+        tables.append(Furniture(f"table_{index}", {"type": "table"}))
+        cup = Object(f"cup_{index}", {"type": "cup"})
+        for node in [room, tables[-1], cup]:
+            gt_graph.add_node(node)
+        gt_graph.add_edge(room, house, "inside", "contains")
+        gt_graph.add_edge(tables[-1], room, "inside", "contains")
+        gt_graph.add_edge(cup, tables[-1], "on", "under")
+
+    graph = WorldGraph()
+    described = []
+
+    def describe_tables():
+        def describe(node):
+            described.append(node.name)
+            return sorted(neighbor.name for neighbor in graph.graph[node])
+
+        described.clear()
+        return graph.describe_nodes("tables", graph.get_all_furnitures(), describe)
+
+    graph.update(gt_graph.snapshot(), partial_obs=False, update_mode="gt")
+    descriptions = describe_tables()
+    assert described == ["table_0", "table_1"]
+
+    # the same observation, as a snapshot or as a new graph, is a cache hit
+    for recent_graph in [gt_graph.snapshot(), copy.deepcopy(gt_graph)]:
+        graph.update(recent_graph, partial_obs=False, update_mode="gt")
+        assert describe_tables() == descriptions
+        assert described == []
+
+    # only the room where a cup appeared is described again
+    gt_graph.add_node(Object("cup_2", {"type": "cup"}))
+    gt_graph.add_edge("cup_2", "table_1", "on", "under")
+    graph.update(gt_graph.snapshot(), partial_obs=False, update_mode="gt")
+    assert describe_tables() == [descriptions[0], ["cup_1", "cup_2", "room_1"]]
+    assert described == ["table_1"]
+
+
 def test_bad_object_transform_in_unknown_room():
     object_handle = "CREATIVE_BLOCKS_35_MM_:0000"
     config = get_config(
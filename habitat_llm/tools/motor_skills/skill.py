@@ -291,7 +291,9 @@ class SkillPolicy(Policy):
                 axis=1,
             )
             closest_entity_idx = np.argmin(entity_distance)
-            entity.sim_handle = all_gt_entities[closest_entity_idx].sim_handle
+            entity = self.env.world_graph[self.agent_uid].set_node_sim_handle(
+                entity, all_gt_entities[closest_entity_idx].sim_handle
+            )
             self._logger.debug(
                 f"Detected non-sim object. Matched {all_gt_entities[closest_entity_idx].name} with non-sim object {entity.name}"
             )
@@ -4,7 +4,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree
 
-from typing import Optional
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
 
 import magnum as mn
 import numpy as np
@@ -68,6 +69,88 @@ def unproject_masked_depth_to_xyz_coordinates(
     return xyz[:, :3]
 
 
+@lru_cache(maxsize=4)
+def _get_ray_grid(
+    height: int, width: int, inv_intrinsics: Tuple[float, ...]
+) -> torch.Tensor:
+    """
+    Returns the camera-frame ray of every pixel, with unit depth, as a
+    (H * W, 3) tensor in row-major pixel order
+    """
+    ys, xs = torch.meshgrid(
+        torch.arange(height, dtype=torch.float64),
+        torch.arange(width, dtype=torch.float64),
+        indexing="ij",
+    )
+    pixels = torch.stack((xs, ys, torch.ones_like(xs)), dim=-1).reshape(-1, 3)
+    return pixels @ torch.tensor(inv_intrinsics, dtype=torch.float64).reshape(3, 3).T
+
+
+def unproject_depth_instances(
+    depth: torch.Tensor,
+    pose: torch.Tensor,
+    inv_intrinsics: torch.Tensor,
+    pixel_indices: Sequence[torch.Tensor],
+) -> Tuple[List[torch.Tensor], torch.Tensor]:
+    """Unprojects the pixels of several instances of a posed depth image at once.
+    For each instance, same as unproject_masked_depth_to_xyz_coordinates with a
+    mask excluding all other pixels. The pixel rays are cached per resolution
+    and intrinsics.
+
+    Args:
+        depth: The depth tensor, with shape (H, W)
+        pose: The pose, with shape (4, 4)
+        inv_intrinsics: The inverse intrinsics, with shape (3, 3)
+        pixel_indices: Per instance, flat row-major indices of its pixels
+
+    Returns:
+        Per instance, XYZ coordinates with shape (N_i, 3), and the centroids of
+        the instances with shape (K, 3). The centroid of an empty instance is NaN.
+    """
+    height, width = depth.shape
+    rays = _get_ray_grid(height, width, tuple(inv_intrinsics.reshape(-1).tolist()))
+    counts = [len(indices) for indices in pixel_indices]
+    all_indices = (
+        torch.cat(list(pixel_indices)) if counts else torch.zeros(0, dtype=torch.int64)
+    )
+
+    xyz = rays[all_indices] * depth.reshape(-1)[all_indices, None]
+    pose = pose.to(xyz)
+    xyz = xyz @ pose[:3, :3].T + pose[:3, 3]
+
+    instance_of_point = torch.repeat_interleave(
+        torch.arange(len(counts)), torch.tensor(counts, dtype=torch.int64)
+    )
+    sums = torch.zeros(len(counts), 3, dtype=xyz.dtype).index_add_(
+        0, instance_of_point, xyz
+    )
+    centroids = sums / torch.tensor(counts, dtype=xyz.dtype)[:, None]
+    return list(torch.split(xyz, counts)), centroids
+
+
+def unproject_depth_at_pixel_indices(
+    depth: torch.Tensor,
+    pose: torch.Tensor,
+    inv_intrinsics: torch.Tensor,
+    pixel_indices: torch.Tensor,
+) -> torch.Tensor:
+    """Returns the XYZ coordinates of the given pixels of a posed depth image.
+    Same as unproject_masked_depth_to_xyz_coordinates with a mask excluding all
+    other pixels, without building the mask or unprojecting the whole image.
+
+    Args:
+        depth: The depth tensor, with shape (H, W)
+        pose: The pose, with shape (4, 4)
+        inv_intrinsics: The inverse intrinsics, with shape (3, 3)
+        pixel_indices: Flat row-major indices of the pixels, with shape (N,)
+
+    Returns:
+        XYZ coordinates, with shape (N, 3)
+    """
+    points, _ = unproject_depth_instances(depth, pose, inv_intrinsics, [pixel_indices])
+    return points[0]
+
+
 def unproject_coordinates(
     im_coordinates: npt.NDArray[np.float64],
     depth: npt.NDArray[np.float64],
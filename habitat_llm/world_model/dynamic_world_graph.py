@@ -23,10 +23,7 @@ if TYPE_CHECKING:
 import numpy as np
 import torch
 
-from habitat_llm.utils.geometric import (
-    opengl_to_opencv,
-    unproject_masked_depth_to_xyz_coordinates,
-)
+from habitat_llm.utils.geometric import opengl_to_opencv, unproject_depth_instances
 from habitat_llm.utils.semantic_constants import EPISODE_OBJECTS
 from habitat_llm.world_model import (
     Entity,
@@ -49,6 +46,8 @@ class DynamicWorldGraph(WorldGraph):
     maintained based on observations instead of privileged sim data.
     """
 
+    _snapshot_attributes = WorldGraph._snapshot_attributes + ("_num_entities_added",)
+
     def __init__(
         self,
         max_neighbors_for_room_assignment: int = 5,
@@ -63,7 +62,8 @@ class DynamicWorldGraph(WorldGraph):
         )
         self.include_objects = False
         self._sim_objects = EPISODE_OBJECTS
-        self._entity_names: List[str] = []
+        # Number of nodes ever added, used to name newly detected objects
+        self._num_entities_added = len(self.graph)
         self._logger = logging.getLogger(__name__)
         FORMAT = "[%(filename)s:%(lineno)s - %(funcName)20s() ] %(message)s"
         logging.basicConfig(format=FORMAT)
@@ -83,6 +83,20 @@ class DynamicWorldGraph(WorldGraph):
     def set_articulated_agents(self, articulated_agent: dict):
         self._articulated_agents = articulated_agent
 
+    def add_node(self, node):
+        if not self.has_node(node):
+            self._num_entities_added += 1
+        super().add_node(node)
+
+    def _share_structure_from(self, other_graph):
+        super()._share_structure_from(other_graph)
+        # Plain graphs, e.g. from perception, only count their nodes. The
+        # counter never decreases, so that names of new objects are never reused
+        self._num_entities_added = max(
+            self._num_entities_added,
+            getattr(other_graph, "_num_entities_added", len(other_graph._graph)),
+        )
+
     def create_cg_edges(
         self,
         cg_dict_list: Optional[dict] = None,
@@ -96,7 +110,7 @@ class DynamicWorldGraph(WorldGraph):
         self.include_objects = include_objects
         self._raw_cg = cg_dict_list
 
-        def to_entity_input(obj: dict):
+        def to_entity_input(obj: dict, obj_uid: str):
             translation = obj["bbox_center"]
             if obj.get("fix_bbox", False):
                 translation = [translation[0], translation[2], translation[1]]
@@ -107,7 +121,7 @@ class DynamicWorldGraph(WorldGraph):
                 np.array(translation) + np.array(obj["bbox_extent"])
             ).tolist()
             return {
-                "name": self._cg_object_to_object_uid(obj),
+                "name": obj_uid,
                 "properties": {
                     "type": obj["category_tag"],
                     "translation": translation,
@@ -132,7 +146,6 @@ class DynamicWorldGraph(WorldGraph):
         # Create root node
         house = House("house", {"type": "root"}, "house_0")
         self.add_node(house)
-        self._entity_names.append("house")
 
         if cg_dict_list is None or not cg_dict_list:
             raise ValueError("Need a list of CG edges to create the graph")
@@ -146,28 +159,23 @@ class DynamicWorldGraph(WorldGraph):
             object_nodes: List[Entity] = []
             for obj in [object1, object2]:
                 obj_uid = self._cg_object_to_object_uid(obj)
-                if (
-                    is_valid_obj_or_furniture(obj, include_objects)
-                    and obj_uid not in self._entity_names
-                ):
+                is_new_entity = not self.has_node(obj_uid)
+                if is_valid_obj_or_furniture(obj, include_objects) and is_new_entity:
                     obj["object_tag"] = obj["object_tag"].lower()
                     obj["category_tag"] = obj["category_tag"].lower()
                     obj["room_region"] = obj["room_region"].lower()
-                    obj_entity_input_dict = to_entity_input(obj)
+                    obj_entity_input_dict = to_entity_input(obj, obj_uid)
                     if obj["category_tag"] == "object":
                         object_nodes.append(Object(**obj_entity_input_dict))
                         self.add_node(object_nodes[-1])
-                        self._entity_names.append(obj_entity_input_dict["name"])
                     elif obj["category_tag"] == "furniture":
                         object_nodes.append(Furniture(**obj_entity_input_dict))
                         self.add_node(object_nodes[-1])
-                        self._entity_names.append(obj_entity_input_dict["name"])
                     elif obj["category_tag"] == "invalid":
                         object_nodes.append(
                             UncategorizedEntity(**obj_entity_input_dict)
                         )
                         self.add_node(object_nodes[-1])
-                        self._entity_names.append(obj_entity_input_dict["name"])
                     if verbose:
                         self._logger.info(f"Added new entity: {object_nodes[-1].name}")
                     # make a child of room_region allocated
@@ -182,7 +190,6 @@ class DynamicWorldGraph(WorldGraph):
                             **{"properties": {"type": room_region}, "name": room_region}
                         )
                         self.add_node(room_node)
-                        self._entity_names.append(room_region)
                         self.add_edge(
                             room_node,
                             house,
@@ -191,7 +198,6 @@ class DynamicWorldGraph(WorldGraph):
                         )
                         room_floor = Floor(f"floor_{room_node.name}", {})
                         self.add_node(room_floor)
-                        self._entity_names.append(room_floor.name)
                         self.add_edge(
                             room_floor, room_node, "inside", flip_edge("inside")
                         )
@@ -208,7 +214,7 @@ class DynamicWorldGraph(WorldGraph):
                         self._logger.info(
                             f"Added above object to room: {room_node.name}"
                         )
-                elif obj_uid in self._entity_names:
+                elif not is_new_entity:
                     object_nodes.append(self.get_node_from_name(obj_uid))
                     if verbose:
                         self._logger.info(
@@ -327,8 +333,8 @@ class DynamicWorldGraph(WorldGraph):
                     if "translation" in fur.properties:
                         valid_translation = fur.properties["translation"]
                         break
-                room_floor.properties["translation"] = valid_translation
-                current_room.properties["translation"] = valid_translation
+                self.set_node_translation(room_floor, valid_translation)
+                self.set_node_translation(current_room, valid_translation)
 
         for prune_room in prune_list:
             self.remove_node(prune_room)
@@ -340,7 +346,6 @@ class DynamicWorldGraph(WorldGraph):
         Add agent-node to the graph and assign room-label based on proximity logic
         """
         self.add_node(agent_node)
-        self._entity_names.append(agent_node.name)
         room_node = self.find_room_of_entity(agent_node)
         if room_node is None:
             raise ValueError(
@@ -408,7 +413,9 @@ class DynamicWorldGraph(WorldGraph):
                     axis=1,
                 )
                 closest_entity_idx = np.argmin(entity_distance)
-                current_fur.sim_handle = all_gt_entities[closest_entity_idx].sim_handle
+                current_fur = self.set_node_sim_handle(
+                    current_fur, all_gt_entities[closest_entity_idx].sim_handle
+                )
                 self._sim_object_to_detected_object_map[
                     all_gt_entities[closest_entity_idx].name
                 ] = current_fur
@@ -471,7 +478,7 @@ class DynamicWorldGraph(WorldGraph):
         # TODO: We should add edge to default receptacle instead of fur
         self.add_edge(object_node, placement_node, "on", flip_edge("on"))
         # snap the object to furniture's center in absence of actual location
-        object_node.properties["translation"] = placement_node.properties["translation"]
+        self.set_node_translation(object_node, placement_node.properties["translation"])
         if verbose:
             self._logger.info(
                 f"Moved {object_node.name} from {agent_node.name} to {placement_node.name}"
@@ -567,12 +574,10 @@ class DynamicWorldGraph(WorldGraph):
             if held_entity_node.properties.get("time_of_update", None) is not None and (
                 time.time() - held_entity_node.properties["time_of_update"] > 1.0
             ):
-                held_entity_node.properties["translation"][0] = agent_node.properties[
-                    "translation"
-                ][0]
-                held_entity_node.properties["translation"][2] = agent_node.properties[
-                    "translation"
-                ][2]
+                translation = list(held_entity_node.properties["translation"])
+                translation[0] = agent_node.properties["translation"][0]
+                translation[2] = agent_node.properties["translation"][2]
+                self.set_node_translation(held_entity_node, translation)
                 held_entity_node.properties["time_of_update"] = time.time()
         return
 
@@ -580,14 +585,11 @@ class DynamicWorldGraph(WorldGraph):
         """
         Use camera pose to update agent locations in the world-graph
         """
-        agent_nodes = self.get_agents()
         for uid, detector_frame in detector_frames.items():
-            agent_node = [
-                a_node for a_node in agent_nodes if a_node.name == f"agent_{uid}"
-            ][0]
-            agent_node.properties["translation"] = detector_frame["camera_pose"][
-                :3, 3
-            ].tolist()
+            agent_node = self.get_node_from_name(f"agent_{uid}")
+            self.set_node_translation(
+                agent_node, detector_frame["camera_pose"][:3, 3].tolist()
+            )
             prev_room: Room = self.get_neighbors_of_type(agent_node, Room)[0]
             self.remove_edge(agent_node, prev_room)
             room_node: Optional[Room] = self.find_room_of_entity(agent_node)
@@ -598,6 +600,25 @@ class DynamicWorldGraph(WorldGraph):
             self.add_edge(agent_node, room_node, "in", opposite_label="contains")
             self.update_held_objects(agent_node)
 
+    def get_object_centroids_from_obs(
+        self, detector_frame: dict, object_ids: List[int]
+    ) -> Dict[int, List[float]]:
+        """
+        Unprojects the pixels of the given detected objects from the depth image, all
+        at once, and returns the centroid of each object's points
+        """
+        pose = opengl_to_opencv(detector_frame["camera_pose"])
+        _, centroids = unproject_depth_instances(
+            torch.from_numpy(detector_frame["depth"][..., 0]),
+            torch.from_numpy(pose),
+            torch.from_numpy(np.linalg.inv(detector_frame["camera_intrinsics"])),
+            [
+                torch.from_numpy(detector_frame["object_pixel_indices"][object_id])
+                for object_id in object_ids
+            ],
+        )
+        return dict(zip(object_ids, centroids.numpy().tolist()))
+
     def get_object_from_obs(
         self,
         detector_frame: dict,
@@ -605,20 +626,22 @@ class DynamicWorldGraph(WorldGraph):
         uid: int,
         verbose: bool = False,
         object_state_dict: Optional[dict] = None,
+        object_centroid: Optional[List[float]] = None,
     ) -> Optional[Object]:
         """
         Given the processed observation, extract the object's centroid and convert to a
-        node
+        node. object_centroid can be passed if already computed for the frame with
+        get_object_centroids_from_obs.
         NOTE: We use Sim information to populate locations for all objects detected by
         Human. Needs to be refactored post bug-fix in KinematicHumanoid class
         @zephirefaith @xavipuig
         """
         obj_id_to_category_mapping = detector_frame["object_category_mapping"]
         obj_id_to_handle_mapping = detector_frame["object_handle_mapping"]
-        object_mask = detector_frame["object_masks"][object_id]
+        pixel_indices = detector_frame["object_pixel_indices"][object_id]
         object_handle = obj_id_to_handle_mapping[object_id]
         # NOTE: can add another area based check here to ignore very small objects from far away
-        if not np.any(object_mask):
+        if len(pixel_indices) == 0:
             return None
         if verbose:
             print(
@@ -634,30 +657,16 @@ class DynamicWorldGraph(WorldGraph):
                 raise KeyError(
                     "[DynamicWorldGraph.get_object_from_obs] No object_locations found in detector_frame for human-detected objects"
                 )
-        else:
-            depth_numpy = detector_frame["depth"]
-            H, W, C = depth_numpy.shape
-            pose = opengl_to_opencv(detector_frame["camera_pose"])
-            depth_tensor = torch.from_numpy(depth_numpy.reshape(1, C, H, W))
-            pose_tensor = torch.from_numpy(pose.reshape(1, 4, 4))
-            inv_intrinsics_tensor = torch.from_numpy(
-                np.linalg.inv(detector_frame["camera_intrinsics"]).reshape(1, 3, 3)
-            )
-            mask_tensor = torch.from_numpy(object_mask.reshape(1, C, H, W))
-            mask_tensor = ~mask_tensor.bool()
-            object_xyz = unproject_masked_depth_to_xyz_coordinates(
-                depth_tensor,
-                pose_tensor,
-                inv_intrinsics_tensor,
-                mask_tensor,
-            )
-            object_centroid = object_xyz.mean(dim=0).numpy().tolist()
+        elif object_centroid is None:
+            object_centroid = self.get_object_centroids_from_obs(
+                detector_frame, [object_id]
+            )[object_id]
         if verbose:
             print(f"{object_centroid=}")
 
         # add this object to the graph
         new_object_node = Object(
-            f"{len(self._entity_names)+1}_{obj_id_to_category_mapping[object_id]}",
+            f"{self._num_entities_added+1}_{obj_id_to_category_mapping[object_id]}",
             {
                 "type": obj_id_to_category_mapping[object_id],
                 "translation": object_centroid,
@@ -676,48 +685,190 @@ class DynamicWorldGraph(WorldGraph):
 
         return new_object_node
 
-    def _is_point_within_bbox(self, point, bbox_min, bbox_max):
-        # Check if point is within all dimensions of the bounding box
-        return np.all((point >= bbox_min) & (point <= bbox_max))
+    def _get_furniture_boxes(
+        self,
+    ) -> Tuple[List[Furniture], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the furniture with a bounding box and a translation, floors
+        excluded, in graph order, along with their bbox_min, bbox_max and
+        translation as (furniture, 3) arrays
+        """
+        furniture = [
+            fur
+            for fur in self._get_nodes_of_type(Furniture)
+            if not isinstance(fur, Floor)
+            and "bbox_min" in fur.properties
+            and "bbox_max" in fur.properties
+            and "translation" in fur.properties
+        ]
+        boxes = np.array(
+            [
+                [
+                    fur.properties["bbox_min"],
+                    fur.properties["bbox_max"],
+                    fur.properties["translation"],
+                ]
+                for fur in furniture
+            ],
+            dtype=float,
+        ).reshape(-1, 3, 3)
+        return furniture, boxes[:, 0], boxes[:, 1], boxes[:, 2]
+
+    def _cg_check_for_relations(
+        self, translations: np.ndarray, dist_threshold: float = 1.5
+    ) -> List[Tuple[Optional[Furniture], Optional[str]]]:
+        """
+        Uses geometric heuristics to check for containment or support relation b/w
+        objects at the given (objects, 3) translations and furniture. All furniture
+        is tested for all objects at once. An object is "in" a furniture within its
+        bounding box, and "on" it if above the box, less than dist_threshold over
+        its top. Of these, the furniture with the closest translation is picked.
 
-    def _is_point_on_bbox(self, point, bbox_min, bbox_max):
-        # reshuffle coordinates to respect XYZ convention
-        point = np.array(point)[[0, 2, 1]]
-        bbox_min = np.array(bbox_min)[[0, 2, 1]]
-        bbox_max = np.array(bbox_max)[[0, 2, 1]]
-        # Check if point is within the XY extents and has a higher Z coordinate
-        within_xy = np.all((point[:2] >= bbox_min[:2]) & (point[:2] <= bbox_max[:2]))
-        higher_z = point[2] > bbox_max[2]
-        return within_xy and higher_z
+        :return: Per object, the furniture and relation, or None, None
+        """
+        points = np.asarray(translations, dtype=float).reshape(-1, 1, 3)
+        relations: List[Tuple[Optional[Furniture], Optional[str]]] = [
+            (None, None)
+        ] * len(points)
+        furniture, bbox_min, bbox_max, centers = self._get_furniture_boxes()
+        if not furniture or not len(points):
+            return relations
+
+        is_inside = (points >= bbox_min) & (points <= bbox_max)
+        # y is up: within the x-z extents and higher than the top
+        is_within_xz = is_inside[..., 0] & is_inside[..., 2]
+        is_within = is_within_xz & is_inside[..., 1]
+        height = points[..., 1] - bbox_max[:, 1]
+        is_on = is_within_xz & (height > 0) & (height < dist_threshold)
+
+        # few pairs are related, only their distances are needed
+        rows, cols = np.nonzero(is_within | is_on)
+        distances = np.linalg.norm(points[rows, 0] - centers[cols], axis=-1)
+        # per object, closest first with ties in graph order
+        order = np.lexsort((cols, distances, rows))
+        rows, cols = rows[order], cols[order]
+        is_first = np.ones(len(rows), dtype=bool)
+        is_first[1:] = rows[1:] != rows[:-1]
+        for row, col in zip(rows[is_first].tolist(), cols[is_first].tolist()):
+            relations[row] = (furniture[col], "in" if is_within[row, col] else "on")
+        return relations
 
     def _cg_check_for_relation(self, object_node):
         """
-        Uses geometric heuristics to check for containment or support relation b/w provided object and closest furniture
+        Uses geometric heuristics to check for containment or support relation b/w
+        provided object and furniture, see _cg_check_for_relations
         """
-        closest_furniture = self.get_closest_entities(
-            5,
-            object_node=object_node,
-            include_furniture=True,
-            include_objects=False,
-            include_rooms=False,
+        return self._cg_check_for_relations([object_node.properties["translation"]])[0]
+
+    @staticmethod
+    def _get_closest_indices(
+        distances: np.ndarray, n: int, dist_threshold: float = 1.5
+    ) -> List[np.ndarray]:
+        """
+        For each row of a (queries, entities) distance matrix, returns the columns
+        of the n closest entities within dist_threshold, closest first with ties in
+        column order. Matches get_closest_entities when columns are in graph order.
+        """
+        rows, cols = np.nonzero(distances < dist_threshold)
+        order = np.lexsort((cols, distances[rows, cols], rows))
+        rows, cols = rows[order], cols[order]
+        starts = np.searchsorted(rows, np.arange(len(distances)))
+        ends = np.searchsorted(rows, np.arange(len(distances)), side="right")
+        return [cols[start : min(end, start + n)] for start, end in zip(starts, ends)]
+
+    def _match_detections_to_objects(
+        self,
+        distances: np.ndarray,
+        detection_types: List[str],
+        object_types: List[str],
+        merge_threshold: float,
+    ) -> List[Optional[int]]:
+        """
+        ONLY FOR NON-PRIVILEGED GRAPH SETTING
+        Matches detections to existing objects given their (detections, objects)
+        distance matrix. A detection can match one of its closest objects, as
+        used for room assignment, if it has the same type and is closer than
+        merge_threshold. Pairs are assigned greedily, closest first, so that each
+        object matches at most one detection.
+
+        :return: Per detection, the column of its matching object or None
+        """
+        closest = self._get_closest_indices(
+            distances, self.MAX_NEIGHBORS_FOR_ROOM_ASSIGNMENT
         )
-        for fur in closest_furniture:
-            if not isinstance(fur, Floor):
-                is_within = self._is_point_within_bbox(
-                    object_node.properties["translation"],
-                    fur.properties["bbox_min"],
-                    fur.properties["bbox_max"],
-                )
-                if is_within:
-                    return fur, "in"
-                is_on = self._is_point_on_bbox(
-                    object_node.properties["translation"],
-                    fur.properties["bbox_min"],
-                    fur.properties["bbox_max"],
-                )
-                if is_on:
-                    return fur, "on"
-        return None, None
+        pairs = [
+            (distances[row, col], row, rank, col)
+            for row, cols in enumerate(closest)
+            for rank, col in enumerate(cols.tolist())
+            if distances[row, col] < merge_threshold
+            and object_types[col] == detection_types[row]
+        ]
+        matches: List[Optional[int]] = [None] * len(distances)
+        matched_objects = set()
+        for _, row, _, col in sorted(pairs):
+            if matches[row] is None and col not in matched_objects:
+                matches[row] = col
+                matched_objects.add(col)
+        return matches
+
+    def _get_holding_agents(
+        self, translations: np.ndarray, dist_threshold: float = 0.25
+    ) -> List[Optional[Entity]]:
+        """
+        ONLY FOR NON-PRIVILEGED GRAPH SETTING
+        Batched _non_privileged_graph_check_if_object_is_held: per detected
+        translation, the first agent whose end-effector is within dist_threshold
+        of it, or None
+        """
+        agent_nodes = self.get_agents()
+        # assumes agent names are agent_0 and agent_1
+        ee_positions = np.array(
+            [
+                self._articulated_agents[int(a_node.name.split("_")[1])]
+                .ee_transform()
+                .translation
+                for a_node in agent_nodes
+            ]
+        ).reshape(-1, 3)
+        is_close = (
+            np.linalg.norm(translations[:, None] - ee_positions[None], axis=-1)
+            < dist_threshold
+        )
+        return [
+            agent_nodes[int(np.argmax(row))] if row.any() else None for row in is_close
+        ]
+
+    def _assign_room_from_closest_objects(
+        self,
+        new_object_node: Object,
+        closest_objects: List[Entity],
+        verbose: bool = False,
+    ):
+        """
+        Adds an edge from new_object_node to the most common room among the
+        rooms of closest_objects
+        """
+        room_counts: Dict[Union[Object, Furniture], int] = {}
+        for obj in closest_objects:
+            for room in self.get_neighbors_of_type(obj, Room):
+                if verbose:
+                    self._logger.info(
+                        f"Adding {new_object_node.name} --> Closest object: {obj.name} is in room: {room.name}"
+                    )
+                if room in room_counts:
+                    room_counts[room] += 1
+                else:
+                    room_counts[room] = 1
+                # only use the first Room neighbor, i.e. closest room node
+                break
+        if room_counts:
+            closest_room = max(room_counts, key=room_counts.get)
+            self.add_edge(
+                new_object_node,
+                closest_room,
+                "in",
+                opposite_label="contains",
+            )
 
     def update_non_privileged_graph_with_detected_objects(
         self,
@@ -727,7 +878,11 @@ class DynamicWorldGraph(WorldGraph):
     ):
         """
         ONLY FOR NON-PRIVILEGED GRAPH SETTING
-        This method updates the graph based on the processed observations
+        This method updates the graph based on the processed observations.
+
+        Detections of a frame are associated with the existing objects all at
+        once, see _match_detections_to_objects. Matched and held objects are
+        updated, then the unmatched detections are added as new objects.
         """
         # finally update the agent locations based on camera pose
         self.update_agent_locations(frame_desc)
@@ -738,119 +893,175 @@ class DynamicWorldGraph(WorldGraph):
         # to the object's position...we can fix this with nano-SAM or using
         # analytical approaches to prune object PCD
         for uid, detector_frame in frame_desc.items():
-            if detector_frame["object_category_mapping"]:
-                obj_id_to_category_mapping = detector_frame["object_category_mapping"]
-                detector_frame["object_handle_mapping"]  # for sensing states
-                for object_id in detector_frame["object_masks"]:
-                    if not self._is_object(obj_id_to_category_mapping[object_id]):
-                        continue
-                    new_object_node = self.get_object_from_obs(
-                        detector_frame,
-                        object_id,
-                        uid,
-                        verbose,
-                        object_state_dict=object_state_dict,
-                    )
-                    if new_object_node is None:
-                        continue
-                    new_object_node.properties["time_of_update"] = time.time()
-
-                    # add an edge to the closest room to this object
-                    # get top N closest objects (N defined by self.max_neighbors_for_room_matching)
-                    closest_objects = self.get_closest_entities(
-                        self.MAX_NEIGHBORS_FOR_ROOM_ASSIGNMENT,
-                        object_node=new_object_node,
-                        include_furniture=False,
-                        include_rooms=False,
+            # frames that are not keyframes only update the agent's location
+            if (
+                not detector_frame.get("is_keyframe", True)
+                or not detector_frame["object_category_mapping"]
+            ):
+                continue
+            obj_id_to_category_mapping = detector_frame["object_category_mapping"]
+            # objects without pixels are not detected
+            object_ids = [
+                object_id
+                for object_id, pixel_indices in detector_frame[
+                    "object_pixel_indices"
+                ].items()
+                if self._is_object(obj_id_to_category_mapping[object_id])
+                and len(pixel_indices) > 0
+            ]
+            if not object_ids:
+                continue
+            if uid == 1:
+                # locations of objects seen by the human come from the sim
+                if "object_locations" not in detector_frame:
+                    raise KeyError(
+                        "[DynamicWorldGraph.update_non_privileged_graph_with_detected_objects] No object_locations found in detector_frame for human-detected objects"
                     )
-                    merge_threshold = 0.25  # default threshold
-                    if uid == 1:
-                        merge_threshold = 0.5  # increase threshold for human as object is held higher up
-                    (
-                        redundant_object,
-                        matching_object,
-                    ) = self._non_privileged_graph_check_if_object_is_redundant(
-                        new_object_node,
-                        closest_objects,
-                        merge_threshold=merge_threshold,
-                        verbose=verbose,
+                object_centroids = {
+                    object_id: detector_frame["object_locations"][object_id]
+                    for object_id in object_ids
+                }
+            else:
+                object_centroids = self.get_object_centroids_from_obs(
+                    detector_frame, object_ids
+                )
+            translations = np.array(
+                [object_centroids[object_id] for object_id in object_ids], dtype=float
+            )
+            detection_types = [
+                obj_id_to_category_mapping[object_id] for object_id in object_ids
+            ]
+
+            # detections x existing objects, in graph order
+            objects = [
+                node
+                for node in self._get_nodes_of_type(Object)
+                if "translation" in node.properties
+            ]
+            object_translations = np.array(
+                [node.properties["translation"] for node in objects], dtype=float
+            ).reshape(-1, 3)
+            distances = np.linalg.norm(
+                translations[:, None] - object_translations[None], axis=-1
+            )
+            merge_threshold = 0.25  # default threshold
+            if uid == 1:
+                merge_threshold = (
+                    0.5  # increase threshold for human as object is held higher up
+                )
+            matches = self._match_detections_to_objects(
+                distances,
+                detection_types,
+                [node.properties["type"] for node in objects],
+                merge_threshold,
+            )
+            holding_agents = self._get_holding_agents(translations)
+
+            # update the matched and held objects
+            unmatched = []
+            for index, object_id in enumerate(object_ids):
+                holding_agent = holding_agents[index]
+                if matches[index] is None and holding_agent is None:
+                    unmatched.append(index)
+                    continue
+                new_object_node = self.get_object_from_obs(
+                    detector_frame,
+                    object_id,
+                    uid,
+                    verbose,
+                    object_state_dict=object_state_dict,
+                    object_centroid=object_centroids[object_id],
+                )
+                new_object_node.properties["time_of_update"] = time.time()
+                if holding_agent is not None:
+                    self._logger.debug(
+                        f"NEWLY DETECTED OBJECT, {new_object_node.name}, IS BEING HELD by {holding_agent.name}"
                     )
-                    (
-                        held_object,
-                        held_object_node,
-                    ) = self._non_privileged_graph_check_if_object_is_held(
-                        new_object_node, verbose=True
+                if matches[index] is not None:
+                    matching_object = objects[matches[index]]
+                else:
+                    matching_object = holding_agent.properties.get(
+                        "last_held_object", None
                     )
-                    # only add this object is it is not being held by an agent
-                    # or if it is not already in the world-graph
-                    skip_adding_object = redundant_object | held_object
-
-                    if skip_adding_object:
-                        # update the matching object's translation and states
-                        if matching_object is None and held_object_node is not None:
-                            matching_object = held_object_node
-                        if matching_object is not None:
-                            matching_object.properties[
-                                "translation"
-                            ] = new_object_node.properties["translation"]
-                            if "states" in new_object_node.properties:
-                                matching_object.properties[
-                                    "states"
-                                ] = new_object_node.properties["states"]
-                            # add current time to the object's properties
-                            matching_object.properties[
-                                "time_of_update"
-                            ] = new_object_node.properties["time_of_update"]
-                            # verify translation update worked
-                            matching_node_from_wg = self.get_node_from_name(
-                                matching_object.name
-                            )
-                            # TODO: logic for checking surface-placement over another furniture
-                            assert (
-                                matching_node_from_wg.properties["translation"]
-                                == new_object_node.properties["translation"]
-                            )
-                        continue
+                if matching_object is None:
+                    continue
+                # last_held_object may be an outdated copy of the graph's node
+                matching_object = self.get_node_from_name(matching_object.name)
+                # update the matching object's translation and states
+                self.set_node_translation(
+                    matching_object, new_object_node.properties["translation"]
+                )
+                if "states" in new_object_node.properties:
+                    matching_object.properties["states"] = new_object_node.properties[
+                        "states"
+                    ]
+                # add current time to the object's properties
+                matching_object.properties[
+                    "time_of_update"
+                ] = new_object_node.properties["time_of_update"]
+
+            if len(unmatched) < len(object_ids):
+                # closest objects for room assignment are taken where the
+                # matched objects are now
+                objects = [self.get_node_from_name(node.name) for node in objects]
+                object_translations = np.array(
+                    [node.properties["translation"] for node in objects], dtype=float
+                ).reshape(-1, 3)
+                distances[unmatched] = np.linalg.norm(
+                    translations[unmatched][:, None] - object_translations[None],
+                    axis=-1,
+                )
 
-                    self.add_node(new_object_node)
-                    self._entity_names.append(new_object_node.name)
-                    self._logger.info(f"Added new object to CG: {new_object_node}")
-                    reference_furniture, relation = self._cg_check_for_relation(
-                        new_object_node
+            # add the unmatched detections as new objects; closest objects for
+            # room assignment include the ones added before from this frame
+            added_translations = translations[unmatched]
+            added_distances = np.linalg.norm(
+                added_translations[:, None] - added_translations[None], axis=-1
+            )
+            added_distances[np.triu_indices(len(unmatched))] = np.inf
+            all_closest = self._get_closest_indices(
+                np.concatenate([distances[unmatched], added_distances], axis=1),
+                self.MAX_NEIGHBORS_FOR_ROOM_ASSIGNMENT,
+            )
+            all_relations = self._cg_check_for_relations(added_translations)
+            added_objects: List[Object] = []
+            for index, closest, (reference_furniture, relation) in zip(
+                unmatched, all_closest, all_relations
+            ):
+                new_object_node = self.get_object_from_obs(
+                    detector_frame,
+                    object_ids[index],
+                    uid,
+                    verbose,
+                    object_state_dict=object_state_dict,
+                    object_centroid=object_centroids[object_ids[index]],
+                )
+                new_object_node.properties["time_of_update"] = time.time()
+                closest_objects = [
+                    objects[col]
+                    if col < len(objects)
+                    else added_objects[col - len(objects)]
+                    for col in closest.tolist()
+                ]
+
+                self.add_node(new_object_node)
+                added_objects.append(new_object_node)
+                self._logger.info(f"Added new object to CG: {new_object_node}")
+                if reference_furniture is not None and relation is not None:
+                    self.add_edge(
+                        reference_furniture,
+                        new_object_node,
+                        relation,
+                        flip_edge(relation),
+                    )
+                else:
+                    # if not redundant and not belonging to a furniture
+                    # then find the room this object should belong to
+                    # find most common room among these objects
+                    # TODO: get closest objects but only consider those visible to agent
+                    self._assign_room_from_closest_objects(
+                        new_object_node, closest_objects, verbose
                     )
-                    if reference_furniture is not None and relation is not None:
-                        self.add_edge(
-                            reference_furniture,
-                            new_object_node,
-                            relation,
-                            flip_edge(relation),
-                        )
-                    else:
-                        # if not redundant and not belonging to a furniture
-                        # then find the room this object should belong to
-                        # find most common room among these objects
-                        # TODO: get closest objects but only consider those visible to agent
-                        room_counts: Dict[Union[Object, Furniture], int] = {}
-                        for obj in closest_objects:
-                            for room in self.get_neighbors_of_type(obj, Room):
-                                if verbose:
-                                    self._logger.info(
-                                        f"Adding {new_object_node.name} --> Closest object: {obj.name} is in room: {room.name}"
-                                    )
-                                if room in room_counts:
-                                    room_counts[room] += 1
-                                else:
-                                    room_counts[room] = 1
-                                # only use the first Room neighbor, i.e. closest room node
-                                break
-                        if room_counts:
-                            closest_room = max(room_counts, key=room_counts.get)
-                            self.add_edge(
-                                new_object_node,
-                                closest_room,
-                                "in",
-                                opposite_label="contains",
-                            )
 
     def update_by_action(
         self,
@@ -1023,7 +1234,6 @@ class DynamicWorldGraph(WorldGraph):
                 if object_node is not None:
                     if drop_placed_object_flag:
                         self.remove_node(object_node)
-                        self._entity_names.remove(object_node.name)
                         if "last_held_object" in agent_node.properties:
                             del agent_node.properties["last_held_object"]
                         self._logger.debug("Object deleted once robot placed it")
@@ -1177,9 +1387,9 @@ class DynamicWorldGraph(WorldGraph):
                     self.add_edge(
                         most_likely_held_object, agent_node, "on", flip_edge("on")
                     )
-                    most_likely_held_object.properties[
-                        "translation"
-                    ] = agent_node.properties["translation"]
+                    self.set_node_translation(
+                        most_likely_held_object, agent_node.properties["translation"]
+                    )
                     # also update last_held_object property
                     agent_node.properties["last_held_object"] = most_likely_held_object
                     self._logger.debug(
@@ -1226,7 +1436,6 @@ class DynamicWorldGraph(WorldGraph):
                         most_likely_held_object is not None and drop_placed_object_flag
                     ):
                         self.remove_node(most_likely_held_object)
-                        self._entity_names.remove(most_likely_held_object.name)
                         del agent_node.properties["last_held_object"]
                         self._logger.debug(
                             "CG updated per Human place; we just removed the object"
@@ -6,7 +6,6 @@
 
 from __future__ import annotations
 
-import copy
 import math
 import random
 from typing import TYPE_CHECKING, List, Optional, Tuple, Union
@@ -40,6 +39,8 @@ class Floor(Furniture):
     This class represents floors
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties):
         # Call Entity constructor
@@ -81,13 +82,6 @@ class Floor(Furniture):
             target_handle=reference_handle,
         )
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return Floor(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-        )
-
 
 def get_floor_object_ids(
     sim: habitat_sim.Simulator,
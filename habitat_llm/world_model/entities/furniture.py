@@ -6,7 +6,6 @@
 
 from __future__ import annotations
 
-import copy
 import math
 import random
 from typing import TYPE_CHECKING, List, Tuple
@@ -66,19 +65,13 @@ class Furniture(Entity):
     which can contain objects
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return Furniture(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
     def is_articulated(self):
         """
         This method tells if the furniture is articulated or not
@@ -5,6 +5,7 @@
 # LICENSE file in the root directory of this source tree
 
 import copy
+import sys
 from abc import ABC
 
 
@@ -14,8 +15,14 @@ class Entity(ABC):  # noqa: B024
     Room, Receptacle, Surface or an Object in the robot's model of the world.
     It contains state variables to represent a unique id, short_name,
     and various metric and semantic properties.
+
+    Entities have no instance __dict__; subclasses must declare __slots__ too.
+    String property values (types, categories, ...) repeat across entities and
+    are interned.
     """
 
+    __slots__ = ("name", "properties", "sim_handle")
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Unique string for representing this node
@@ -25,6 +32,9 @@ class Entity(ABC):  # noqa: B024
         # Some common properties are "category", "position"
         if "type" not in properties:
             properties["type"] = "entity_node"
+        for key, value in properties.items():
+            if type(value) is str:
+                properties[key] = sys.intern(value)
         self.properties = properties
 
         # Optional member to represent sim handle
@@ -32,11 +42,40 @@ class Entity(ABC):  # noqa: B024
 
     # Deep copy
     def __deepcopy__(self, memo):
-        return Entity(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
+        clone = self.__class__.__new__(self.__class__)
+        clone.name = copy.deepcopy(self.name, memo)
+        clone.properties = copy.deepcopy(self.properties, memo)
+        clone.sim_handle = copy.deepcopy(self.sim_handle, memo)
+        return clone
+
+    # Shallow copy
+    def __copy__(self):
+        """
+        Returns a copy whose properties can be modified without affecting this
+        entity. Container-valued properties (translation, states, ...) are
+        copied one level deep; everything else, e.g. sim regions, is shared.
+        """
+        clone = self.__class__.__new__(self.__class__)
+        clone.name = self.name
+        clone.sim_handle = self.sim_handle
+        clone.properties = {
+            key: value.copy() if isinstance(value, (dict, list)) else value
+            for key, value in self.properties.items()
+        }
+        return clone
+
+    # Pickling, also reads entities pickled when they still had a __dict__
+    def __getstate__(self):
+        return {
+            "name": self.name,
+            "properties": self.properties,
+            "sim_handle": self.sim_handle,
+        }
+
+    def __setstate__(self, state):
+        self.name = state["name"]
+        self.properties = state["properties"]
+        self.sim_handle = state.get("sim_handle")
 
     # Hashing Operator
     def __hash__(self):
@@ -81,57 +120,39 @@ class UncategorizedEntity(Entity):
     an object or receptacle per rearrangement nomenclature
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return UncategorizedEntity(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
 
 class House(Entity):
     """
     This class represents the house in the world
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return House(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
 
 class Room(Entity):
     """
     This class represents a room in the world
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return Room(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
 
 class Receptacle(Entity):
     """
@@ -140,72 +161,48 @@ class Receptacle(Entity):
     This is only required because simulator has a notion of it
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return Receptacle(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
 
 class Object(Entity):
     """
     This class represents a small movable object in the world.
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return Object(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
 
 class SpotRobot(Entity):
     """
     This class represents spot robot
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
 
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return SpotRobot(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
-
 
 class Human(Entity):
     """
     This class represents human
     """
 
+    __slots__ = ()
+
     # Parameterized Constructor
     def __init__(self, name, properties, sim_handle=None):
         # Call Entity constructor
         super().__init__(name, properties, sim_handle)
-
-    # Deep copy
-    def __deepcopy__(self, memo):
-        return Human(
-            copy.deepcopy(self.name, memo),
-            copy.deepcopy(self.properties, memo),
-            copy.deepcopy(self.sim_handle, memo),
-        )
@@ -5,69 +5,807 @@
 # LICENSE file in the root directory of this source tree
 
 import copy
+import heapq
+import itertools
 import random
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import IO, Any, Dict, List, Optional, Set, Tuple, Type, Union
+
+import numpy as np
 
 from habitat_llm.world_model import (
     Entity,
     Furniture,
+    House,
     Human,
     Object,
     Receptacle,
     Room,
     SpotRobot,
+    UncategorizedEntity,
+)
+from habitat_llm.world_model.graph_snapshot import (
+    load_graph_snapshot,
+    save_graph_snapshot,
 )
+from habitat_llm.world_model.spatial_index import SpatialIndex
+
+
+@dataclass
+class GraphChanges:
+    """
+    Nodes and edges touched by a Graph update. Edges are
+    (node, neighbor, edge_label) tuples in the direction they were changed.
+    """
+
+    added_nodes: List[Entity] = field(default_factory=list)
+    modified_nodes: List[Entity] = field(default_factory=list)
+    removed_nodes: List[Entity] = field(default_factory=list)
+    added_edges: List[Tuple[Entity, Entity, str]] = field(default_factory=list)
+    modified_edges: List[Tuple[Entity, Entity, str]] = field(default_factory=list)
+    removed_edges: List[Tuple[Entity, Entity, str]] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        """
+        True if nothing was changed
+        """
+        return not (
+            self.added_nodes
+            or self.modified_nodes
+            or self.removed_nodes
+            or self.added_edges
+            or self.modified_edges
+            or self.removed_edges
+        )
+
+
+# Depth of each entity class in the containment tree (house -> room ->
+# furniture/agents -> receptacle -> object). A node's parent is its closest
+# neighbor higher up in this order.
+CONTAINMENT_LEVELS: List[Tuple[Type[Entity], ...]] = [
+    (House,),
+    (Room,),
+    (Furniture, SpotRobot, Human),
+    (Receptacle,),
+    (Object, UncategorizedEntity),
+]
 
 
 class Graph:
     """
     This class represents a Directed Acyclic Graph.
+
+    Graphs can share structure through snapshot(). Nodes of a graph that shares
+    structure must be modified through get_writable_node(s) rather than in
+    place; the graph's own mutators take care of this themselves.
     """
 
+    # When True, lookup indices are verified against the adjacency dict after
+    # every mutation. Meant for tests; this makes every mutation O(N).
+    consistency_checks_enabled: bool = False
+
+    # Attributes stored in snapshots besides nodes and edges, see save_snapshot
+    _snapshot_attributes: Tuple[str, ...] = ()
+
     # Parameterized Constructor
     def __init__(self, graph=None):
         # Create a graph to store different entities in the world
         # and their relations to one another
         if graph is None:
             graph = {}
+        # Incremented on every change to the nodes or edges, see version
+        self._version = 0
         self.graph = graph
 
+    @property
+    def graph(self) -> Dict[Entity, Dict[Entity, str]]:
+        """
+        Adjacency dict mapping each node to a dict of {neighbor: edge_label}
+        """
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph: Dict[Entity, Dict[Entity, str]]):
+        # Replacing the adjacency dict invalidates all lookup indices
+        self._graph = graph
+        self._rebuild_indices()
+        self._maybe_check_consistency()
+
+    def _rebuild_indices(self):
+        """
+        Rebuilds the name, sim_handle and type lookup tables from the adjacency dict
+        """
+        self._name_to_node: Dict[str, Entity] = {}
+        self._sim_handle_to_nodes: Dict[Optional[str], Dict[Entity, None]] = {}
+        # Nodes bucketed by their exact class, each mapped to its insertion
+        # rank so that buckets can be merged back in graph order
+        self._nodes_by_class: Dict[type, Dict[Entity, int]] = {}
+        self._insertion_counter = len(self._graph)
+        # Reverse adjacency: node -> nodes having an edge to it
+        self._incoming: Dict[Entity, Dict[Entity, None]] = {}
+        # Built on the first nearest-entity query, see _get_spatial_index
+        self._spatial_index: Optional[SpatialIndex] = None
+        # Containment tree as child name -> parent name, built on the first
+        # ancestry query, see _get_parent_names
+        self._parent_names: Optional[Dict[str, str]] = None
+        # Version at which each room last changed, tracked once requested,
+        # see get_room_versions
+        self._room_versions: Optional[Dict[Optional[str], int]] = None
+        self._version += 1
+        # Same as calling _index_node on every node, in bulk
+        for rank, node in enumerate(self._graph):
+            self._name_to_node[node.name] = node
+            self._sim_handle_to_nodes.setdefault(node.sim_handle, {})[node] = None
+            self._nodes_by_class.setdefault(type(node), {})[node] = rank
+            self._incoming[node] = {}
+        for node, edges in self._graph.items():
+            for neighbor in edges:
+                self._incoming.setdefault(neighbor, {})[node] = None
+        # Copy-on-write bookkeeping, see snapshot(). While _copy_on_write is
+        # set, only the nodes and adjacency rows named here may be modified
+        # in place; everything else may be shared with another graph.
+        self._copy_on_write = False
+        self._owned_nodes: Set[str] = set()
+        self._owned_rows: Set[str] = set()
+
+    def _index_node(self, node: Entity):
+        """
+        Adds a newly inserted node to the lookup tables
+        """
+        self._name_to_node[node.name] = node
+        # Multiple nodes can share a sim_handle (e.g. non-privileged furniture
+        # matched to the same sim furniture); keep them in insertion order.
+        # Buckets are replaced rather than updated so snapshots can share them.
+        nodes_with_handle = self._sim_handle_to_nodes.get(node.sim_handle, {})
+        self._sim_handle_to_nodes[node.sim_handle] = {**nodes_with_handle, node: None}
+        self._nodes_by_class.setdefault(type(node), {})[node] = self._insertion_counter
+        self._insertion_counter += 1
+        if self._spatial_index is not None:
+            self._spatial_index.insert(node)
+
+    def _unindex_sim_handle(self, node: Entity):
+        """
+        Removes a node from the sim_handle lookup table
+        """
+        nodes_with_handle = self._sim_handle_to_nodes.get(node.sim_handle)
+        if nodes_with_handle is not None and node in nodes_with_handle:
+            remaining = {other: None for other in nodes_with_handle if other != node}
+            if remaining:
+                self._sim_handle_to_nodes[node.sim_handle] = remaining
+            else:
+                del self._sim_handle_to_nodes[node.sim_handle]
+
+    def _unindex_node(self, node: Entity):
+        """
+        Removes a node from the lookup tables
+        """
+        node = self._name_to_node.pop(node.name, node)
+        self._unindex_sim_handle(node)
+        nodes_of_class = self._nodes_by_class.get(type(node))
+        if nodes_of_class is not None:
+            nodes_of_class.pop(node, None)
+        if self._spatial_index is not None:
+            self._spatial_index.remove(node)
+
+    def _detach_node(self, node: Entity) -> Dict[Entity, str]:
+        """
+        Removes node from the adjacency dict and lookup tables along with the
+        edges to and from it. Only touches the node's neighbours.
+        Returns the node's outgoing edges.
+        """
+        rooms_before = self._get_room_names(
+            [node, *self.graph[node], *self._incoming.get(node, {})]
+        )
+        edges = self.graph.pop(node)
+        for neighbor in edges:
+            self._get_writable_sources(neighbor).pop(node, None)
+        sources = self._incoming.pop(node, {})
+        for source in sources:
+            if source in self.graph:
+                self._get_writable_row(source).pop(node, None)
+        self._unindex_node(node)
+        if self._parent_names is not None:
+            self._parent_names.pop(node.name, None)
+            for neighbor in itertools.chain(edges, sources):
+                self._on_edge_removed(neighbor, node)
+        self._record_change(
+            [
+                neighbor
+                for neighbor in itertools.chain(edges, sources)
+                if neighbor in self.graph
+            ],
+            rooms_before,
+        )
+        return edges
+
+    def snapshot(self) -> "Graph":
+        """
+        Returns a copy-on-write snapshot of this graph.
+
+        The snapshot shares entity objects and adjacency rows with this graph.
+        Whichever of the two is modified first clones only the rows and nodes
+        it touches, so taking a snapshot costs a few dict copies instead of a
+        deepcopy of every entity.
+        """
+        snapshot = self.__class__()
+        snapshot._share_structure_from(self)
+        return snapshot
+
+    def _share_structure_from(self, other_graph: "Graph"):
+        """
+        Makes this graph a copy-on-write view of other_graph. Room versions,
+        if tracked, carry over with the rooms that differ in the two graphs
+        marked as changed.
+        """
+        room_versions = self._room_versions
+        if room_versions is not None:
+            changed_rooms = self._get_changed_rooms(other_graph)
+        self._graph = dict(other_graph._graph)
+        self._name_to_node = dict(other_graph._name_to_node)
+        self._sim_handle_to_nodes = dict(other_graph._sim_handle_to_nodes)
+        self._nodes_by_class = {
+            node_class: dict(nodes)
+            for node_class, nodes in other_graph._nodes_by_class.items()
+        }
+        self._insertion_counter = other_graph._insertion_counter
+        self._incoming = dict(other_graph._incoming)
+        self._spatial_index = None
+        self._parent_names = (
+            dict(other_graph._parent_names)
+            if other_graph._parent_names is not None
+            else None
+        )
+        # Room versions of other_graph don't describe changes to this one, so
+        # this graph keeps its own
+        self._room_versions = room_versions
+        self._version += 1
+        if room_versions is not None:
+            for room_name in changed_rooms:
+                room_versions[room_name] = self._version
+        self.mark_nodes_shared()
+        other_graph.mark_nodes_shared()
+        self._maybe_check_consistency()
+
+    def _get_changed_rooms(self, other_graph: "Graph") -> Set[Optional[str]]:
+        """
+        Returns the rooms, in either graph, of the nodes that are only in one
+        of the two graphs or whose class or edges differ between them. Rows
+        shared by copy-on-write snapshots are skipped without comparing them.
+        """
+        changed_nodes: List[Entity] = []
+        other_changed_nodes: List[Entity] = []
+        for other_node, other_edges in other_graph._graph.items():
+            node = self._name_to_node.get(other_node.name)
+            if node is None:
+                other_changed_nodes.append(other_node)
+                continue
+            edges = self._graph[node]
+            # Entities compare by name, so rows compare by names and labels
+            if type(node) is not type(other_node) or (
+                edges is not other_edges and edges != other_edges
+            ):
+                changed_nodes.append(node)
+                other_changed_nodes.append(other_node)
+        changed_nodes.extend(
+            node for node in self._graph if node.name not in other_graph._name_to_node
+        )
+        return {self.get_room_name(node) for node in changed_nodes} | {
+            other_graph.get_room_name(node) for node in other_changed_nodes
+        }
+
+    def mark_nodes_shared(self):
+        """
+        Marks every node and adjacency row of this graph as possibly shared
+        with another graph, so that they get cloned before being modified.
+        Call this after handing this graph's nodes to another graph.
+        """
+        self._copy_on_write = True
+        self._owned_nodes = set()
+        self._owned_rows = set()
+
+    def _is_node_shared(self, node_name: str) -> bool:
+        return self._copy_on_write and node_name not in self._owned_nodes
+
+    def _claim_node(self, node: Entity):
+        """
+        Records that node and its adjacency row belong to this graph only
+        """
+        if self._copy_on_write:
+            self._owned_nodes.add(node.name)
+            self._owned_rows.add(node.name)
+
+    def _claim_rows(self, node: Entity):
+        """
+        Copies the adjacency and reverse adjacency rows of node if they are shared
+        """
+        if self._copy_on_write and node.name not in self._owned_rows:
+            if node in self._graph:
+                self._graph[node] = dict(self._graph[node])
+            if node in self._incoming:
+                self._incoming[node] = dict(self._incoming[node])
+            self._owned_rows.add(node.name)
+
+    def _get_writable_row(self, node: Entity) -> Dict[Entity, str]:
+        """
+        Returns the adjacency row of node, safe to modify in place
+        """
+        self._claim_rows(node)
+        return self._graph[node]
+
+    def _get_writable_sources(self, node: Entity) -> Dict[Entity, None]:
+        """
+        Returns the reverse adjacency row of node, safe to modify in place
+        """
+        self._claim_rows(node)
+        return self._incoming.get(node, {})
+
+    def get_writable_node(self, node: Union[str, Entity]) -> Entity:
+        """
+        Returns the node with given name, safe to modify in place
+        """
+        return self.get_writable_nodes([node])[0]
+
+    def get_writable_nodes(self, nodes: List[Union[str, Entity]]) -> List[Entity]:
+        """
+        Returns the nodes with given names, safe to modify in place.
+        Nodes still shared with a snapshot are replaced by shallow clones.
+        Pass all nodes about to be modified at once; swapping in clones
+        costs O(N) per call.
+        """
+        writable_nodes = []
+        clones: Dict[str, Entity] = {}
+        for node in nodes:
+            node_name = node if isinstance(node, str) else node.name
+            node = self.get_node_from_name(node_name)
+            if self._is_node_shared(node_name):
+                if node_name not in clones:
+                    clones[node_name] = copy.copy(node)
+                node = clones[node_name]
+            writable_nodes.append(node)
+
+        if clones:
+            self._replace_nodes(clones)
+            self._owned_nodes.update(clones)
+            self._maybe_check_consistency()
+        return writable_nodes
+
+    def _replace_nodes(self, replacements: Dict[str, Entity]):
+        """
+        Swaps nodes for equally named replacements in the adjacency dict and
+        lookup tables, keeping graph order
+        """
+        # Dict keys can't be swapped in place without losing their position
+        self._graph = {
+            replacements.get(node.name, node): edges
+            for node, edges in self._graph.items()
+        }
+
+        # Rows that point to a replaced node. The reverse adjacency is only
+        # ever matched by name so it can keep referring to the old objects.
+        sources = {
+            source.name
+            for node_name in replacements
+            for source in self._incoming.get(replacements[node_name], {})
+        }
+        for source_name in sources:
+            source = self._name_to_node[source_name]
+            source = replacements.get(source_name, source)
+            self._claim_rows(source)
+            self._graph[source] = {
+                replacements.get(neighbor.name, neighbor): edge
+                for neighbor, edge in self._graph[source].items()
+            }
+
+        replaced_classes = set()
+        for node_name, node in replacements.items():
+            self._name_to_node[node_name] = node
+            if self._spatial_index is not None:
+                self._spatial_index.update(node)
+            replaced_classes.add(type(node))
+            nodes_with_handle = self._sim_handle_to_nodes.get(node.sim_handle)
+            if nodes_with_handle is not None and node in nodes_with_handle:
+                self._sim_handle_to_nodes[node.sim_handle] = {
+                    replacements.get(other.name, other): None
+                    for other in nodes_with_handle
+                }
+        for node_class in replaced_classes:
+            self._nodes_by_class[node_class] = {
+                replacements.get(node.name, node): rank
+                for node, rank in self._nodes_by_class[node_class].items()
+            }
+
+    def _maybe_check_consistency(self):
+        if self.consistency_checks_enabled:
+            self.check_consistency()
+
+    def check_consistency(self):
+        """
+        Verifies that the lookup indices agree with the adjacency dict.
+        Raises ValueError describing the first mismatch found.
+        """
+        if len(self._name_to_node) != len(self.graph):
+            raise ValueError(
+                f"Name index has {len(self._name_to_node)} entries for {len(self.graph)} nodes"
+            )
+        for node, edges in self.graph.items():
+            if self._name_to_node.get(node.name) is not node:
+                raise ValueError(f"Name index out of sync for node {node.name}")
+            if node not in self._nodes_by_class.get(type(node), {}):
+                raise ValueError(f"Type index out of sync for node {node.name}")
+            if node not in self._sim_handle_to_nodes.get(node.sim_handle, {}):
+                raise ValueError(f"Sim handle index out of sync for node {node.name}")
+            for neighbor in edges:
+                if node not in self._incoming.get(neighbor, {}):
+                    raise ValueError(
+                        f"Missing reverse edge {neighbor.name} <- {node.name}"
+                    )
+        if sum(len(nodes) for nodes in self._nodes_by_class.values()) != len(
+            self.graph
+        ):
+            raise ValueError("Type index contains nodes that are not in the graph")
+        for node, sources in self._incoming.items():
+            for source in sources:
+                if node not in self.graph.get(source, {}):
+                    raise ValueError(f"Stale reverse edge {node.name} <- {source.name}")
+        if self._parent_names is not None:
+            for node in self.graph:
+                parent = self._find_parent(node)
+                if self._parent_names.get(node.name) != (
+                    parent.name if parent is not None else None
+                ):
+                    raise ValueError(
+                        f"Containment tree out of sync for node {node.name}"
+                    )
+            if set(self._parent_names) - set(self._name_to_node):
+                raise ValueError(
+                    "Containment tree contains nodes that are not in the graph"
+                )
+        if self._spatial_index is not None:
+            num_located = 0
+            for node in self.graph:
+                if node.properties.get("translation") is None:
+                    continue
+                num_located += 1
+                if node not in self._spatial_index or not np.array_equal(
+                    self._spatial_index.get_position(node),
+                    np.array(node.properties["translation"], dtype=float),
+                ):
+                    raise ValueError(f"Spatial index out of sync for node {node.name}")
+            if num_located != len(self._spatial_index):
+                raise ValueError(
+                    "Spatial index contains nodes that are not in the graph"
+                )
+
+    @staticmethod
+    def _get_containment_level(node: Entity) -> Optional[int]:
+        """
+        Returns the depth of node's class in the containment tree, or None if
+        the class takes no part in it
+        """
+        for level, class_types in enumerate(CONTAINMENT_LEVELS):
+            if isinstance(node, class_types):
+                return level
+        return None
+
+    def _find_parent(self, node: Entity) -> Optional[Entity]:
+        """
+        Scans the neighbors of node for its parent: the neighbor with the
+        deepest level above node's own, first in edge order on ties
+        """
+        level = self._get_containment_level(node)
+        if level is None:
+            return None
+        parent, parent_level = None, -1
+        for neighbor in self.graph.get(node, {}):
+            neighbor_level = self._get_containment_level(neighbor)
+            if neighbor_level is not None and parent_level < neighbor_level < level:
+                parent, parent_level = neighbor, neighbor_level
+        return parent
+
+    def _get_parent_names(self) -> Dict[str, str]:
+        """
+        Returns the containment tree as child name -> parent name, building it
+        on first use
+        """
+        if self._parent_names is None:
+            self._parent_names = {}
+            for node in self.graph:
+                parent = self._find_parent(node)
+                if parent is not None:
+                    self._parent_names[node.name] = parent.name
+        return self._parent_names
+
+    def _on_edge_added(self, node: Entity, neighbor: Entity):
+        """
+        Updates the parent of node after an edge to neighbor was added
+        """
+        level = self._get_containment_level(node)
+        neighbor_level = self._get_containment_level(neighbor)
+        if level is None or neighbor_level is None or neighbor_level >= level:
+            return
+        parent_name = self._parent_names.get(node.name)
+        if parent_name is None or neighbor_level > self._get_containment_level(
+            self._name_to_node[parent_name]
+        ):
+            self._parent_names[node.name] = neighbor.name
+
+    def _on_edge_removed(self, node: Entity, neighbor: Entity):
+        """
+        Updates the parent of node after its edge to neighbor was removed
+        """
+        if node in self.graph and self._parent_names.get(node.name) == neighbor.name:
+            parent = self._find_parent(node)
+            if parent is None:
+                del self._parent_names[node.name]
+            else:
+                self._parent_names[node.name] = parent.name
+
+    def get_parent(self, node: Union[str, Entity]) -> Optional[Entity]:
+        """
+        Returns the parent of node in the containment tree, e.g. the furniture
+        an object is on or the room a furniture is in, or None
+        """
+        node_name = node if isinstance(node, str) else node.name
+        parent_name = self._get_parent_names().get(node_name)
+        if parent_name is None:
+            return None
+        return self._name_to_node[parent_name]
+
+    def get_path_to_root(self, node: Union[str, Entity]) -> List[Entity]:
+        """
+        Returns [node, parent, grandparent, ...] up to the root of node's
+        containment tree, in O(depth)
+        """
+        if isinstance(node, str):
+            node = self.get_node_from_name(node)
+        parent_names = self._get_parent_names()
+        path = [node]
+        parent_name = parent_names.get(node.name)
+        while parent_name is not None:
+            path.append(self._name_to_node[parent_name])
+            parent_name = parent_names.get(parent_name)
+        return path
+
+    def get_common_ancestor(
+        self, node1: Union[str, Entity], node2: Union[str, Entity]
+    ) -> Optional[Entity]:
+        """
+        Returns the deepest node that both nodes are (or are under) in the
+        containment tree, or None if they are in different trees
+        """
+        ancestors = {ancestor.name for ancestor in self.get_path_to_root(node1)}
+        for ancestor in self.get_path_to_root(node2):
+            if ancestor.name in ancestors:
+                return ancestor
+        return None
+
+    @property
+    def version(self) -> int:
+        """
+        Counter incremented whenever nodes or edges are added, removed or
+        relabeled. Node properties can be edited in place and are not tracked.
+        """
+        return self._version
+
+    def get_room_versions(self) -> Dict[Optional[str], int]:
+        """
+        Returns room name -> version at which a node in that room, or the room
+        itself, last changed. Nodes outside of any room count as room None.
+        Rooms missing from the dict have not changed since tracking started
+        with the first call to this method. The dict is replaced when the
+        adjacency dict is assigned, so a stale reference means everything
+        changed; sharing another graph's structure keeps it, see
+        _share_structure_from.
+        """
+        if self._room_versions is None:
+            self._get_parent_names()
+            self._room_versions = {}
+        return self._room_versions
+
+    def get_room_name(self, node: Entity) -> Optional[str]:
+        """
+        Returns the name of the room node is in according to the containment
+        tree, or None. Rooms are in themselves.
+        """
+        parent_names = self._get_parent_names()
+        node_name = node.name
+        while not isinstance(self._name_to_node.get(node_name), Room):
+            node_name = parent_names.get(node_name)
+            if node_name is None:
+                return None
+        return node_name
+
+    def _get_room_names(self, nodes: List[Entity]) -> List[Optional[str]]:
+        """
+        Returns the rooms of nodes if room versions are tracked, else nothing
+        """
+        if self._room_versions is None:
+            return []
+        return [self.get_room_name(node) for node in nodes]
+
+    def _record_change(
+        self, nodes: List[Entity], rooms_before: List[Optional[str]] = ()
+    ):
+        """
+        Bumps the graph version along with the versions of rooms_before and
+        of the rooms nodes are in now
+        """
+        self._version += 1
+        if self._room_versions is not None:
+            for room_name in itertools.chain(rooms_before, self._get_room_names(nodes)):
+                self._room_versions[room_name] = self._version
+
+    def _get_spatial_index(self) -> SpatialIndex:
+        """
+        Returns the spatial index over node translations, building it on first use
+        """
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex()
+            for node in self.graph:
+                self._spatial_index.insert(node)
+        return self._spatial_index
+
+    def set_node_translation(self, node: Union[str, Entity], translation):
+        """
+        Sets the translation of a node and moves it in the spatial index.
+        Translations should be changed through this method rather than in place.
+        """
+        if isinstance(node, str):
+            node = self.get_node_from_name(node)
+        node.properties["translation"] = translation
+        if self._spatial_index is not None:
+            self._spatial_index.update(node)
+
+    def set_node_sim_handle(
+        self, node: Union[str, Entity], sim_handle: Optional[str]
+    ) -> Entity:
+        """
+        Sets the sim_handle of a node and moves it in the sim_handle lookup
+        table. sim_handle should be changed through this method rather than in
+        place. Returns the node, cloned first if it was shared with a snapshot.
+        """
+        node = self.get_writable_node(node)
+        self._unindex_sim_handle(node)
+        node.sim_handle = sim_handle
+        nodes_with_handle = self._sim_handle_to_nodes.get(sim_handle, {})
+        self._sim_handle_to_nodes[sim_handle] = {**nodes_with_handle, node: None}
+        return node
+
+    def _get_closest_nodes(
+        self,
+        location,
+        n: int,
+        dist_threshold: float,
+        class_types: Tuple[Type[Entity], ...],
+    ) -> List[Entity]:
+        """
+        Returns the n nodes of class_types closest to location, closer than
+        dist_threshold if it is positive. Ranks exactly like sorting every node
+        by distance would: ties keep the order of class_types, then graph order.
+        """
+        spatial_index = self._get_spatial_index()
+        location = np.array(location)
+        if dist_threshold > 0.0:
+            candidates = spatial_index.query_radius(
+                location, dist_threshold, class_types
+            )
+        else:
+            candidates = spatial_index.query_nearest(location, n, class_types)
+
+        ranked = []
+        for node in candidates:
+            distance = np.linalg.norm(
+                location - np.array(node.properties["translation"])
+            )
+            if dist_threshold > 0.0 and not distance < dist_threshold:
+                continue
+            class_rank = next(
+                rank
+                for rank, class_type in enumerate(class_types)
+                if isinstance(node, class_type)
+            )
+            insertion_rank = self._nodes_by_class[type(node)][node]
+            ranked.append((distance, class_rank, insertion_rank, node))
+        ranked.sort(key=itemgetter(0, 1, 2))
+        return [node for *_, node in ranked[:n]]
+
+    def _get_class_buckets(
+        self, class_type: Union[Type[Entity], Tuple[Type[Entity], ...]]
+    ) -> List[Dict[Entity, int]]:
+        """
+        Returns the non-empty node buckets whose class matches class_type,
+        including subclasses
+        """
+        return [
+            nodes
+            for node_class, nodes in self._nodes_by_class.items()
+            if nodes and issubclass(node_class, class_type)
+        ]
+
+    def _get_nodes_of_type(
+        self, class_type: Union[Type[Entity], Tuple[Type[Entity], ...]]
+    ) -> List[Entity]:
+        """
+        Returns all nodes of given class (or tuple of classes) in insertion order.
+        Costs O(result size) instead of a scan over the whole graph.
+        """
+        buckets = self._get_class_buckets(class_type)
+        if len(buckets) == 1:
+            return list(buckets[0])
+        return [
+            node
+            for node, _ in heapq.merge(
+                *(nodes.items() for nodes in buckets), key=itemgetter(1)
+            )
+        ]
+
+    def _lookup_sim_handle(self, node_sim_handle) -> Optional[Entity]:
+        """
+        Returns the first node carrying the given sim_handle, or None
+        """
+        nodes_with_handle = self._sim_handle_to_nodes.get(node_sim_handle)
+        if nodes_with_handle:
+            return next(iter(nodes_with_handle))
+        return None
+
+    @staticmethod
+    def _share_uncopyable_properties(nodes, memo: dict):
+        """
+        Registers sim region objects, which can't be deep-copied, in the
+        deepcopy memo so that copies refer to the same region
+        """
+        for node in nodes:
+            region = node.properties.get("region")
+            if region is not None:
+                memo[id(region)] = region
+
     def __deepcopy__(self, memo):
         """
         Method to deep copy this instance
         """
-        # region object is non deepcopy-able so we need a little
-        # trick here to copy it over ourselves
-        self._region_cache = {}
-        for node in self.graph:
-            if "region" in node.properties:
-                self._region_cache[node.name] = node.properties["region"]
-                del node.properties["region"]
-        new_graph = Graph(copy.deepcopy(self.graph, memo))
-        for new_node in new_graph.graph:
-            if new_node.name in self._region_cache:
-                new_node.properties["region"] = self._region_cache[new_node.name]
-        return new_graph
+        self._share_uncopyable_properties(self.graph, memo)
+        return Graph(copy.deepcopy(self.graph, memo))
 
-    def __copy__(self, memo):
+    def __copy__(self):
         """
-        Method to copy this instance
+        Method to copy this instance, see snapshot()
         """
-        return Graph(copy.copy(self.graph, memo))
+        return self.snapshot()
 
     def deepcopy_graph(self, input_graph):
         """
         Method to deepcopy just the graph object
         """
-        self._region_cache = {}
-        for node in input_graph:
-            if "region" in node.properties:
-                self._region_cache[node.name] = node.properties["region"]
-                del node.properties["region"]
-        new_graph = copy.deepcopy(input_graph)
-        for new_node in new_graph:
-            if new_node.name in self._region_cache:
-                new_node.properties["region"] = self._region_cache[new_node.name]
-        return new_graph
+        memo: dict = {}
+        self._share_uncopyable_properties(input_graph, memo)
+        return copy.deepcopy(input_graph, memo)
+
+    def save_snapshot(self, file: Union[str, IO[bytes]]) -> Dict[str, List[str]]:
+        """
+        Writes the nodes and edges of this graph to file, a path or binary file
+        object, in the versioned format of graph_snapshot. Returns the property
+        keys that could not be stored, per node name.
+        """
+        return save_graph_snapshot(
+            self,
+            file,
+            {name: getattr(self, name) for name in self._snapshot_attributes},
+        )
+
+    @classmethod
+    def load_snapshot(
+        cls, file: Union[str, IO[bytes]], regions: Optional[Dict[str, Any]] = None
+    ) -> "Graph":
+        """
+        Reads a graph written by save_snapshot. regions maps ids to the sim
+        regions that nodes had, see load_graph_snapshot.
+        """
+        adjacency, attributes = load_graph_snapshot(file, regions)
+        graph = cls(graph=adjacency)
+        for name, value in attributes.items():
+            setattr(graph, name, value)
+        return graph
 
     def size(self):
         """
@@ -85,19 +823,19 @@ class Graph:
         """
         This method returns the node with matching name
         """
-        for node in self.graph:
-            if node.name == node_name:
-                return node
+        node = self._name_to_node.get(node_name)
+        if node is not None:
+            return node
 
         raise ValueError(f"Node with name {node_name} not present in the graph")
 
     def get_node_from_sim_handle(self, node_sim_handle):
         """
-        This method returns the node with matching name
+        This method returns the node with matching sim handle
         """
-        for node in self.graph:
-            if node.sim_handle == node_sim_handle:
-                return node
+        node = self._lookup_sim_handle(node_sim_handle)
+        if node is not None:
+            return node
 
         raise ValueError(
             f"Node with sim_handle {node_sim_handle} not present in the graph."
@@ -110,7 +848,7 @@ class Graph:
 
         # Reason if the input is of type string
         if isinstance(input_node, str):
-            return any(node.name == input_node for node in self.graph)
+            return input_node in self._name_to_node
 
         # Reason if the input is not string
         return input_node in self.graph
@@ -135,7 +873,7 @@ class Graph:
         """
 
         # Try to match sim handle
-        return any(node.sim_handle == sim_handle for node in self.graph)
+        return self._lookup_sim_handle(sim_handle) is not None
 
     def add_node(self, node):
         """
@@ -147,6 +885,11 @@ class Graph:
             )
         if node not in self.graph:
             self.graph[node] = {}
+            self._index_node(node)
+            self._claim_node(node)
+            self._incoming.setdefault(node, {})
+            self._record_change([node])
+            self._maybe_check_consistency()
 
     def add_edge(self, node1, node2, label, opposite_label=None, verbose=False):
         """
@@ -165,12 +908,28 @@ class Graph:
         # FIXME: this method silently overwrites a previous edge if you only pass label
         # or only opposite_label
         if node1 in self.graph and node2 in self.graph:
+            if (
+                node2 in self.graph[node1]
+                and self.graph[node1][node2] == label
+                and self.graph[node2][node1] == opposite_label
+            ):
+                # Edge exists already; skip copying rows and bumping versions
+                return
+            rooms_before = self._get_room_names([node1, node2])
+
             # Add directional edge from node1 to node2
-            self.graph[node1][node2] = label
+            self._get_writable_row(node1)[node2] = label
 
             # Add opposite directional edge from node2 to node1
-            self.graph[node2][node1] = opposite_label
-
+            self._get_writable_row(node2)[node1] = opposite_label
+
+            self._get_writable_sources(node2)[node1] = None
+            self._get_writable_sources(node1)[node2] = None
+            if self._parent_names is not None:
+                self._on_edge_added(node1, node2)
+                self._on_edge_added(node2, node1)
+            self._record_change([node1, node2], rooms_before)
+            self._maybe_check_consistency()
         else:
             if verbose:
                 print("Trying to add edge, but one or both nodes don't exist in graph")
@@ -185,10 +944,8 @@ class Graph:
             node = self.get_node_from_name(node)
 
         # Delete the node and edges to it
-        del self.graph[node]
-        for edges in self.graph.values():
-            if node in edges:
-                del edges[node]
+        self._detach_node(node)
+        self._maybe_check_consistency()
 
     def remove_edge(self, node1, node2):
         """
@@ -205,8 +962,16 @@ class Graph:
 
         if node1 in self.graph and node2 in self.graph:
             if node2 in self.graph[node1]:
-                del self.graph[node1][node2]
-                del self.graph[node2][node1]
+                rooms_before = self._get_room_names([node1, node2])
+                del self._get_writable_row(node1)[node2]
+                del self._get_writable_row(node2)[node1]
+                self._get_writable_sources(node2).pop(node1, None)
+                self._get_writable_sources(node1).pop(node2, None)
+                if self._parent_names is not None:
+                    self._on_edge_removed(node1, node2)
+                    self._on_edge_removed(node2, node1)
+                self._record_change([node1, node2], rooms_before)
+                self._maybe_check_consistency()
             else:
                 print(
                     f"Edge doesn't exist between the two nodes:{node1.name}, {node2.name}"
@@ -228,12 +993,28 @@ class Graph:
             raise ValueError(f"{node} not present in the graph")
 
         # Clear the outgoing edges
+        neighbors = self.graph[node]
+        touched_nodes = [node, *neighbors, *self._incoming[node]]
+        rooms_before = self._get_room_names(touched_nodes)
+        for neighbor in neighbors:
+            self._get_writable_sources(neighbor).pop(node, None)
         self.graph[node] = {}
 
         # Clear incoming edges
-        for edges in self.graph.values():
-            if node in edges:
-                del edges[node]
+        sources = self._incoming[node]
+        for source in sources:
+            if source in self.graph:
+                self._get_writable_row(source).pop(node, None)
+        self._incoming[node] = {}
+        if self._copy_on_write:
+            self._owned_rows.add(node.name)
+
+        if self._parent_names is not None:
+            self._parent_names.pop(node.name, None)
+            for neighbor in itertools.chain(neighbors, sources):
+                self._on_edge_removed(neighbor, node)
+        self._record_change(touched_nodes, rooms_before)
+        self._maybe_check_consistency()
 
     def pop_node(self, node):
         """
@@ -243,13 +1024,9 @@ class Graph:
         if isinstance(node, str):
             node = self.get_node_from_name(node)
 
-        # Pop the node
-        popped_node = self.graph.pop(node)
-
-        # Clean up the connections
-        for edges in self.graph.values():
-            if node in edges:
-                del edges[node]
+        # Pop the node and clean up the connections
+        popped_node = self._detach_node(node)
+        self._maybe_check_consistency()
 
         return popped_node
 
@@ -270,7 +1047,7 @@ class Graph:
         Method to retrieve all nodes of a specific class
         """
         # Find all nodes with matching type
-        matching_nodes = [node for node in self.graph if isinstance(node, class_type)]
+        matching_nodes = self._get_nodes_of_type(class_type)
 
         if len(matching_nodes) > 0:
             return matching_nodes
@@ -304,47 +1081,84 @@ class Graph:
 
         return
 
-    def merge(self, other_graph, add_only: bool = False):
+    def merge(
+        self, other_graph, add_only: bool = False, return_changes: bool = False
+    ) -> Optional["GraphChanges"]:
         """
         This method merges the other graph into this graph.
         It will add all missing nodes and edges, and it will
         replace the already present nodes with their new
         counterparts from the other graph along with their edges.
+
+        Incoming nodes are joined with existing ones through the name index,
+        so merging costs O(size of other_graph + edges touched) rather than a
+        scan of this graph per incoming node.
+
+        If return_changes is True, a GraphChanges listing the nodes and edges
+        added, modified or removed by this merge is returned.
         """
+        changes = GraphChanges() if return_changes else None
 
         # Add all new nodes and replace the existing ones
+        moved_nodes = []
         for new_node in other_graph.graph:
-            try:
-                old_node = self.get_node_from_name(new_node.name)
-            except ValueError:
+            old_node = self._name_to_node.get(new_node.name)
+            if old_node is None:
+                # Nodes of a graph taking part in copy-on-write may be shared
+                # with its snapshots, so adopt a clone instead
+                if other_graph._copy_on_write:
+                    new_node = copy.copy(new_node)
                 # Add new_node
                 self.add_node(new_node)
-            else:
-                # NOTE: be very careful to not overwrite entire properties dict
-                if "translation" in new_node.properties:
-                    old_node.properties["translation"] = new_node.properties[
-                        "translation"
-                    ]
+                if changes is not None:
+                    changes.added_nodes.append(new_node)
+            elif "translation" in new_node.properties:
+                moved_nodes.append(new_node)
+
+        old_nodes = self.get_writable_nodes([node.name for node in moved_nodes])
+        for old_node, new_node in zip(old_nodes, moved_nodes):
+            # NOTE: be very careful to not overwrite entire properties dict
+            if changes is not None:
+                old_translation = old_node.properties.get("translation")
+                if old_translation is None or list(old_translation) != list(
+                    new_node.properties["translation"]
+                ):
+                    changes.modified_nodes.append(old_node)
+            # copied as other_graph may share its nodes with a snapshot
+            self.set_node_translation(
+                old_node, copy.copy(new_node.properties["translation"])
+            )
 
         # Now add all new edges
-        for curr_node in other_graph.graph:
-            if isinstance(curr_node, (Object, SpotRobot, Human)):
-                delete_list = []
-                if not add_only:
-                    for old_neighbor, _edge in self.graph[curr_node].items():
-                        if old_neighbor not in other_graph.graph[curr_node]:
-                            delete_list.append((curr_node, old_neighbor))
-                    for curr_node, to_remove_neighbor in delete_list:
-                        self.remove_edge(curr_node, to_remove_neighbor)
-            for new_neighbor, edge in other_graph.graph[curr_node].items():
+        for curr_node, new_edges in other_graph.graph.items():
+            node = self._name_to_node[curr_node.name]
+            if not add_only and isinstance(curr_node, (Object, SpotRobot, Human)):
+                stale_neighbors = [
+                    old_neighbor
+                    for old_neighbor in self.graph[node]
+                    if old_neighbor not in new_edges
+                ]
+                for old_neighbor in stale_neighbors:
+                    if changes is not None:
+                        changes.removed_edges.append(
+                            (node, old_neighbor, self.graph[node][old_neighbor])
+                        )
+                    self.remove_edge(node, old_neighbor)
+            for new_neighbor, edge in new_edges.items():
+                neighbor = self._name_to_node[new_neighbor.name]
+                if changes is not None:
+                    if neighbor not in self.graph[node]:
+                        changes.added_edges.append((node, neighbor, edge))
+                    elif self.graph[node][neighbor] != edge:
+                        changes.modified_edges.append((node, neighbor, edge))
                 self.add_edge(
-                    curr_node.name,
-                    new_neighbor.name,
+                    node,
+                    neighbor,
                     edge,
                     other_graph.graph[new_neighbor][curr_node],
                 )
 
-        return
+        return changes
 
     def get_neighbors(self, node):
         """
@@ -387,12 +1201,7 @@ class Graph:
         This method returns count of all nodes of given type
         """
 
-        count = 0
-        for node in self.graph:
-            if isinstance(node, class_type):
-                count += 1
-
-        return count
+        return sum(len(nodes) for nodes in self._get_class_buckets(class_type))
 
     def display_flattened(self):
         """
@@ -425,6 +1234,23 @@ class Graph:
 
         return out
 
+    def to_edge_lists(self) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Returns the edges of each node as {str(node): [{"target": str(neighbor),
+        "relation": edge_label}, ...]}, in graph order. Nodes without edges are
+        left out. This is the structure LogSystem logs, built without going
+        through WorldGraph.to_dot.
+        """
+        node_strings = {node: str(node) for node in self.graph}
+        return {
+            node_strings[node]: [
+                {"target": node_strings[neighbor], "relation": label}
+                for neighbor, label in edges.items()
+            ]
+            for node, edges in self.graph.items()
+            if edges
+        }
+
     def dfs_traverse(
         self, node, visited_nodes_set, out=None, compact=False, file_handle=None
     ):
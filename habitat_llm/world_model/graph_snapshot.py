@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+"""
+Versioned binary snapshots of world graphs, see Graph.save_snapshot.
+
+A snapshot is an uncompressed npz archive. Names, classes, sim handles and
+edges are stored as arrays, and so are node properties: each property key
+becomes a typed column holding the values of the nodes that have it, e.g.
+translations as a (N, 3) float array, lists of varying length end to end with
+their lengths, and states as one boolean array per state. Strings are stored once and referred to by index. Entity-valued
+properties, e.g. last_held_object, are stored as the name of the entity,
+and sim regions as their id, to be reattached on load. Values that don't fit
+the column of their key are stored in one JSON document, in which numpy
+arrays are tagged so that they load back as arrays; tuples load back as
+lists. Property values that can't be represented at all are left out and
+listed in the "dropped_properties" entry of the metadata.
+"""
+
+import json
+import sys
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple, Union
+
+import magnum as mn
+import numpy as np
+
+from habitat_llm.world_model import (
+    Entity,
+    Floor,
+    Furniture,
+    House,
+    Human,
+    Object,
+    Receptacle,
+    Room,
+    SpotRobot,
+    UncategorizedEntity,
+)
+
+# Bump when the layout changes; loading rejects newer versions
+SNAPSHOT_FORMAT_VERSION = 1
+
+ENTITY_CLASSES = {
+    entity_class.__name__: entity_class
+    for entity_class in [
+        Entity,
+        House,
+        Room,
+        Furniture,
+        Floor,
+        Receptacle,
+        Object,
+        SpotRobot,
+        Human,
+        UncategorizedEntity,
+    ]
+}
+
+# Key tagging encoded numpy arrays in the leftover properties JSON
+_NDARRAY_TAG = "__ndarray__"
+
+# Python types of the values stored in scalar and list columns
+_SCALAR_TYPES = {"bool": bool, "int": int, "float": float, "str": str}
+
+
+def _encode_numpy(value: Any) -> Any:
+    """
+    json default hook for the numpy values found in node properties
+    """
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return {_NDARRAY_TAG: value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Can't store {type(value).__name__} in a snapshot")
+
+
+def _decode_numpy(value: Dict[str, Any]) -> Any:
+    """
+    json object_hook restoring tagged numpy arrays
+    """
+    if _NDARRAY_TAG in value:
+        return np.array(value[_NDARRAY_TAG], dtype=np.dtype(value["dtype"]))
+    return value
+
+
+def _get_scalar_kind(value: Any) -> Optional[str]:
+    for kind, value_type in _SCALAR_TYPES.items():
+        if type(value) is value_type:
+            return kind
+    return None
+
+
+def _get_column_spec(key: str, values: List[Any]) -> Optional[Dict[str, Any]]:
+    """
+    Returns the column that the values of key are stored in, chosen from
+    the first of them, or None if they are left to the JSON document
+    """
+    value = values[0]
+    scalar_kind = _get_scalar_kind(value)
+    if scalar_kind is not None:
+        return {"kind": scalar_kind}
+    if type(value) is list:
+        # Lists of a single length are stored as rows, others end to end
+        items = value or next(
+            (other for other in values if type(other) is list and other), [""]
+        )
+        item_kind = _get_scalar_kind(items[0])
+        if item_kind is not None:
+            lengths = {len(other) for other in values if type(other) is list}
+            length = lengths.pop() if len(lengths) == 1 else None
+            return {"kind": "list", "item_kind": item_kind, "length": length}
+    if type(value) is dict:
+        # Fields of each dict are stored as one column over the dicts having them
+        field_kinds: Dict[str, Optional[str]] = {}
+        for dict_value in values:
+            if type(dict_value) is dict:
+                for field, field_value in dict_value.items():
+                    if type(field) is str and field not in field_kinds:
+                        field_kinds[field] = _get_scalar_kind(field_value)
+        fields = [field for field, field_kind in field_kinds.items() if field_kind]
+        return {
+            "kind": "dict",
+            "fields": fields,
+            "field_kinds": [field_kinds[field] for field in fields],
+        }
+    if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return {"kind": "ndarray", "dtype": value.dtype.str, "shape": value.shape}
+    if type(value) is mn.Vector3:
+        return {"kind": "vector3"}
+    if isinstance(value, Entity):
+        return {"kind": "entity"}
+    # Sim regions can't be stored, but the scene they come from has them
+    if key == "region" and isinstance(getattr(value, "id", None), str):
+        return {"kind": "region"}
+    return None
+
+
+def _get_column_check(spec: Dict[str, Any]) -> Callable[[Any], bool]:
+    """
+    Returns whether a value fits in the column described by spec
+    """
+    kind = spec["kind"]
+    if kind in _SCALAR_TYPES:
+        value_type = _SCALAR_TYPES[kind]
+        return lambda value: type(value) is value_type
+    if kind == "list":
+        item_type = _SCALAR_TYPES[spec["item_kind"]]
+        length = spec["length"]
+        return (
+            lambda value: type(value) is list
+            and (length is None or len(value) == length)
+            and all(type(item) is item_type for item in value)
+        )
+    if kind == "dict":
+        field_types = {
+            field: _SCALAR_TYPES[field_kind]
+            for field, field_kind in zip(spec["fields"], spec["field_kinds"])
+        }
+        return lambda value: type(value) is dict and all(
+            field_types.get(field) is type(field_value)
+            for field, field_value in value.items()
+        )
+    if kind == "ndarray":
+        dtype, shape = np.dtype(spec["dtype"]), spec["shape"]
+        return (
+            lambda value: isinstance(value, np.ndarray)
+            and value.dtype == dtype
+            and value.shape == shape
+        )
+    if kind == "vector3":
+        return lambda value: type(value) is mn.Vector3
+    if kind == "entity":
+        return lambda value: isinstance(value, Entity)
+    return lambda value: isinstance(getattr(value, "id", None), str)
+
+
+def _all_fit_column(
+    spec: Dict[str, Any], values: List[Any], fits: Callable[[Any], bool]
+) -> bool:
+    """
+    Returns whether all values fit in the column described by spec, like
+    checking each with fits but faster for the common columns
+    """
+    kind = spec["kind"]
+    if kind in _SCALAR_TYPES:
+        return {type(value) for value in values} == {_SCALAR_TYPES[kind]}
+    if kind == "list":
+        return (
+            {type(value) for value in values} == {list}
+            and (
+                spec["length"] is None
+                or {len(value) for value in values} == {spec["length"]}
+            )
+            and {type(item) for value in values for item in value}
+            <= {_SCALAR_TYPES[spec["item_kind"]]}
+        )
+    return all(map(fits, values))
+
+
+class _StringTable:
+    """
+    Strings of a snapshot, stored once and referred to by index
+    """
+
+    def __init__(self):
+        self.indices: Dict[str, int] = {}
+
+    def encode(self, strings: List[str]) -> np.ndarray:
+        indices = self.indices
+        return np.array(
+            [indices.setdefault(string, len(indices)) for string in strings],
+            dtype=np.int32,
+        )
+
+    def to_array(self) -> np.ndarray:
+        return np.array(list(self.indices), dtype=np.str_)
+
+
+def _encode_scalars(kind: str, values: List[Any], strings: _StringTable):
+    if kind == "str":
+        return strings.encode(values)
+    # int64 overflows are found by the caller
+    return np.array(values, dtype={"bool": bool, "int": np.int64}.get(kind, float))
+
+
+def _encode_column(
+    spec: Dict[str, Any], values: List[Any], strings: _StringTable
+) -> Dict[str, np.ndarray]:
+    """
+    Returns the arrays holding the values of a column, by name suffix
+    """
+    kind = spec["kind"]
+    if kind in _SCALAR_TYPES:
+        return {"": _encode_scalars(kind, values, strings)}
+    if kind == "list":
+        flat = _encode_scalars(
+            spec["item_kind"], [item for value in values for item in value], strings
+        )
+        if spec["length"] is not None:
+            return {"": flat.reshape(len(values), spec["length"])}
+        lengths = np.array([len(value) for value in values], dtype=np.int32)
+        return {"": flat, "_lengths": lengths}
+    if kind == "dict":
+        field_indices = {field: index for index, field in enumerate(spec["fields"])}
+        field_values: List[List[Any]] = [[] for _ in field_indices]
+        layouts: Dict[Tuple[str, ...], int] = {}
+        layout_codes = []
+        for value in values:
+            layout_codes.append(layouts.setdefault(tuple(value), len(layouts)))
+            for field, field_value in value.items():
+                field_values[field_indices[field]].append(field_value)
+        # Read back by _decode_column
+        spec["layouts"] = [list(layout) for layout in layouts]
+        arrays = {"_layouts": np.array(layout_codes, dtype=np.int32)}
+        for index, field_kind in enumerate(spec["field_kinds"]):
+            arrays[f"_{index}"] = _encode_scalars(
+                field_kind, field_values[index], strings
+            )
+        return arrays
+    if kind == "ndarray":
+        return {"": np.stack(values) if values else np.zeros((0, *spec["shape"]))}
+    if kind == "vector3":
+        return {"": np.array(values, dtype=np.float32).reshape(len(values), 3)}
+    if kind == "entity":
+        return {"": strings.encode([value.name for value in values])}
+    return {"": strings.encode([value.id for value in values])}
+
+
+def _decode_scalars(kind: str, array: np.ndarray, strings: List[str]) -> List[Any]:
+    if kind == "str":
+        return [strings[index] for index in array.tolist()]
+    return array.tolist()
+
+
+def _decode_column(
+    spec: Dict[str, Any], arrays: Dict[str, np.ndarray], strings: List[str]
+) -> List[Any]:
+    """
+    Returns the values of a column from the arrays written by _encode_column
+    """
+    kind = spec["kind"]
+    if kind == "list":
+        if spec["length"] is not None:
+            if spec["item_kind"] == "str":
+                return [
+                    [strings[index] for index in row] for row in arrays[""].tolist()
+                ]
+            return arrays[""].tolist()
+        flat = _decode_scalars(spec["item_kind"], arrays[""], strings)
+        values = []
+        start = 0
+        for length in arrays["_lengths"].tolist():
+            values.append(flat[start : start + length])
+            start += length
+        return values
+    if kind == "dict":
+        field_values = {
+            field: iter(_decode_scalars(field_kind, arrays[f"_{index}"], strings))
+            for index, (field, field_kind) in enumerate(
+                zip(spec["fields"], spec["field_kinds"])
+            )
+        }
+        layouts = spec["layouts"]
+        return [
+            {field: next(field_values[field]) for field in layouts[layout]}
+            for layout in arrays["_layouts"].tolist()
+        ]
+    if kind == "ndarray":
+        return list(arrays[""])
+    if kind == "vector3":
+        return [mn.Vector3(row) for row in arrays[""].tolist()]
+    # Names of entities and ids of regions are looked up by the caller
+    return _decode_scalars(
+        kind if kind in _SCALAR_TYPES else "str", arrays[""], strings
+    )
+
+
+def _encode_properties(
+    nodes: List[Entity], strings: _StringTable
+) -> Tuple[Dict[str, Any], Dict[str, np.ndarray], Dict[str, List[str]]]:
+    """
+    Returns the metadata and arrays describing the properties of nodes, and
+    per node name, the keys that had to be left out
+    """
+    all_properties = [node.properties for node in nodes]
+    # Nodes mostly share a few sets of keys
+    node_layouts = [tuple(properties) for properties in all_properties]
+    layout_indices: Dict[Tuple[str, ...], List[int]] = {}
+    for index, layout in enumerate(node_layouts):
+        layout_indices.setdefault(layout, []).append(index)
+    indices_by_key: Dict[str, List[int]] = {}
+    for layout, indices in layout_indices.items():
+        for key in layout:
+            indices_by_key.setdefault(key, []).extend(indices)
+
+    node_names = {node.name for node in nodes}
+    columns: List[Dict[str, Any]] = []
+    arrays: Dict[str, np.ndarray] = {}
+    leftovers: Dict[int, Dict[str, Any]] = {}
+    for key, key_indices in indices_by_key.items():
+        key_values = [all_properties[index][key] for index in key_indices]
+        # Values of several kinds, e.g. list and Vector3 translations, get a
+        # column each
+        while key_indices:
+            spec = _get_column_spec(key, key_values)
+            if spec is None:
+                rest_indices, rest_values = [], []
+                for index, value in zip(key_indices, key_values):
+                    if _get_column_spec(key, [value]) is None:
+                        leftovers.setdefault(index, {})[key] = value
+                    else:
+                        rest_indices.append(index)
+                        rest_values.append(value)
+                key_indices, key_values = rest_indices, rest_values
+                continue
+            fits = _get_column_check(spec)
+            if spec["kind"] == "entity":
+                # Entities outside of the graph can't be referred to
+                fits = lambda value, fits=fits: fits(value) and value.name in node_names
+            candidate_indices, candidate_values = key_indices, key_values
+            key_indices, key_values = [], []
+            if _all_fit_column(spec, candidate_values, fits):
+                column_indices, column_values = candidate_indices, candidate_values
+            else:
+                column_indices, column_values = [], []
+                for index, value in zip(candidate_indices, candidate_values):
+                    if fits(value):
+                        column_indices.append(index)
+                        column_values.append(value)
+                    else:
+                        key_indices.append(index)
+                        key_values.append(value)
+            if not column_indices:
+                # Not even the value the column was chosen from fits
+                leftovers.setdefault(key_indices[0], {})[key] = key_values[0]
+                key_indices, key_values = key_indices[1:], key_values[1:]
+                continue
+            try:
+                column_arrays = _encode_column(spec, column_values, strings)
+            except OverflowError:
+                # Python ints beyond int64 are left to JSON
+                for index, value in zip(column_indices, column_values):
+                    leftovers.setdefault(index, {})[key] = value
+                continue
+            column = len(columns)
+            columns.append({"key": key, **spec})
+            arrays[f"column_{column}_nodes"] = np.array(column_indices, dtype=np.int32)
+            for suffix, array in column_arrays.items():
+                arrays[f"column_{column}{suffix}"] = array
+
+    # Leftovers that JSON can't store either are dropped
+    dropped: Dict[str, List[str]] = {}
+    for index, properties in leftovers.items():
+        for key, value in list(properties.items()):
+            try:
+                json.dumps(value, default=_encode_numpy)
+            except (TypeError, ValueError):
+                dropped.setdefault(nodes[index].name, []).append(key)
+                del properties[key]
+                node_layouts[index] = tuple(
+                    layout_key
+                    for layout_key in node_layouts[index]
+                    if layout_key != key
+                )
+    layouts: Dict[Tuple[str, ...], int] = {}
+    arrays["property_layouts"] = np.array(
+        [layouts.setdefault(layout, len(layouts)) for layout in node_layouts],
+        dtype=np.int32,
+    )
+    arrays["leftover_properties"] = _to_byte_array(
+        json.dumps(
+            {
+                str(index): properties
+                for index, properties in leftovers.items()
+                if properties
+            },
+            default=_encode_numpy,
+        ).encode()
+    )
+    metadata = {
+        "property_layouts": [list(layout) for layout in layouts],
+        "property_columns": columns,
+    }
+    return metadata, arrays, dropped
+
+
+def _to_byte_array(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def save_graph_snapshot(
+    graph, file: Union[str, IO[bytes]], attributes: Dict[str, Any]
+) -> Dict[str, List[str]]:
+    """
+    Writes graph to file, which can be a path or a binary file object.
+    attributes holds JSON-compatible graph attributes stored alongside.
+    Returns the property keys that were left out, per node name.
+    """
+    if isinstance(file, str):
+        # np.savez would append .npz to the path
+        with open(file, "wb") as file_handle:
+            return save_graph_snapshot(graph, file_handle, attributes)
+
+    nodes = list(graph.graph)
+    node_index = {node.name: index for index, node in enumerate(nodes)}
+    class_names = sorted({type(node).__name__ for node in nodes})
+    for class_name in class_names:
+        if class_name not in ENTITY_CLASSES:
+            raise ValueError(f"Can't snapshot nodes of unknown class {class_name}")
+    class_codes = {class_name: code for code, class_name in enumerate(class_names)}
+
+    labels: Dict[Any, int] = {}
+    edge_sources, edge_targets, edge_labels = [], [], []
+    for source_index, edges in enumerate(graph.graph.values()):
+        for target, label in edges.items():
+            edge_sources.append(source_index)
+            edge_targets.append(node_index[target.name])
+            edge_labels.append(labels.setdefault(label, len(labels)))
+
+    strings = _StringTable()
+    properties_metadata, properties_arrays, dropped = _encode_properties(nodes, strings)
+    sim_handles = [node.sim_handle for node in nodes]
+    metadata = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "class_names": class_names,
+        "labels": list(labels),
+        "attributes": attributes,
+        "dropped_properties": dropped,
+        **properties_metadata,
+    }
+    np.savez(
+        file,
+        metadata=_to_byte_array(json.dumps(metadata).encode()),
+        names=np.array(list(node_index), dtype=np.str_),
+        classes=np.array(
+            [class_codes[type(node).__name__] for node in nodes], dtype=np.uint8
+        ),
+        sim_handles=np.array(
+            ["" if sim_handle is None else sim_handle for sim_handle in sim_handles],
+            dtype=np.str_,
+        ),
+        has_sim_handle=np.array(
+            [sim_handle is not None for sim_handle in sim_handles], dtype=bool
+        ),
+        edge_sources=np.array(edge_sources, dtype=np.int32),
+        edge_targets=np.array(edge_targets, dtype=np.int32),
+        edge_labels=np.array(edge_labels, dtype=np.int32),
+        **properties_arrays,
+        # Written last, once every string is known
+        strings=strings.to_array(),
+    )
+    return dropped
+
+
+def load_graph_snapshot(
+    file: Union[str, IO[bytes]], regions: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[Entity, Dict[Entity, str]], Dict[str, Any]]:
+    """
+    Reads a snapshot written by save_graph_snapshot. regions maps the ids of
+    sim regions to the regions to reattach to the nodes that had them, e.g.
+    {region.id: region for region in sim.semantic_scene.regions}.
+    Returns the adjacency dict and the stored graph attributes.
+    """
+    with np.load(file, allow_pickle=False) as archive:
+        metadata = json.loads(archive["metadata"].tobytes())
+        format_version = metadata.get("format_version")
+        if not isinstance(format_version, int) or not (
+            1 <= format_version <= SNAPSHOT_FORMAT_VERSION
+        ):
+            raise ValueError(
+                f"Unsupported world graph snapshot version {format_version}, "
+                f"expected at most {SNAPSHOT_FORMAT_VERSION}"
+            )
+        classes = [ENTITY_CLASSES[name] for name in metadata["class_names"]]
+        labels = metadata["labels"]
+        # Repeated property values are shared, as when entities are created
+        strings = [sys.intern(string) for string in archive["strings"].tolist()]
+
+        layouts = metadata["property_layouts"]
+        all_properties = [
+            dict.fromkeys(layouts[layout])
+            for layout in archive["property_layouts"].tolist()
+        ]
+        references = []
+        for column, spec in enumerate(metadata["property_columns"]):
+            if spec["kind"] == "ndarray":
+                spec["shape"] = tuple(spec["shape"])
+            prefix = f"column_{column}"
+            column_arrays = {
+                name[len(prefix) :]: archive[name]
+                for name in archive.files
+                if name == prefix or name.startswith(f"{prefix}_")
+            }
+            key = spec["key"]
+            indices = column_arrays.pop("_nodes").tolist()
+            values = _decode_column(spec, column_arrays, strings)
+            if spec["kind"] in ["entity", "region"]:
+                references.append((spec["kind"], key, indices, values))
+            for index, value in zip(indices, values):
+                all_properties[index][key] = value
+        leftovers = json.loads(
+            archive["leftover_properties"].tobytes(), object_hook=_decode_numpy
+        )
+        for index, properties in leftovers.items():
+            all_properties[int(index)].update(properties)
+
+        sim_handles = [
+            sim_handle if has_sim_handle else None
+            for sim_handle, has_sim_handle in zip(
+                archive["sim_handles"].tolist(), archive["has_sim_handle"].tolist()
+            )
+        ]
+        nodes = []
+        for name, class_code, sim_handle, properties in zip(
+            archive["names"].tolist(),
+            archive["classes"].tolist(),
+            sim_handles,
+            all_properties,
+        ):
+            # Bypass subclass constructors, whose signatures differ
+            node = classes[class_code].__new__(classes[class_code])
+            node.name = name
+            node.properties = properties
+            node.sim_handle = sim_handle
+            nodes.append(node)
+
+        name_to_node = {node.name: node for node in nodes}
+        for kind, key, indices, values in references:
+            targets = name_to_node if kind == "entity" else regions or {}
+            missing = sorted(set(values) - targets.keys())
+            if missing:
+                raise ValueError(
+                    f"Can't find the {kind} {missing[0]} of the {key} property"
+                    + (", pass the sim regions to load" if kind == "region" else "")
+                )
+            for index, value in zip(indices, values):
+                all_properties[index][key] = targets[value]
+
+        # Edges are saved grouped by source, in graph order
+        edge_sources = archive["edge_sources"]
+        row_ends = np.cumsum(np.bincount(edge_sources, minlength=len(nodes)))
+        targets = [nodes[target] for target in archive["edge_targets"].tolist()]
+        edge_labels = [labels[label] for label in archive["edge_labels"].tolist()]
+        adjacency: Dict[Entity, Dict[Entity, str]] = {}
+        row_start = 0
+        for node, row_end in zip(nodes, row_ends.tolist()):
+            adjacency[node] = dict(
+                zip(targets[row_start:row_end], edge_labels[row_start:row_end])
+            )
+            row_start = row_end
+    return adjacency, metadata["attributes"]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree
+
+import itertools
+from typing import Dict, List, Tuple, Type, Union
+
+import numpy as np
+
+from habitat_llm.world_model.entity import Entity
+
+CellKey = Tuple[int, int, int]
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the "translation" property of entities.
+
+    Queries return candidate nodes without ranking them; callers compute exact
+    distances on the (few) candidates. Nodes without a translation are not
+    indexed. Positions are read when a node is inserted or updated, so moving
+    a node requires calling update() on it.
+    """
+
+    # Slack on distance bounds to absorb floating point rounding
+    _EPSILON = 1e-6
+
+    def __init__(self, cell_size: float = 1.0):
+        if cell_size <= 0:
+            raise ValueError(f"cell_size should be positive, received: {cell_size}")
+        self.cell_size = cell_size
+        self._cells: Dict[CellKey, Dict[Entity, None]] = {}
+        self._positions: Dict[Entity, np.ndarray] = {}
+        self._cell_of: Dict[Entity, CellKey] = {}
+        # Bounds of all cells ever occupied; only grows
+        self._min_cell = np.zeros(3, dtype=int)
+        self._max_cell = np.zeros(3, dtype=int)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, node: Entity) -> bool:
+        return node in self._positions
+
+    def _cell_key(self, position: np.ndarray) -> CellKey:
+        x, y, z = np.floor(position / self.cell_size).astype(int)
+        return (int(x), int(y), int(z))
+
+    def get_position(self, node: Entity) -> np.ndarray:
+        """
+        Returns the position node was indexed at
+        """
+        return self._positions[node]
+
+    def insert(self, node: Entity):
+        """
+        Adds node to the index if it has a translation
+        """
+        if node.properties.get("translation") is None:
+            return
+        position = np.array(node.properties["translation"], dtype=float)
+        key = self._cell_key(position)
+        if not self._positions:
+            self._min_cell = np.array(key)
+            self._max_cell = np.array(key)
+        else:
+            self._min_cell = np.minimum(self._min_cell, key)
+            self._max_cell = np.maximum(self._max_cell, key)
+        self._positions[node] = position
+        self._cell_of[node] = key
+        self._cells.setdefault(key, {})[node] = None
+
+    def remove(self, node: Entity):
+        """
+        Removes node from the index, if present
+        """
+        if self._positions.pop(node, None) is None:
+            return
+        key = self._cell_of.pop(node)
+        cell = self._cells[key]
+        del cell[node]
+        if not cell:
+            del self._cells[key]
+
+    def update(self, node: Entity):
+        """
+        Re-reads the translation of a node that moved
+        """
+        self.remove(node)
+        self.insert(node)
+
+    def query_radius(
+        self,
+        location: np.ndarray,
+        radius: float,
+        class_type: Union[Type[Entity], Tuple[Type[Entity], ...]] = Entity,
+    ) -> List[Entity]:
+        """
+        Returns the nodes of class_type that may lie within radius of location.
+        Every node that does is included.
+        """
+        location = np.asarray(location, dtype=float)
+        low = self._cell_key(location - radius - self._EPSILON)
+        high = self._cell_key(location + radius + self._EPSILON)
+        num_cells = np.prod(np.array(high) - np.array(low) + 1)
+        if num_cells > len(self._cells):
+            keys = [
+                key
+                for key in self._cells
+                if all(lo <= k <= hi for lo, k, hi in zip(low, key, high))
+            ]
+        else:
+            keys = itertools.product(*(range(lo, hi + 1) for lo, hi in zip(low, high)))
+        return [
+            node
+            for key in keys
+            for node in self._cells.get(key, ())
+            if isinstance(node, class_type)
+        ]
+
+    def query_nearest(
+        self,
+        location: np.ndarray,
+        k: int,
+        class_type: Union[Type[Entity], Tuple[Type[Entity], ...]] = Entity,
+    ) -> List[Entity]:
+        """
+        Returns nodes of class_type that include the k nodes closest to location,
+        along with every node tied with the k-th closest.
+        """
+        if k <= 0:
+            return []
+        location = np.asarray(location, dtype=float)
+        center = np.array(self._cell_key(location))
+        # Past this ring every occupied cell has been visited
+        max_ring = int(
+            max(
+                np.max(np.abs(self._max_cell - center)),
+                np.max(np.abs(self._min_cell - center)),
+            )
+        )
+
+        candidates: List[Entity] = []
+        distances: List[float] = []
+        ring = 0
+        while ring <= max_ring:
+            ring_keys = self._get_ring_keys(center, ring)
+            if ring_keys is None:
+                # the ring holds more cells than are occupied; finish by scanning
+                return candidates + [
+                    node
+                    for key, nodes in self._cells.items()
+                    if np.max(np.abs(np.array(key) - center)) >= ring
+                    for node in nodes
+                    if isinstance(node, class_type)
+                ]
+            for key in ring_keys:
+                for node in self._cells.get(key, ()):
+                    if isinstance(node, class_type):
+                        candidates.append(node)
+                        distances.append(
+                            float(np.linalg.norm(self._positions[node] - location))
+                        )
+            # Every node within ring * cell_size of location has been seen now
+            bound = ring * self.cell_size - self._EPSILON
+            if sum(distance <= bound for distance in distances) >= k:
+                break
+            ring += 1
+        return candidates
+
+    def _get_ring_keys(self, center: np.ndarray, ring: int):
+        """
+        Returns the cell keys at Chebyshev distance ring from center, or None
+        when there are more of them than occupied cells
+        """
+        if ring == 0:
+            return [tuple(int(c) for c in center)]
+        num_ring_cells = (2 * ring + 1) ** 3 - (2 * ring - 1) ** 3
+        if num_ring_cells > len(self._cells):
+            return None
+        cx, cy, cz = (int(c) for c in center)
+        offsets = range(-ring, ring + 1)
+        return [
+            (cx + dx, cy + dy, cz + dz)
+            for dx in offsets
+            for dy in offsets
+            for dz in offsets
+            if max(abs(dx), abs(dy), abs(dz)) == ring
+        ]
@@ -6,7 +6,7 @@
 
 import logging
 from collections import defaultdict
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
 
 import numpy as np
 
@@ -40,6 +40,8 @@ class WorldGraph(Graph):
     WorldModel is a Directed Acyclic Graph.
     """
 
+    _snapshot_attributes = ("agent_asymmetry", "world_model_type")
+
     # Parameterized Constructor
     def __init__(self, graph=None):
         # Create a graph to store different entities in the world
@@ -47,6 +49,9 @@ class WorldGraph(Graph):
         super().__init__(graph=graph)
         self.agent_asymmetry = False
         self.world_model_type = "privileged"
+        # cache_key -> (room versions, graph version, descriptions by node
+        # name, descriptions in node order), see describe_nodes
+        self._description_cache: Dict[Hashable, tuple] = {}
         self._logger = logging.getLogger(__name__)
         FORMAT = "[%(filename)s:%(lineno)s - %(funcName)20s() ] %(message)s"
         logging.basicConfig(format=FORMAT)
@@ -56,25 +61,25 @@ class WorldGraph(Graph):
         """
         This method returns all rooms in the world graph
         """
-        return [node for node in self.graph if isinstance(node, Room)]
+        return self._get_nodes_of_type(Room)
 
     def get_all_receptacles(self):
         """
         This method returns all receptacles in the world graph
         """
-        return [node for node in self.graph if isinstance(node, Receptacle)]
+        return self._get_nodes_of_type(Receptacle)
 
     def get_all_furnitures(self):
         """
         This method returns all surfaces in the world graph
         """
-        return [node for node in self.graph if isinstance(node, Furniture)]
+        return self._get_nodes_of_type(Furniture)
 
     def get_all_objects(self):
         """
         This method returns all objects in the world graph
         """
-        return [node for node in self.graph if isinstance(node, Object)]
+        return self._get_nodes_of_type(Object)
 
     def get_node_with_property(self, property_key, property_val):
         """
@@ -97,9 +102,8 @@ class WorldGraph(Graph):
         """
         This method returns spot robot node
         """
-        for node in self.graph:
-            if isinstance(node, SpotRobot):
-                return node
+        for node in self._get_nodes_of_type(SpotRobot):
+            return node
 
         raise ValueError("World graph does not contain a node of type SpotRobot")
 
@@ -107,9 +111,8 @@ class WorldGraph(Graph):
         """
         This method returns human node
         """
-        for node in self.graph:
-            if isinstance(node, Human):
-                return node
+        for node in self._get_nodes_of_type(Human):
+            return node
 
         raise ValueError("World graph does not contain a node of type Human")
 
@@ -117,10 +120,7 @@ class WorldGraph(Graph):
         """
         This method returns all agent nodes
         """
-        out = []
-        for node in self.graph:
-            if isinstance(node, (Human, SpotRobot)):
-                out.append(node)
+        out = self._get_nodes_of_type((Human, SpotRobot))
 
         if len(out) == 0:
             raise ValueError(
@@ -154,61 +154,126 @@ class WorldGraph(Graph):
         """
         This method returns n closest objects or furnitures to the given object node
         """
-        closest = sorted(
-            self.get_all_objects() + self.get_all_furnitures(),
-            key=lambda x: np.linalg.norm(
-                np.array(obj_node.properties["translation"])
-                - np.array(x.properties["translation"])
-            ),
-        )[:n]
-        within_threshold = [
-            obj
-            for obj in closest
-            if np.linalg.norm(
-                np.array(obj_node.properties["translation"])
-                - np.array(obj.properties["translation"])
-            )
-            < dist_threshold
-        ]
-        return within_threshold
+        # nothing can be closer than a non-positive threshold
+        if dist_threshold <= 0.0:
+            return []
+        return self._get_closest_nodes(
+            obj_node.properties["translation"],
+            n,
+            dist_threshold,
+            (Object, Furniture),
+        )
+
+    def describe_nodes(
+        self,
+        cache_key: Hashable,
+        nodes: List[Entity],
+        describe: Callable[[Entity], Any],
+    ) -> List[Any]:
+        """
+        Returns [describe(node) for node in nodes], reusing the results of the
+        previous call with the same cache_key for nodes whose room did not
+        change since, see get_room_versions. describe may only depend on
+        cache_key and on the edges of nodes within the node's room; node
+        properties are not tracked and should be read by the caller.
+        """
+        room_versions = self.get_room_versions()
+        cached = self._description_cache.get(cache_key)
+        if cached is not None and cached[0] is room_versions:
+            _, cached_version, cached_entries, cached_descriptions = cached
+            if cached_version == self.version:
+                return cached_descriptions
+        else:
+            cached_version, cached_entries = -1, {}
+
+        entries = {}
+        for node in nodes:
+            entry = cached_entries.get(node.name)
+            # Nodes outside of any room may be described from anywhere in the graph
+            if (
+                entry is None
+                or entry[0] is None
+                or room_versions.get(entry[0], 0) > cached_version
+            ):
+                entry = (self.get_room_name(node), describe(node))
+            entries[node.name] = entry
+        descriptions = [entry[1] for entry in entries.values()]
+        self._description_cache[cache_key] = (
+            room_versions,
+            self.version,
+            entries,
+            descriptions,
+        )
+        return descriptions
+
+    def get_furniture_descr(self) -> str:
+        """
+        Returns one "room: furniture, furniture" line per room, as grouped by
+        group_furniture_by_room. Only rooms that changed are rescanned.
+        """
+        furnitures = self.get_all_furnitures()
+        room_names = self.describe_nodes(
+            "furniture_rooms",
+            furnitures,
+            lambda fur: [
+                neighbor.name
+                for neighbor in self.graph[fur]
+                if isinstance(neighbor, Room)
+            ],
+        )
+        furn_room = defaultdict(list)
+        for furniture, furniture_rooms in zip(furnitures, room_names):
+            for room_name in furniture_rooms:
+                furn_room[room_name].append(furniture.name)
+        return "".join(k + ": " + ", ".join(v) + "\n" for k, v in furn_room.items())
 
     # TODO: [BE] This function is duplicated in instruct/utils.py. Should be refactored
     # to avoid duplication and maintainability issues.
     def get_world_descr(self, is_human_wg: bool = False):
+        """
+        Describes the furniture in every room and where every object is.
+        Descriptions are cached per room and regenerated only for rooms whose
+        contents changed since the previous call.
+        """
         ## house description -- rooms and their furniture list
-        furn_room = self.group_furniture_by_room()
-        house_info = ""
-        for k, v in furn_room.items():
-            furn_names = [furn.name for furn in v]
-            all_furn = ", ".join(furn_names)
-            house_info += k + ": " + all_furn + "\n"
+        house_info = self.get_furniture_descr()
 
         ## get objects held by the agent
         spot_node = self.get_spot_robot()
         human_node = self.get_human()
 
         ## locations of objects in the house
-        objs_info = ""
-        all_objs = self.get_all_objects()
-        for obj in all_objs:
+        # Objects are allowed to be marooned on unknown furniture under
+        # agent asymmetry condition, since the object may be placed anywhere
+        # in the house unbeknownst to the human agent
+        allow_unknown_furniture = (is_human_wg and self.agent_asymmetry) or (
+            not is_human_wg and self.world_model_type == "concept_graph"
+        )
+
+        def describe_object(obj):
             if self.is_object_with_agent(obj, agent_type="robot"):
-                objs_info += obj.name + ": " + spot_node.name + "\n"
+                return obj.name + ": " + spot_node.name + "\n"
             elif self.is_object_with_agent(obj, agent_type="human"):
-                objs_info += obj.name + ": " + human_node.name + "\n"
-            else:
-                furniture = self.find_furniture_for_object(obj)
-                if furniture is not None:
-                    objs_info += obj.name + ": " + furniture.name + "\n"
-                elif furniture is None and (
-                    (is_human_wg and self.agent_asymmetry)
-                    or (not is_human_wg and self.world_model_type == "concept_graph")
-                ):
-                    # Objects are allowed to be marooned on unknown furniture under
-                    # agent asymmetry condition, since the object may be placed anywhere
-                    # in the house unbeknownst to the human agent
-                    objs_info += obj.name + ": " + "unknown" + "\n"
-                else:
-                    raise ValueError(f"Object {obj.name} has no parent")
+                return obj.name + ": " + human_node.name + "\n"
+            furniture = self.find_furniture_for_object(obj)
+            if furniture is not None:
+                return obj.name + ": " + furniture.name + "\n"
+            elif allow_unknown_furniture:
+                return obj.name + ": " + "unknown" + "\n"
+            raise ValueError(f"Object {obj.name} has no parent")
+
+        objs_info = "".join(
+            self.describe_nodes(
+                (
+                    "world_descr_objects",
+                    spot_node.name,
+                    human_node.name,
+                    allow_unknown_furniture,
+                ),
+                self.get_all_objects(),
+                describe_object,
+            )
+        )
         return f"Furniture:\n{house_info}\nObjects:\n{objs_info}"
 
     def is_object_with_human(self, obj):
@@ -258,15 +323,14 @@ class WorldGraph(Graph):
         and their parent furniture or rooms
         """
         pairs = {}
-        for node, neighbors in self.graph.items():
-            if isinstance(node, Object):
-                for neighbor in neighbors:
-                    if isinstance(neighbor, Receptacle):
-                        for second_neighbor in self.graph[neighbor]:
-                            if isinstance(second_neighbor, Furniture):
-                                pairs[node] = second_neighbor
-                    elif isinstance(neighbor, Furniture):
-                        pairs[node] = neighbor
+        for node in self._get_nodes_of_type(Object):
+            for neighbor in self.graph[node]:
+                if isinstance(neighbor, Receptacle):
+                    for second_neighbor in self.graph[neighbor]:
+                        if isinstance(second_neighbor, Furniture):
+                            pairs[node] = second_neighbor
+                elif isinstance(neighbor, Furniture):
+                    pairs[node] = neighbor
 
         return pairs
 
@@ -314,13 +378,12 @@ class WorldGraph(Graph):
         Groups Furniture nodes by their types
         """
         furniture_by_type = {}
-        for node in self.graph:
-            if isinstance(node, Furniture):
-                fur_type = node.properties["type"]
-                if fur_type in furniture_by_type:
-                    furniture_by_type[fur_type].append(node)
-                else:
-                    furniture_by_type[fur_type] = [node]
+        for node in self._get_nodes_of_type(Furniture):
+            fur_type = node.properties["type"]
+            if fur_type in furniture_by_type:
+                furniture_by_type[fur_type].append(node)
+            else:
+                furniture_by_type[fur_type] = [node]
         return furniture_by_type
 
     def group_furniture_by_room(self):
@@ -328,11 +391,10 @@ class WorldGraph(Graph):
         Groups Furniture nodes by their rooms
         """
         furniture_by_room = defaultdict(list)
-        for node in self.graph:
-            if isinstance(node, Furniture):
-                for neighbor in self.graph[node]:
-                    if isinstance(neighbor, Room):
-                        furniture_by_room[neighbor.name].append(node)
+        for node in self._get_nodes_of_type(Furniture):
+            for neighbor in self.graph[node]:
+                if isinstance(neighbor, Room):
+                    furniture_by_room[neighbor.name].append(node)
 
         return furniture_by_room
 
@@ -341,14 +403,13 @@ class WorldGraph(Graph):
         Groups Furniture nodes by their room types
         """
         furniture_by_room = {}
-        for node in self.graph:
-            if isinstance(node, Furniture):
-                for neighbor in self.graph[node]:
-                    if isinstance(neighbor, Room):
-                        if neighbor.properties["type"] in furniture_by_room:
-                            furniture_by_room[neighbor.properties["type"]].append(node)
-                        else:
-                            furniture_by_room[neighbor.properties["type"]] = [node]
+        for node in self._get_nodes_of_type(Furniture):
+            for neighbor in self.graph[node]:
+                if isinstance(neighbor, Room):
+                    if neighbor.properties["type"] in furniture_by_room:
+                        furniture_by_room[neighbor.properties["type"]].append(node)
+                    else:
+                        furniture_by_room[neighbor.properties["type"]] = [node]
 
         return furniture_by_room
 
@@ -357,12 +418,11 @@ class WorldGraph(Graph):
         Returns dictionary of furniture node to room nodes
         """
         furniture_to_room = {}
-        for node in self.graph:
-            if isinstance(node, Furniture):
-                for neighbor in self.graph[node]:
-                    if isinstance(neighbor, Room):
-                        furniture_to_room[node] = neighbor
-                        break
+        for node in self._get_nodes_of_type(Furniture):
+            for neighbor in self.graph[node]:
+                if isinstance(neighbor, Room):
+                    furniture_to_room[node] = neighbor
+                    break
 
         return furniture_to_room
 
@@ -398,7 +458,7 @@ class WorldGraph(Graph):
         # Replace graph with the updated one
         # if operating in full observability
         if not partial_obs:
-            self.graph = self.deepcopy_graph(recent_graph.graph)
+            self._share_structure_from(recent_graph)
         else:
             # if operating in partial observability
             self.merge(recent_graph, add_only=add_only)
@@ -422,10 +482,17 @@ class WorldGraph(Graph):
         else:
             robot_node = None
 
-        if len(human_object_nodes) > 0:
-            human_node.properties["last_held_object"] = human_object_nodes[0]
-        if len(robot_object_nodes) > 0:
-            robot_node.properties["last_held_object"] = robot_object_nodes[0]
+        for agent_node, held_object_nodes in (
+            (human_node, human_object_nodes),
+            (robot_node, robot_object_nodes),
+        ):
+            if (
+                held_object_nodes
+                and agent_node.properties.get("last_held_object")
+                != held_object_nodes[0]
+            ):
+                agent_node = self.get_writable_node(agent_node)
+                agent_node.properties["last_held_object"] = held_object_nodes[0]
 
         return
 
@@ -438,7 +505,8 @@ class WorldGraph(Graph):
     ) -> Optional[dict]:
         """
         This method returns the path from the given node to the first node of type
-        in end_node_types. It uses DFS to find the path.
+        in end_node_types. The path is read off the containment tree in O(depth)
+        when one of the node's ancestors matches, otherwise it is found with DFS.
         """
         if end_node_types is None:
             end_node_types = [Room]
@@ -453,6 +521,11 @@ class WorldGraph(Graph):
             return {}  # Return empty path if we are already at the end node
 
         if visited is None:
+            ancestors = self.get_path_to_root(root_node)
+            end_types = tuple(end_node_types)
+            for depth, ancestor in enumerate(ancestors):
+                if isinstance(ancestor, end_types):
+                    return self._path_to_dict(ancestors[: depth + 1])
             visited = set()
 
         for neighbor, edge in self.graph[root_node].items():
@@ -471,6 +544,17 @@ class WorldGraph(Graph):
                     return path
         return None
 
+    def _path_to_dict(self, path: List[Entity]) -> Dict[Entity, Dict[Entity, str]]:
+        """
+        Converts a [node, parent, grandparent, ...] path into the dict of edges
+        along it returned by find_path
+        """
+        path_dict: Dict[Entity, Dict[Entity, str]] = {}
+        for child, parent in reversed(list(zip(path, path[1:]))):
+            path_dict.setdefault(child, {})[parent] = self.graph[child][parent]
+            path_dict.setdefault(parent, {})[child] = self.graph[parent][child]
+        return path_dict
+
     def get_subgraph(self, nodes_in, verbose: bool = False):
         """
         Method to get subgraph over objects in the view and agents.
@@ -504,21 +588,37 @@ class WorldGraph(Graph):
         # add all required nodes in the subgraph
         for curr_node in nodes:
             subgraph.add_node(curr_node)
+        required_nodes = set(nodes)
 
-        # Loop through all object+agent nodes
-        # and populate edges in the subgraph up to House
+        # Loop through all object+agent nodes and populate edges in the
+        # subgraph up to House. Walking up the containment tree stops at
+        # ancestors already linked to House, so shared ancestors are visited once.
+        linked_to_house = set()
         for curr_node in nodes:
-            path_graph = self.find_path(
-                root_node=curr_node,
-                end_node_types=[House],
-                verbose=True,
-            )
+            path = [curr_node]
+            while (
+                not isinstance(path[-1], House) and path[-1].name not in linked_to_house
+            ):
+                parent = self.get_parent(path[-1])
+                if parent is None:
+                    break
+                path.append(parent)
+
+            if isinstance(path[-1], House) or path[-1].name in linked_to_house:
+                path_graph = self._path_to_dict(path)
+                linked_to_house.update(node.name for node in path)
+            else:
+                path_graph = self.find_path(
+                    root_node=curr_node,
+                    end_node_types=[House],
+                    verbose=True,
+                )
 
             if path_graph is not None:
                 for curr_node in path_graph:
                     subgraph.add_node(curr_node)
                     for neighbor, edge in path_graph[curr_node].items():
-                        if neighbor not in nodes:
+                        if neighbor not in required_nodes:
                             subgraph.add_node(neighbor)
                         subgraph.add_edge(
                             curr_node, neighbor, edge, path_graph[neighbor][curr_node]
@@ -587,35 +687,14 @@ class WorldGraph(Graph):
                 raise ValueError("Location should be a list of 3 elements")
             location = np.array(location)
 
-        entity_list = []
+        class_types = []
         if include_rooms:
-            entity_list += self.get_all_rooms()
+            class_types.append(Room)
         if include_furniture:
-            entity_list += self.get_all_furnitures()
+            class_types.append(Furniture)
         if include_objects:
-            entity_list += self.get_all_objects()
-        filtered_entity_list = []
-        for ent in entity_list:
-            if "translation" in ent.properties:
-                filtered_entity_list.append(ent)
-            else:
-                self._logger.debug(
-                    f"Entity {ent.name} found without a translation property"
-                )
-        entity_list = filtered_entity_list
-        closest = sorted(
-            entity_list,
-            key=lambda x: np.linalg.norm(
-                location - np.array(x.properties["translation"])
-            ),
-        )[:n]
-        if dist_threshold > 0.0:
-            within_threshold = [
-                obj
-                for obj in closest
-                if np.linalg.norm(location - np.array(obj.properties["translation"]))
-                < dist_threshold
-            ]
-        else:
-            within_threshold = closest
-        return within_threshold
+            class_types.append(Object)
+        if not class_types:
+            return []
+        # Entities without a translation are left out of the spatial index
+        return self._get_closest_nodes(location, n, dist_threshold, tuple(class_types))
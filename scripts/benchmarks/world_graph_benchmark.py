@@ -0,0 +1,1560 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Micro-benchmarks for the world-graph data structures on synthetic scenes.
+
+Usage:
+    python scripts/benchmarks/world_graph_benchmark.py --benchmark lookup --num-nodes 5000
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+import pickle
+import random
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from habitat_llm.world_model import (
+    Furniture,
+    House,
+    Human,
+    Object,
+    Room,
+    SpotRobot,
+    WorldGraph,
+)
+
+
+def build_synthetic_world_graph(
+    num_nodes: int, num_rooms: int = 20, objects_per_furniture: int = 3, seed: int = 0
+) -> WorldGraph:
+    """
+    Builds a house->room->furniture->object hierarchy with roughly num_nodes nodes
+    and two agents. Every node has a sim_handle and a translation.
+    """
+    rng = random.Random(seed)
+    graph = WorldGraph()
+    house = House("house", {"type": "root"}, "house_0")
+    graph.add_node(house)
+
+    def random_translation() -> List[float]:
+        return [rng.uniform(-20, 20), rng.uniform(0, 2), rng.uniform(-20, 20)]
+
+    rooms = []
+    for room_idx in range(num_rooms):
+        room = Room(
+            f"room_{room_idx}",
+            {"type": "room", "translation": random_translation()},
+            f"room_handle_{room_idx}",
+        )
+        graph.add_node(room)
+        graph.add_edge(room, house, "inside", "contains")
+        rooms.append(room)
+
+    for agent_idx, agent_cls in enumerate([SpotRobot, Human]):
+        agent = agent_cls(
+            f"agent_{agent_idx}",
+            {"type": "agent", "translation": random_translation()},
+            f"agent_handle_{agent_idx}",
+        )
+        graph.add_node(agent)
+        graph.add_edge(agent, rng.choice(rooms), "in", "contains")
+
+    fur_idx = 0
+    while graph.size() < num_nodes:
+        furniture = Furniture(
+            f"table_{fur_idx}",
+            {"type": "table", "translation": random_translation()},
+            f"furniture_handle_{fur_idx}",
+        )
+        graph.add_node(furniture)
+        graph.add_edge(furniture, rng.choice(rooms), "in", "contains")
+        for obj_idx in range(objects_per_furniture):
+            if graph.size() >= num_nodes:
+                break
+            obj = Object(
+                f"cup_{fur_idx}_{obj_idx}",
+                {"type": "cup", "translation": random_translation()},
+                f"object_handle_{fur_idx}_{obj_idx}",
+            )
+            graph.add_node(obj)
+            graph.add_edge(obj, furniture, "on", "under")
+        fur_idx += 1
+
+    return graph
+
+
+def time_call(fn: Callable, repeats: int) -> float:
+    """
+    Returns the average wall-clock time of fn() in milliseconds
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return 1000.0 * (time.perf_counter() - start) / repeats
+
+
+def report(title: str, timings: Dict[str, float]):
+    print(f"== {title}")
+    for label, value in timings.items():
+        print(f"  {label:<48} {value:10.4f} ms")
+
+
+def benchmark_lookup(num_nodes: int, num_queries: int = 1000):
+    """
+    Compares hash-indexed name/sim_handle lookups with the linear scans they replace
+    """
+    graph = build_synthetic_world_graph(num_nodes)
+    nodes = list(graph.graph)
+    queries = [random.choice(nodes) for _ in range(num_queries)]
+
+    def linear_name_lookup():
+        for query in queries:
+            next(node for node in graph.graph if node.name == query.name)
+
+    def linear_handle_lookup():
+        for query in queries:
+            next(node for node in graph.graph if node.sim_handle == query.sim_handle)
+
+    def indexed_name_lookup():
+        for query in queries:
+            graph.get_node_from_name(query.name)
+
+    def indexed_handle_lookup():
+        for query in queries:
+            graph.get_node_from_sim_handle(query.sim_handle)
+
+    report(
+        f"{num_queries} lookups on a {graph.size()}-node graph",
+        {
+            "get_node_from_name (linear scan)": time_call(linear_name_lookup, 3),
+            "get_node_from_name (indexed)": time_call(indexed_name_lookup, 3),
+            "get_node_from_sim_handle (linear scan)": time_call(
+                linear_handle_lookup, 3
+            ),
+            "get_node_from_sim_handle (indexed)": time_call(indexed_handle_lookup, 3),
+        },
+    )
+
+
+def benchmark_type_queries(num_nodes: int, num_queries: int = 100):
+    """
+    Compares type-bucketed queries with isinstance scans over every node
+    """
+    graph = build_synthetic_world_graph(num_nodes)
+
+    def scan_rooms():
+        for _ in range(num_queries):
+            [node for node in graph.graph if isinstance(node, Room)]
+
+    def scan_objects():
+        for _ in range(num_queries):
+            [node for node in graph.graph if isinstance(node, Object)]
+
+    def bucketed_rooms():
+        for _ in range(num_queries):
+            graph.get_all_rooms()
+
+    def bucketed_objects():
+        for _ in range(num_queries):
+            graph.get_all_objects()
+
+    def bucketed_count():
+        for _ in range(num_queries):
+            graph.count_nodes_of_type(Furniture)
+
+    report(
+        f"{num_queries} type queries on a {graph.size()}-node graph",
+        {
+            "get_all_rooms (isinstance scan)": time_call(scan_rooms, 3),
+            "get_all_rooms (bucketed)": time_call(bucketed_rooms, 3),
+            "get_all_objects (isinstance scan)": time_call(scan_objects, 3),
+            "get_all_objects (bucketed)": time_call(bucketed_objects, 3),
+            "count_nodes_of_type (bucketed)": time_call(bucketed_count, 3),
+        },
+    )
+
+
+def _scan_merge(graph: WorldGraph, other_graph: WorldGraph):
+    """
+    Reference merge that resolves every incoming node by scanning the graph,
+    as Graph.merge did before it joined on the name index
+    """
+
+    def scan(name):
+        return next((node for node in graph.graph if node.name == name), None)
+
+    for new_node in other_graph.graph:
+        old_node = scan(new_node.name)
+        if old_node is None:
+            graph.add_node(new_node)
+        elif "translation" in new_node.properties:
+            old_node.properties["translation"] = new_node.properties["translation"]
+    for curr_node, new_edges in other_graph.graph.items():
+        node = scan(curr_node.name)
+        for new_neighbor, edge in new_edges.items():
+            neighbor = scan(new_neighbor.name)
+            graph.graph[node][neighbor] = edge
+            graph.graph[neighbor][node] = other_graph.graph[new_neighbor][curr_node]
+
+
+def benchmark_merge(num_nodes: int):
+    """
+    Merges two overlapping graphs of 3k nodes each, with and without the keyed
+    join. The incoming graph has a different furniture/object layout, so part
+    of its nodes are new and most edges change.
+    """
+    num_nodes = min(num_nodes, 3000)
+
+    def make_pair():
+        graph = build_synthetic_world_graph(num_nodes, seed=0)
+        other_graph = build_synthetic_world_graph(
+            num_nodes, objects_per_furniture=2, seed=1
+        )
+        return graph, other_graph
+
+    timings = {}
+    for label, merge_fn in [
+        ("merge (per-node scan)", _scan_merge),
+        ("Graph.merge (keyed join)", lambda g, o: g.merge(o)),
+        (
+            "Graph.merge (keyed join, return_changes)",
+            lambda g, o: g.merge(o, return_changes=True),
+        ),
+    ]:
+        graph, other_graph = make_pair()
+        start = time.perf_counter()
+        merge_fn(graph, other_graph)
+        timings[label] = 1000.0 * (time.perf_counter() - start)
+    report(f"merge of two {num_nodes}-node graphs", timings)
+
+
+def benchmark_node_removal(num_nodes: int, num_removals: int = 500):
+    """
+    Compares node removal through the reverse-adjacency index with sweeping
+    every adjacency dict for incoming edges
+    """
+
+    def scan_removal():
+        graph = build_synthetic_world_graph(num_nodes)
+        victims = graph.get_all_objects()[:num_removals]
+        start = time.perf_counter()
+        for node in victims:
+            del graph.graph[node]
+            for edges in graph.graph.values():
+                if node in edges:
+                    del edges[node]
+        return 1000.0 * (time.perf_counter() - start)
+
+    def indexed_removal():
+        graph = build_synthetic_world_graph(num_nodes)
+        victims = graph.get_all_objects()[:num_removals]
+        start = time.perf_counter()
+        for node in victims:
+            graph.remove_node(node)
+        return 1000.0 * (time.perf_counter() - start)
+
+    report(
+        f"removing {num_removals} objects from a {num_nodes}-node graph",
+        {
+            "remove_node (sweep all adjacency dicts)": scan_removal(),
+            "remove_node (reverse adjacency)": indexed_removal(),
+        },
+    )
+
+
+def benchmark_perception_step(
+    num_nodes: int, num_steps: int = 20, num_moving: int = 10
+):
+    """
+    Per-step latency of refreshing the ground-truth graph and handing it to
+    the fully observable world graph: deepcopy twice, as perception and
+    WorldGraph.update used to, versus copy-on-write snapshots. Each step moves
+    a few objects and both agents, and re-parents one object.
+    """
+
+    def run(use_snapshots: bool) -> float:
+        gt_graph = build_synthetic_world_graph(num_nodes)
+        full_world_graph = WorldGraph()
+        full_world_graph.update(gt_graph.snapshot(), False, "gt")
+        rng = random.Random(0)
+        objects = gt_graph.get_all_objects()
+        furniture = gt_graph.get_all_furnitures()
+        agents = gt_graph.get_agents()
+
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            moving = rng.sample(objects, num_moving) + agents
+            if use_snapshots:
+                moving = gt_graph.get_writable_nodes(moving)
+            for node in moving:
+                node.properties["translation"] = [rng.random(), 0.0, rng.random()]
+            gt_graph.remove_all_edges(moving[0])
+            gt_graph.add_edge(moving[0], rng.choice(furniture), "on", "under")
+
+            if use_snapshots:
+                full_world_graph.update(gt_graph.snapshot(), False, "gt")
+            else:
+                recent_graph = copy.deepcopy(gt_graph)
+                full_world_graph.graph = full_world_graph.deepcopy_graph(
+                    recent_graph.graph
+                )
+        return 1000.0 * (time.perf_counter() - start) / num_steps
+
+    report(
+        f"per-step graph refresh on a {num_nodes}-node graph",
+        {
+            "deepcopy per step": run(use_snapshots=False),
+            "copy-on-write snapshot per step": run(use_snapshots=True),
+        },
+    )
+
+
+def benchmark_two_agent_perception(
+    num_nodes: int, num_steps: int = 20, num_moving: int = 10
+):
+    """
+    Per-step latency of the simulated perception of two agents under partial
+    observability: the ground truth graph plus one get_recent_subgraph call per
+    agent, each refreshing the sim associations again, versus one shared
+    PerceptionFrame. Runs PerceptionSim over the fake sim used by its tests.
+    """
+    # Imported here since PerceptionSim needs habitat
+    from habitat_llm.tests.test_perception_sim import (
+        FakePerceptionSim,
+        make_fake_sim,
+        random_object_position,
+    )
+
+    num_furniture = max(num_nodes // 8, 1)
+    num_objects = max(num_nodes - 2 * num_furniture, 1)
+
+    def run(use_frame: bool) -> float:
+        rng = random.Random(0)
+        sim = make_fake_sim(rng, num_objects, num_furniture)
+        perception = FakePerceptionSim(sim)
+        handles = list(sim.rom.objects)
+
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            for handle in rng.sample(handles, min(num_moving, len(handles))):
+                sim.rom.objects[handle].translation = random_object_position(
+                    rng, num_furniture
+                )
+            obs = {
+                "visible_handles": {
+                    uid: rng.sample(handles, min(20, len(handles)))
+                    for uid in ["0", "1"]
+                }
+            }
+            if use_frame:
+                frame = perception.get_perception_frame(["0", "1"], obs)
+                perception.get_subgraph_from_frame(frame, ["0"])
+                perception.get_subgraph_from_frame(frame, ["1"])
+            else:
+                perception.get_recent_graph()
+                perception.get_recent_subgraph(["0"], obs)
+                perception.get_recent_subgraph(["1"], obs)
+        return 1000.0 * (time.perf_counter() - start) / num_steps
+
+    report(
+        f"per-step two-agent perception over {num_objects} objects",
+        {
+            "full graph + get_recent_subgraph per agent": run(use_frame=False),
+            "shared perception frame": run(use_frame=True),
+        },
+    )
+
+
+def benchmark_metadata_lookup(num_nodes: int, num_metadata_rows: int = 40000):
+    """
+    Time spent in metadata property lookups while initializing the scene graph,
+    one per furniture: masking the metadata DataFrame per handle, as before,
+    versus the hash index of MetadataInterface.
+    """
+    import tempfile
+
+    # Imported here since MetadataInterface needs habitat
+    from habitat_llm.sims.metadata_interface import MetadataInterface
+    from habitat_llm.tests.test_metadata_interface import write_metadata_files
+
+    rng = random.Random(0)
+    rows = [
+        (f"{index:040x}", rng.choice(["table", "chair", "shelves"]))
+        for index in range(num_metadata_rows)
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        metadata_dict = write_metadata_files(folder, rows[::2], rows[1::2])
+        start = time.perf_counter()
+        metadata_interface = MetadataInterface(metadata_dict)
+        load_time = 1000.0 * (time.perf_counter() - start)
+    metadata = metadata_interface.metadata
+    handles = [rng.choice(rows)[0] for _ in range(max(num_nodes // 8, 1))]
+
+    def lookup_with_dataframe():
+        for handle_hash in handles:
+            object_row = metadata.loc[metadata["handle"] == handle_hash]
+            if object_row["type"].notna().any() and (object_row["type"] != "").any():
+                object_row["type"].values[0]
+
+    def lookup_with_index():
+        for handle_hash in handles:
+            metadata_interface.get_property_from_hash(handle_hash, "type")
+
+    report(
+        f"{len(handles)} furniture type lookups over {num_metadata_rows} metadata rows",
+        {
+            "MetadataInterface load (includes index)": load_time,
+            "DataFrame mask per lookup": time_call(lookup_with_dataframe, 1),
+            "hash index": time_call(lookup_with_index, 3),
+        },
+    )
+
+
+def benchmark_region_lookup(num_nodes: int, num_queries: int = 10000):
+    """
+    Finding the region containing a point, as done for agents every step:
+    region.contains on every region in order versus RegionGrid. Uses the
+    random two-level floor plans of the RegionGrid tests; num_nodes is unused.
+    """
+    from habitat_llm.sims.region_grid import RegionGrid
+    from habitat_llm.tests.test_region_grid import (
+        find_region_by_scan,
+        make_random_regions,
+    )
+
+    rng = random.Random(0)
+    regions = make_random_regions(rng)
+    points = [
+        [rng.uniform(-12, 18), rng.choice([0.5, 3.5]), rng.uniform(-12, 18)]
+        for _ in range(num_queries)
+    ]
+    start = time.perf_counter()
+    grid = RegionGrid(regions)
+    build_time = 1000.0 * (time.perf_counter() - start)
+
+    report(
+        f"{num_queries} region lookups over {len(regions)} regions",
+        {
+            "RegionGrid build": build_time,
+            "region.contains scan": time_call(
+                lambda: [find_region_by_scan(regions, point) for point in points], 3
+            ),
+            "RegionGrid": time_call(
+                lambda: [grid.get_region_index(point) for point in points], 3
+            ),
+        },
+    )
+
+
+def benchmark_panoptic_decomposition(
+    num_nodes: int, height: int = 480, width: int = 640, num_instances: int = 50
+):
+    """
+    Turning one panoptic frame into object detections: np.unique plus a
+    full-resolution mask and masked unprojection per instance, as before,
+    versus decompose_panoptic_image and unprojecting the pixel index lists.
+    num_nodes is unused.
+    """
+    import torch
+
+    # Imported here since PerceptionObs needs habitat_sim
+    from habitat_llm.perception.perception_obs import decompose_panoptic_image
+    from habitat_llm.tests.test_perception_obs import make_panoptic_image
+    from habitat_llm.utils.geometric import (
+        unproject_depth_at_pixel_indices,
+        unproject_masked_depth_to_xyz_coordinates,
+    )
+
+    rng = np.random.default_rng(0)
+    panoptic = make_panoptic_image(rng, height, width, num_instances)
+    depth = rng.uniform(0.5, 5.0, size=(height, width, 1)).astype(np.float32)
+    pose = np.eye(4)
+    inv_intrinsics = np.linalg.inv(
+        np.array([[width / 2, 0, width / 2], [0, width / 2, height / 2], [0, 0, 1]])
+    )
+
+    def decompose_with_masks():
+        ids = [idx for idx in np.unique(panoptic) if idx != 0]
+        return {idx: (panoptic == idx).astype(np.uint8) for idx in ids}
+
+    def unproject_masks():
+        for mask in decompose_with_masks().values():
+            unproject_masked_depth_to_xyz_coordinates(
+                torch.from_numpy(depth.reshape(1, 1, height, width)),
+                torch.from_numpy(pose.reshape(1, 4, 4)),
+                torch.from_numpy(inv_intrinsics.reshape(1, 3, 3)),
+                ~torch.from_numpy(mask.reshape(1, 1, height, width)).bool(),
+            ).mean(dim=0)
+
+    def unproject_pixel_indices():
+        for pixels in decompose_panoptic_image(panoptic).pixel_indices:
+            unproject_depth_at_pixel_indices(
+                torch.from_numpy(depth[..., 0]),
+                torch.from_numpy(pose),
+                torch.from_numpy(inv_intrinsics),
+                torch.from_numpy(pixels),
+            ).mean(dim=0)
+
+    report(
+        f"Panoptic frame of {width}x{height} with {num_instances} instances",
+        {
+            "np.unique + mask per instance": time_call(decompose_with_masks, 5),
+            "decompose_panoptic_image": time_call(
+                lambda: decompose_panoptic_image(panoptic), 5
+            ),
+            "masks + masked unprojection": time_call(unproject_masks, 3),
+            "pixel indices + unprojection": time_call(unproject_pixel_indices, 3),
+        },
+    )
+
+
+def benchmark_unprojection(
+    num_nodes: int, height: int = 480, width: int = 640, num_instances: int = 50
+):
+    """
+    Centroids of all the instances of one depth frame: the masked unprojection
+    of the full image per instance, as before, versus one batched unprojection
+    of the instance pixels over the cached ray grid. num_nodes is unused.
+    """
+    import torch
+
+    # Imported here since PerceptionObs needs habitat_sim
+    from habitat_llm.perception.perception_obs import decompose_panoptic_image
+    from habitat_llm.tests.test_perception_obs import make_panoptic_image
+    from habitat_llm.utils.geometric import (
+        unproject_depth_instances,
+        unproject_masked_depth_to_xyz_coordinates,
+    )
+
+    rng = np.random.default_rng(0)
+    instances = decompose_panoptic_image(
+        make_panoptic_image(rng, height, width, num_instances)
+    )
+    depth = torch.from_numpy(
+        rng.uniform(0.5, 5.0, size=(height, width)).astype(np.float32)
+    )
+    pose = torch.eye(4, dtype=torch.float64)
+    inv_intrinsics = torch.linalg.inv(
+        torch.tensor(
+            [[width / 2, 0, width / 2], [0, width / 2, height / 2], [0, 0, 1]],
+            dtype=torch.float64,
+        )
+    )
+    masks = []
+    for pixels in instances.pixel_indices:
+        mask = torch.ones(1, 1, height, width, dtype=torch.bool)
+        mask.view(-1)[torch.from_numpy(pixels)] = False
+        masks.append(mask)
+    pixel_indices = [torch.from_numpy(pixels) for pixels in instances.pixel_indices]
+
+    def masked_per_instance():
+        for mask in masks:
+            unproject_masked_depth_to_xyz_coordinates(
+                depth[None, None],
+                pose[None],
+                inv_intrinsics[None],
+                mask,
+            ).mean(dim=0)
+
+    report(
+        f"Unprojecting {num_instances} instances of a {width}x{height} depth frame",
+        {
+            "masked unprojection per instance": time_call(masked_per_instance, 3),
+            "batched over cached rays": time_call(
+                lambda: unproject_depth_instances(
+                    depth, pose, inv_intrinsics, pixel_indices
+                ),
+                10,
+            ),
+        },
+    )
+
+
+def benchmark_cg_ingestion(num_nodes: int):
+    """
+    Building a DynamicWorldGraph from concept-graph output with create_cg_edges,
+    for growing numbers of concept-graph objects. The time per object should
+    stay flat. num_nodes is unused.
+    """
+    import logging
+
+    from habitat_llm.tests.test_dynamic_world_graph import make_concept_graph_edges
+    from habitat_llm.world_model import DynamicWorldGraph
+
+    logging.disable(logging.INFO)
+    timings = {}
+    for num_objects in [500, 1000, 2000, 4000]:
+        cg_edges = make_concept_graph_edges(random.Random(0), num_objects)
+
+        timings[f"{num_objects} objects"] = time_call(
+            lambda cg_edges=cg_edges: DynamicWorldGraph().create_cg_edges(
+                cg_edges, include_objects=True
+            ),
+            3,
+        )
+    logging.disable(logging.NOTSET)
+    report("create_cg_edges", timings)
+
+
+def benchmark_detection_association(num_nodes: int, num_objects: int = 2000):
+    """
+    One frame of human detections associated with num_objects known objects:
+    checking each detection against the graph in turn, as before, versus the
+    batched association of update_non_privileged_graph_with_detected_objects.
+    Half of the detections are of known objects. num_nodes is unused.
+    """
+    import logging
+    from types import SimpleNamespace
+
+    from habitat_llm.tests.test_dynamic_world_graph import (
+        CATEGORIES,
+        make_detection_scene,
+        update_with_detected_objects_sequentially,
+    )
+
+    logging.disable(logging.INFO)
+    rng = random.Random(0)
+
+    def random_position():
+        x = rng.choice([-1, 1]) * rng.uniform(2.0, 6.0)
+        return [x, rng.uniform(-1.0, 1.0), rng.uniform(-10.0, 10.0)]
+
+    far_away = SimpleNamespace(translation=[0.0, 100.0, 0.0])
+    articulated_agents = {
+        uid: SimpleNamespace(ee_transform=lambda: far_away) for uid in [0, 1]
+    }
+
+    def fresh_copies(repeats: int):
+        # snapshots don't keep the articulated agents; their spatial index is
+        # rebuilt here, outside of the timed updates
+        graph_copies = []
+        for _ in range(repeats):
+            graph_copy = graph.snapshot()
+            graph_copy.set_articulated_agents(articulated_agents)
+            graph_copy._get_spatial_index()
+            graph_copies.append(graph_copy)
+        return iter(graph_copies)
+
+    graph = make_detection_scene()
+    for _ in range(num_objects):
+        graph.add_node(
+            Object(
+                f"{graph._num_entities_added + 1}_object",
+                {"type": rng.choice(CATEGORIES), "translation": random_position()},
+            )
+        )
+    known_objects = graph.get_all_nodes_of_type(Object)
+
+    timings = {}
+    for num_detections in [20, 100, 500]:
+        categories, locations = {}, {}
+        for index in range(num_detections):
+            if index % 2 == 0:
+                obj = rng.choice(known_objects)
+                categories[index] = obj.properties["type"]
+                locations[index] = [
+                    value + rng.uniform(-0.05, 0.05)
+                    for value in obj.properties["translation"]
+                ]
+            else:
+                categories[index] = rng.choice(CATEGORIES)
+                locations[index] = random_position()
+        camera_pose = np.eye(4)
+        camera_pose[:3, 3] = [4.0, 0.0, -1.5]
+        frame_desc = {
+            1: {
+                "object_category_mapping": categories,
+                "object_handle_mapping": {
+                    index: f"handle_{index}" for index in categories
+                },
+                "object_pixel_indices": {index: np.array([0]) for index in categories},
+                "object_locations": locations,
+                "camera_pose": camera_pose,
+            }
+        }
+        graph_copies = fresh_copies(5)
+        timings[f"{num_detections} detections, one at a time"] = time_call(
+            lambda g=graph_copies, f=frame_desc: (
+                update_with_detected_objects_sequentially(next(g), f)
+            ),
+            5,
+        )
+        graph_copies = fresh_copies(5)
+        timings[f"{num_detections} detections, batched"] = time_call(
+            lambda g=graph_copies, f=frame_desc: (
+                next(g).update_non_privileged_graph_with_detected_objects(f)
+            ),
+            5,
+        )
+    logging.disable(logging.NOTSET)
+    report(f"Associating detections with {num_objects} objects", timings)
+
+
+def _render_panoptic_frame(
+    camera_pose: np.ndarray,
+    positions: np.ndarray,
+    intrinsics: np.ndarray,
+    height: int,
+    width: int,
+    size: int = 5,
+):
+    """
+    Renders objects as size x size squares into a panoptic image, object i
+    with id 101 + i, and a depth image, seen from camera_pose in OpenGL
+    convention. Returns both images as (H, W, 1).
+    """
+    camera_points = (positions - camera_pose[:3, 3]) @ camera_pose[:3, :3]
+    # OpenGL cameras look down -z
+    depths = -camera_points[:, 2]
+    panoptic = np.zeros((height, width, 1), dtype=np.int32)
+    depth = np.zeros((height, width, 1), dtype=np.float32)
+    # far to near, so that closer objects are drawn over
+    for index in np.argsort(-depths):
+        if depths[index] < 0.3:
+            continue
+        x = round(intrinsics[0, 0] * camera_points[index, 0] / depths[index])
+        y = round(-intrinsics[1, 1] * camera_points[index, 1] / depths[index])
+        x += round(intrinsics[0, 2]) - size // 2
+        y += round(intrinsics[1, 2]) - size // 2
+        if -size < x < width and -size < y < height:
+            window = np.s_[max(y, 0) : y + size, max(x, 0) : x + size]
+            panoptic[window] = 101 + index
+            depth[window] = depths[index]
+    return panoptic, depth
+
+
+def benchmark_keyframe_gating(
+    num_nodes: int, num_steps: int = 300, num_objects: int = 80
+):
+    """
+    Updates of a DynamicWorldGraph from the robot's frames along a trajectory
+    that alternates moving, standing still and turning, with and without
+    keyframe gating. Reports the number of updates, the step latency (panoptic
+    decomposition, unprojection and association) and the final graph accuracy,
+    as the share of objects with a detected object of the same type within
+    0.25m. num_nodes is unused.
+    """
+    import logging
+    from types import SimpleNamespace
+
+    # Imported here since PerceptionObs needs habitat_sim
+    from habitat_llm.perception.keyframe_policy import KeyframePolicy
+    from habitat_llm.perception.perception_obs import (
+        decompose_panoptic_image,
+        get_panoptic_ids,
+    )
+    from habitat_llm.tests.test_dynamic_world_graph import (
+        CATEGORIES,
+        make_detection_scene,
+    )
+
+    logging.disable(logging.INFO)
+    height, width = 480, 640
+    intrinsics = np.array(
+        [[width / 2, 0.0, width / 2], [0.0, width / 2, height / 2], [0.0, 0.0, 1.0]]
+    )
+    rng = np.random.default_rng(0)
+    positions = np.stack(
+        [
+            rng.uniform(-6.0, 6.0, num_objects),
+            rng.uniform(-0.5, 1.0, num_objects),
+            rng.uniform(-7.0, -1.5, num_objects),
+        ],
+        axis=1,
+    )
+    categories = [CATEGORIES[index % len(CATEGORIES)] for index in range(num_objects)]
+
+    camera_poses = []
+    x, yaw = 0.0, 0.0
+    for step in range(num_steps):
+        phase = (step // 20) % 3
+        if phase == 0:
+            x = float(np.clip(x + 0.05 * np.sign(np.sin(step / 60.0) + 0.1), -2, 2))
+        elif phase == 2:
+            yaw = 40.0 * np.sin(step / 15.0)
+        pose = np.eye(4)
+        angle = np.radians(yaw)
+        pose[:3, :3] = [
+            [np.cos(angle), 0.0, np.sin(angle)],
+            [0.0, 1.0, 0.0],
+            [-np.sin(angle), 0.0, np.cos(angle)],
+        ]
+        # small jitter while standing still
+        pose[:3, 3] = [x, 0.5, 0.0] + rng.normal(0.0, 0.005, 3)
+        camera_poses.append(pose)
+    frames = [
+        _render_panoptic_frame(pose, positions, intrinsics, height, width)
+        for pose in camera_poses
+    ]
+
+    far_away = SimpleNamespace(translation=[0.0, 100.0, 0.0])
+    articulated_agents = {
+        uid: SimpleNamespace(ee_transform=lambda: far_away) for uid in [0, 1]
+    }
+    timings, summaries = {}, {}
+    for label, enabled in [("every frame", False), ("keyframes", True)]:
+        graph = make_detection_scene()
+        graph.set_articulated_agents(articulated_agents)
+        policy = KeyframePolicy(enabled=enabled)
+        start = time.perf_counter()
+        for camera_pose, (panoptic, depth) in zip(camera_poses, frames):
+            if not policy.is_keyframe(0, camera_pose, get_panoptic_ids(panoptic)):
+                frame = {
+                    "is_keyframe": False,
+                    "object_pixel_indices": {},
+                    "object_category_mapping": {},
+                    "object_handle_mapping": {},
+                    "camera_pose": camera_pose,
+                }
+            else:
+                instances = decompose_panoptic_image(panoptic, depth.shape[:2])
+                ids = instances.ids.tolist()
+                frame = {
+                    "is_keyframe": True,
+                    "object_pixel_indices": dict(zip(ids, instances.pixel_indices)),
+                    "object_category_mapping": {
+                        idx: categories[idx - 101] for idx in ids
+                    },
+                    "object_handle_mapping": {idx: f"handle_{idx}" for idx in ids},
+                    "depth": depth,
+                    "camera_intrinsics": intrinsics,
+                    "camera_pose": camera_pose,
+                }
+            graph.update_non_privileged_graph_with_detected_objects({0: frame})
+        timings[f"step latency, {label}"] = (
+            1000.0 * (time.perf_counter() - start) / num_steps
+        )
+
+        detected = [
+            node
+            for node in graph.get_all_nodes_of_type(Object)
+            if node.properties["type"] in CATEGORIES
+        ]
+        detected_positions = np.array(
+            [node.properties["translation"] for node in detected]
+        ).reshape(-1, 3)
+        num_found = sum(
+            any(
+                node.properties["type"] == category and distance < 0.25
+                for node, distance in zip(
+                    detected,
+                    np.linalg.norm(detected_positions - position, axis=-1),
+                )
+            )
+            for position, category in zip(positions, categories)
+        )
+        summaries[label] = (
+            f"{policy.num_keyframes}/{num_steps} updates, "
+            f"{num_found}/{num_objects} objects found, "
+            f"{len(detected)} detected objects"
+        )
+    logging.disable(logging.NOTSET)
+    report(f"Keyframe gating over {num_steps} robot frames", timings)
+    for label, summary in summaries.items():
+        print(f"  {label:<48} {summary}")
+
+
+def _top5_furniture_relation(graph: WorldGraph, translation: List[float]):
+    """
+    Relation of an object at translation to furniture as previously found by
+    DynamicWorldGraph._cg_check_for_relation: testing the bounding boxes of
+    the five closest furniture one at a time
+    """
+    point = np.array(translation)
+    for fur in graph.get_closest_entities(
+        5, location=translation, include_objects=False
+    ):
+        bbox_min = np.array(fur.properties["bbox_min"])
+        bbox_max = np.array(fur.properties["bbox_max"])
+        if np.all((point >= bbox_min) & (point <= bbox_max)):
+            return fur, "in"
+        if (
+            np.all(point[[0, 2]] >= bbox_min[[0, 2]])
+            and np.all(point[[0, 2]] <= bbox_max[[0, 2]])
+            and point[1] > bbox_max[1]
+        ):
+            return fur, "on"
+    return None, None
+
+
+def benchmark_furniture_relations(num_nodes: int, num_furniture: int = 300):
+    """
+    Furniture relations of the new objects of a frame: the bounding boxes of
+    the five closest furniture tested per object, as before, versus all
+    furniture tested for all objects at once. num_nodes is unused.
+    """
+    from habitat_llm.world_model import DynamicWorldGraph
+
+    rng = random.Random(0)
+    graph = DynamicWorldGraph()
+    for index in range(num_furniture):
+        center = np.array(
+            [rng.uniform(-20, 20), rng.uniform(0, 1), rng.uniform(-20, 20)]
+        )
+        extent = np.array([rng.uniform(0.2, 1.0), 0.4, rng.uniform(0.2, 1.0)])
+        graph.add_node(
+            Furniture(
+                f"furniture_{index}",
+                {
+                    "type": "table",
+                    "translation": center.tolist(),
+                    "bbox_min": (center - extent).tolist(),
+                    "bbox_max": (center + extent).tolist(),
+                },
+            )
+        )
+    graph._get_spatial_index()
+
+    timings = {}
+    for num_objects in [20, 100, 500]:
+        translations = np.array(
+            [
+                [rng.uniform(-20, 20), rng.uniform(0, 2), rng.uniform(-20, 20)]
+                for _ in range(num_objects)
+            ]
+        )
+        timings[f"{num_objects} objects, five closest per object"] = time_call(
+            lambda translations=translations: [
+                _top5_furniture_relation(graph, translation)
+                for translation in translations.tolist()
+            ],
+            10,
+        )
+        timings[f"{num_objects} objects, all furniture at once"] = time_call(
+            lambda translations=translations: graph._cg_check_for_relations(
+                translations
+            ),
+            10,
+        )
+    report(f"Furniture relations among {num_furniture} furniture", timings)
+
+
+def _brute_force_closest_entities(
+    graph: WorldGraph, n: int, location: List[float], dist_threshold: float
+):
+    """
+    Reference get_closest_entities that sorts every furniture and object by
+    distance, as WorldGraph did before it had a spatial index
+    """
+    location = np.array(location)
+    entity_list = [
+        node
+        for node in graph.get_all_furnitures() + graph.get_all_objects()
+        if "translation" in node.properties
+    ]
+    closest = sorted(
+        entity_list,
+        key=lambda x: np.linalg.norm(location - np.array(x.properties["translation"])),
+    )[:n]
+    if dist_threshold > 0.0:
+        return [
+            node
+            for node in closest
+            if np.linalg.norm(location - np.array(node.properties["translation"]))
+            < dist_threshold
+        ]
+    return closest
+
+
+def benchmark_nearest(num_nodes: int, num_queries: int = 200):
+    """
+    Compares get_closest_entities on the spatial index with sorting every
+    candidate by distance, and checks that both return the same entities.
+    Runs on at least 10k entities.
+    """
+    num_nodes = max(num_nodes, 10000)
+    graph = build_synthetic_world_graph(num_nodes)
+    rng = random.Random(0)
+    queries = [
+        ([rng.uniform(-20, 20), 1.0, rng.uniform(-20, 20)], n, dist_threshold)
+        for n, dist_threshold in [(5, 1.5), (5, -1.0), (1, -1.0)]
+        for _ in range(num_queries)
+    ]
+
+    def brute_force():
+        return [
+            _brute_force_closest_entities(graph, n, location, dist_threshold)
+            for location, n, dist_threshold in queries[:20]
+        ]
+
+    def indexed():
+        return [
+            graph.get_closest_entities(
+                n, location=location, dist_threshold=dist_threshold
+            )
+            for location, n, dist_threshold in queries[:20]
+        ]
+
+    if brute_force() != indexed():
+        raise ValueError("Spatial index results differ from brute force")
+
+    def indexed_with_moves():
+        objects = graph.get_all_objects()
+        for location, n, dist_threshold in queries:
+            graph.set_node_translation(
+                rng.choice(objects),
+                [rng.uniform(-20, 20), 1.0, rng.uniform(-20, 20)],
+            )
+            graph.get_closest_entities(
+                n, location=location, dist_threshold=dist_threshold
+            )
+
+    report(
+        f"nearest-entity queries on a {graph.size()}-node graph (per 20 queries)",
+        {
+            "get_closest_entities (sort all candidates)": time_call(brute_force, 1),
+            "get_closest_entities (spatial index)": time_call(indexed, 3),
+            "spatial index with a node moved per query": time_call(
+                indexed_with_moves, 1
+            )
+            * 20
+            / len(queries),
+        },
+    )
+
+
+def benchmark_containment(num_nodes: int, num_queries: int = 500):
+    """
+    Compares find_path to the house on the containment tree with the DFS it
+    replaces, and times get_subgraph, which gathers the ancestors of all
+    requested nodes in one pass
+    """
+    graph = build_synthetic_world_graph(num_nodes)
+    rng = random.Random(0)
+    objects = graph.get_all_objects()
+    queries = [rng.choice(objects) for _ in range(num_queries)]
+
+    # The DFS follows adjacency order. Re-linking rooms to the house puts the
+    # parent edge last in their rows, as happens when edges are re-created.
+    relinked_graph = graph.snapshot()
+    for room in relinked_graph.get_all_rooms():
+        house = relinked_graph.get_parent(room)
+        relinked_graph.remove_edge(room, house)
+        relinked_graph.add_edge(room, house, "inside", "contains")
+
+    timings = {}
+    for label, world_graph in [("", graph), (", relinked", relinked_graph)]:
+        for node in queries[:20]:
+            # passing visited skips the containment tree and runs the DFS
+            if world_graph.find_path(node, [House]) != world_graph.find_path(
+                node, [House], visited=set()
+            ):
+                raise ValueError("Containment tree path differs from DFS")
+        timings[f"find_path (DFS{label})"] = time_call(
+            lambda g=world_graph: [
+                g.find_path(n, [House], visited=set()) for n in queries
+            ],
+            1,
+        )
+        timings[f"find_path (containment tree{label})"] = time_call(
+            lambda g=world_graph: [g.find_path(n, [House]) for n in queries], 3
+        )
+    timings["get_subgraph of all queried nodes"] = time_call(
+        lambda: graph.get_subgraph(queries), 3
+    )
+    report(
+        f"paths to the house on a {graph.size()}-node graph (per {num_queries} queries)",
+        timings,
+    )
+
+
+def _full_world_descr(graph: WorldGraph) -> str:
+    """
+    Reference get_world_descr that rebuilds the whole description, as
+    WorldGraph did before descriptions were cached per room
+    """
+    house_info = ""
+    for k, v in graph.group_furniture_by_room().items():
+        house_info += k + ": " + ", ".join(furn.name for furn in v) + "\n"
+    spot_node = graph.get_spot_robot()
+    human_node = graph.get_human()
+    objs_info = ""
+    for obj in graph.get_all_objects():
+        if graph.is_object_with_agent(obj, agent_type="robot"):
+            objs_info += obj.name + ": " + spot_node.name + "\n"
+        elif graph.is_object_with_agent(obj, agent_type="human"):
+            objs_info += obj.name + ": " + human_node.name + "\n"
+        else:
+            objs_info += obj.name + ": " + graph.find_furniture_for_object(obj).name
+            objs_info += "\n"
+    return f"Furniture:\n{house_info}\nObjects:\n{objs_info}"
+
+
+def benchmark_world_descr(num_nodes: int, num_replans: int = 50):
+    """
+    Compares get_world_descr, which regenerates only the rooms that changed,
+    with rebuilding the description from scratch on every replan, also for an
+    agent graph replaced by the full observation before every replan
+    """
+    graph = build_synthetic_world_graph(num_nodes)
+    agent_graph = WorldGraph()
+    rng = random.Random(0)
+    objects = graph.get_all_objects()
+    furnitures = graph.get_all_furnitures()
+
+    def move_object():
+        obj = rng.choice(objects)
+        graph.remove_all_edges(obj)
+        graph.add_edge(obj, rng.choice(furnitures), "on", "under")
+
+    def replans(describe: Callable, changed: bool, observed: bool):
+        for _ in range(num_replans):
+            if changed:
+                move_object()
+            if observed:
+                agent_graph.update(
+                    graph.snapshot(), partial_obs=False, update_mode="gt"
+                )
+                describe(agent_graph)
+            else:
+                describe(graph)
+
+    for _ in range(5):
+        move_object()
+        if graph.get_world_descr() != _full_world_descr(graph):
+            raise ValueError("Cached world description differs from full rebuild")
+
+    timings = {}
+    for label, changed, observed in [
+        ("unchanged graph", False, False),
+        ("one object moved", True, False),
+        ("full observation", True, True),
+    ]:
+        for method, describe in [
+            ("full rebuild", _full_world_descr),
+            ("per-room cache", WorldGraph.get_world_descr),
+        ]:
+            timings[f"{method} ({label})"] = (
+                time_call(lambda d=describe, c=changed, o=observed: replans(d, c, o), 1)
+                / num_replans
+            )
+    report(
+        f"world descriptions on a {graph.size()}-node graph (per replan)",
+        timings,
+    )
+
+
+def benchmark_serialization(num_nodes: int):
+    """
+    Compares save_snapshot/load_snapshot with pickling the graph and with
+    writing it as DOT text. There is no DOT reader to compare loading with.
+    Nodes get the properties of ground-truth graphs: bounding boxes, object
+    states, articulation and components of furniture, the held object.
+    """
+    graph = build_synthetic_world_graph(num_nodes)
+    rng = np.random.default_rng(0)
+    for node in graph.graph:
+        if isinstance(node, (Furniture, Object)):
+            bbox_min = rng.uniform(-20, 20, 3).astype(np.float32)
+            node.properties["bbox_min"] = bbox_min
+            node.properties["bbox_max"] = bbox_min + rng.uniform(0, 2, 3)
+        if isinstance(node, Furniture):
+            node.properties["is_articulated"] = bool(rng.integers(2))
+            node.properties["components"] = ["faucet"] if rng.integers(10) == 0 else []
+        elif isinstance(node, Object):
+            node.properties["states"] = {
+                "is_clean": bool(rng.integers(2)),
+                "is_powered_on": bool(rng.integers(2)),
+            }
+    graph.get_node_from_name("agent_1").properties[
+        "last_held_object"
+    ] = graph.get_node_from_name("cup_0_0")
+
+    def save_snapshot() -> bytes:
+        buffer = io.BytesIO()
+        graph.save_snapshot(buffer)
+        return buffer.getvalue()
+
+    snapshot = save_snapshot()
+    pickled = pickle.dumps(graph)
+    loaded = WorldGraph.load_snapshot(io.BytesIO(snapshot))
+    if [node.name for node in loaded.graph] != [node.name for node in graph.graph]:
+        raise ValueError("Snapshot round trip changed the graph")
+    if [len(node.properties) for node in loaded.graph] != [
+        len(node.properties) for node in graph.graph
+    ]:
+        raise ValueError("Snapshot round trip lost node properties")
+
+    report(
+        f"serialization of a {graph.size()}-node graph "
+        f"(snapshot {len(snapshot) / 1e6:.1f} MB, pickle {len(pickled) / 1e6:.1f} MB)",
+        {
+            "pickle.dumps": time_call(lambda: pickle.dumps(graph), 20),
+            "pickle.loads": time_call(lambda: pickle.loads(pickled), 20),
+            "to_dot": time_call(graph.to_dot, 20),
+            "save_snapshot": time_call(save_snapshot, 20),
+            "load_snapshot": time_call(
+                lambda: WorldGraph.load_snapshot(io.BytesIO(snapshot)), 20
+            ),
+        },
+    )
+
+
+def _rewrite_json_log(path: str, record: dict):
+    """
+    Logs a step as LogSystem previously did: loading the whole JSON log,
+    appending the record and writing the log again
+    """
+    records = []
+    if os.path.exists(path):
+        with open(path) as file:
+            records = json.load(file)
+    records.append(record)
+    with open(path, "w") as file:
+        json.dump(records, file, indent=4)
+
+
+def benchmark_graph_log(num_nodes: int, num_steps: int = 2000):
+    """
+    Per-step cost of logging the world graphs of a growing episode: rewriting
+    the whole JSON log, as before, versus appending a JSON Lines record with
+    LogSystem. The graphs have min(num_nodes, 100) nodes, and one object moves
+    per step. The rewritten log only runs for 200 steps, as its cost is
+    quadratic in the number of steps.
+    """
+    import tempfile
+
+    # Imported here since the env package needs habitat
+    from habitat_llm.agent.env.log_graph import LogSystem
+
+    graph = build_synthetic_world_graph(min(num_nodes, 100))
+    rng = random.Random(0)
+    objects = graph.get_all_objects()
+    furnitures = graph.get_all_furnitures()
+    window = 50
+
+    def move_object():
+        obj = rng.choice(objects)
+        graph.remove_all_edges(obj)
+        graph.add_edge(obj, rng.choice(furnitures), "on", "under")
+
+    def run_steps(log_step: Callable, num_steps: int) -> Dict[int, float]:
+        """
+        Returns the average time of steps in windows, keyed by their last step
+        """
+        window_times = {}
+        for first_step in range(0, num_steps, window):
+            start = time.perf_counter()
+            for _ in range(window):
+                move_object()
+                log_step()
+            if first_step + window in [window, 200, 1000, num_steps]:
+                window_times[first_step + window] = (
+                    1000.0 * (time.perf_counter() - start) / window
+                )
+        return window_times
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        logger = LogSystem(output_dir, run_name="appended")
+        json_path = os.path.join(output_dir, "rewritten.json")
+
+        def rewrite_step():
+            step = logger.num_of_step
+            logger.num_of_step += 1
+            # same graph processing as LogSystem, only the file writes differ
+            for _ in range(3):
+                graph.get_world_descr()
+            _rewrite_json_log(
+                json_path,
+                {
+                    "Step": step,
+                    "WorldGraph": logger.dot_to_json(graph.to_dot()),
+                    "RobotWorldGraph": logger.dot_to_json(graph.to_dot()),
+                    "HumanWorldGraph": logger.dot_to_json(graph.to_dot()),
+                },
+            )
+
+        for step, value in run_steps(rewrite_step, 200).items():
+            timings[f"rewritten JSON, steps {step - window + 1}-{step}"] = value
+        logger.num_of_step = 1
+        appended = run_steps(
+            lambda: logger.log_world_graphs(graph, graph, graph), num_steps
+        )
+        for step, value in appended.items():
+            timings[f"appended JSON Lines, steps {step - window + 1}-{step}"] = value
+        logger.close()
+    report(f"Logging the world graphs of a {graph.size()}-node graph per step", timings)
+
+
+def benchmark_graph_export(num_nodes: int):
+    """
+    Cost of the per-step edge export of LogSystem: parsing the DOT text of the
+    graph, as before, versus to_edge_lists
+    """
+    # Imported here since the env package needs habitat
+    from habitat_llm.agent.env.log_graph import LogSystem
+
+    graph = build_synthetic_world_graph(num_nodes)
+    if graph.to_edge_lists() != LogSystem.dot_to_json(graph.to_dot()):
+        raise ValueError("to_edge_lists differs from the parsed DOT text")
+    report(
+        f"edge export of a {graph.size()}-node graph",
+        {
+            "dot_to_json(to_dot())": time_call(
+                lambda: LogSystem.dot_to_json(graph.to_dot()), 3
+            ),
+            "to_edge_lists()": time_call(graph.to_edge_lists, 3),
+        },
+    )
+
+
+def benchmark_graph_log_delta(num_nodes: int, num_steps: int = 2000):
+    """
+    Size and per-step cost of logging the world graphs of an episode in full
+    every step versus as deltas with a keyframe every 50 steps, and the cost of
+    replaying a step. The graphs have min(num_nodes, 500) nodes, and one object
+    moves per step.
+    """
+    import tempfile
+
+    # Imported here since the env package needs habitat
+    from habitat_llm.agent.env.log_graph import LogSystem, replay_world_graph_log
+
+    timings = {}
+    sizes = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for keyframe_interval in [1, 50]:
+            graph = build_synthetic_world_graph(min(num_nodes, 500))
+            rng = random.Random(0)
+            objects = graph.get_all_objects()
+            furnitures = graph.get_all_furnitures()
+            logger = LogSystem(
+                output_dir,
+                run_name=f"keyframe_interval_{keyframe_interval}",
+                keyframe_interval=keyframe_interval,
+            )
+            # Time the JSON record only, the text descriptions are the same
+            graph.get_world_descr = lambda is_human_wg=False: ""
+            elapsed = 0.0
+            for _ in range(num_steps):
+                obj = rng.choice(objects)
+                graph.remove_all_edges(obj)
+                graph.add_edge(obj, rng.choice(furnitures), "on", "under")
+                start = time.perf_counter()
+                logger.log_world_graphs(graph, graph, graph)
+                elapsed += time.perf_counter() - start
+            logger.close()
+            name = "full" if keyframe_interval == 1 else "delta"
+            timings[f"{name}, log a step"] = 1000.0 * elapsed / num_steps
+            timings[f"{name}, replay step {num_steps - 1}"] = time_call(
+                lambda logger=logger: replay_world_graph_log(
+                    logger.output_json_file, num_steps - 1
+                ),
+                3,
+            )
+            sizes.append(os.path.getsize(logger.output_json_file) / 1e6)
+    report(
+        f"{num_steps}-step log of a {graph.size()}-node graph "
+        f"(full {sizes[0]:.1f} MB, delta {sizes[1]:.1f} MB)",
+        timings,
+    )
+
+
+def _write_benchmark_frame(save_path: str, trajectory_idx: int, frame: dict):
+    """
+    Writes a trajectory frame like write_trajectory_frame, with zlib standing in
+    for the jpg/png encodes so that the benchmark runs without cv2 and imageio
+    """
+    import zlib
+
+    for modality, array in frame.items():
+        np.save(os.path.join(save_path, f"{modality}_{trajectory_idx}.npy"), array)
+        if modality != "pose":
+            with open(
+                os.path.join(save_path, f"{modality}_{trajectory_idx}.z"), "wb"
+            ) as file:
+                file.write(zlib.compress(array.tobytes(), 1))
+
+
+def benchmark_trajectory_saving(num_nodes: int, num_steps: int = 100):
+    """
+    Latency of simulation steps saving 640x480 RGB, depth and panoptic frames
+    and poses: not saving, writing on the stepping thread, and with the
+    background TrajectoryWriter. A simulation step is emulated by waiting 20 ms,
+    as rendering and physics run outside of Python. num_nodes is unused.
+    """
+    import tempfile
+
+    # Imported here since the env package needs habitat
+    from habitat_llm.agent.env.trajectory_writer import TrajectoryWriter
+
+    height, width = 480, 640
+    ys, xs = np.mgrid[0:height, 0:width]
+    base_rgb = np.stack([xs // 4, ys // 4, (xs + ys) // 8], axis=-1) % 256
+    base_rgb = base_rgb.astype(np.uint8)
+    base_depth = (0.5 + 4.5 * xs / width).astype(np.float32)[..., None]
+
+    def simulate(step: int) -> dict:
+        time.sleep(0.02)
+        depth = np.roll(base_depth, step, axis=1)
+        return {
+            "rgb": np.roll(base_rgb, step, axis=1),
+            "depth": depth,
+            "panoptic": (depth * 10).astype(np.int32),
+            "pose": np.eye(4),
+        }
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, num_workers in [
+            ("saving off", None),
+            ("written while stepping", 0),
+            ("TrajectoryWriter, 2 threads", 2),
+        ]:
+            writer = TrajectoryWriter(num_workers=num_workers or 0)
+            start = time.perf_counter()
+            for step in range(num_steps):
+                frame = simulate(step)
+                if num_workers is not None:
+                    writer.submit(_write_benchmark_frame, output_dir, step, frame)
+            stepping = time.perf_counter() - start
+            writer.close()
+            total = time.perf_counter() - start
+            timings[f"{name}, step"] = 1000.0 * stepping / num_steps
+            timings[f"{name}, step incl. final flush"] = 1000.0 * total / num_steps
+    report(f"{num_steps} simulation steps saving trajectory frames", timings)
+
+
+def benchmark_trajectory_layout(num_nodes: int, num_frames: int = 300):
+    """
+    Write and read throughput of a trajectory of 640x480 RGB, depth and panoptic
+    frames and poses: one npy file per modality per frame, versus npz shards of
+    100 frames, compressed or not. Reading loads the RGB, depth and pose of
+    every frame in order, as HabitatDataset does. The jpg/png previews of the
+    per-file layout are left out. num_nodes is unused.
+    """
+    import glob
+    import shutil
+    import tempfile
+
+    from habitat_llm.concept_graphs.trajectory_shards import (
+        TrajectoryShardReader,
+        TrajectoryShardWriter,
+    )
+
+    height, width = 480, 640
+    ys, xs = np.mgrid[0:height, 0:width]
+    base_rgb = (np.stack([xs // 4, ys // 4, (xs + ys) // 8], axis=-1) % 256).astype(
+        np.uint8
+    )
+    base_depth = (0.5 + 4.5 * xs / width).astype(np.float32)[..., None]
+    frames = []
+    for index in range(num_frames):
+        depth = np.roll(base_depth, index, axis=1)
+        frames.append(
+            {
+                "pose": np.eye(4),
+                "rgb": np.roll(base_rgb, index, axis=1),
+                "depth": depth,
+                "panoptic": (depth * 10).astype(np.int32),
+            }
+        )
+
+    def write_files(agent_dir: str):
+        for modality in frames[0]:
+            os.makedirs(os.path.join(agent_dir, modality))
+        for index, frame in enumerate(frames):
+            for modality, array in frame.items():
+                np.save(os.path.join(agent_dir, modality, f"{index}.npy"), array)
+
+    def read_files(agent_dir: str):
+        def sorted_paths(modality: str) -> List[str]:
+            paths = glob.glob(os.path.join(agent_dir, modality, "*.npy"))
+            return sorted(paths, key=lambda path: int(os.path.basename(path)[:-4]))
+
+        for modality in ["pose", "rgb", "depth"]:
+            for path in sorted_paths(modality):
+                np.load(path)
+
+    def write_shards(agent_dir: str, compress: bool):
+        writer = TrajectoryShardWriter(agent_dir, compress=compress)
+        for index, frame in enumerate(frames):
+            writer.add_frame(index, **frame)
+        writer.close()
+
+    def read_shards(agent_dir: str):
+        reader = TrajectoryShardReader(agent_dir)
+        reader.get_all("pose")
+        for position in range(len(reader)):
+            reader.get("rgb", position)
+            reader.get("depth", position)
+
+    layouts = {
+        "one file per frame": (write_files, read_files),
+        "shards": (lambda path: write_shards(path, False), read_shards),
+        "compressed shards": (lambda path: write_shards(path, True), read_shards),
+    }
+    timings = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, (write, read) in layouts.items():
+            agent_dir = os.path.join(output_dir, "agent_0")
+            start = time.perf_counter()
+            write(agent_dir)
+            write_time = time.perf_counter() - start
+            start = time.perf_counter()
+            read(agent_dir)
+            read_time = time.perf_counter() - start
+            paths = [
+                os.path.join(root, file)
+                for root, _, files in os.walk(agent_dir)
+                for file in files
+            ]
+            size = sum(os.path.getsize(path) for path in paths) / 1e6
+            label = f"{name} ({len(paths)} files, {size:.0f} MB)"
+            timings[f"{label}, write"] = 1000.0 * write_time / num_frames
+            timings[f"{label}, read"] = 1000.0 * read_time / num_frames
+            shutil.rmtree(agent_dir)
+    report(f"{num_frames}-frame trajectory layouts (per frame)", timings)
+
+
+BENCHMARKS = {
+    "lookup": benchmark_lookup,
+    "type_queries": benchmark_type_queries,
+    "merge": benchmark_merge,
+    "node_removal": benchmark_node_removal,
+    "perception_step": benchmark_perception_step,
+    "two_agent_perception": benchmark_two_agent_perception,
+    "metadata_lookup": benchmark_metadata_lookup,
+    "region_lookup": benchmark_region_lookup,
+    "panoptic_decomposition": benchmark_panoptic_decomposition,
+    "unprojection": benchmark_unprojection,
+    "cg_ingestion": benchmark_cg_ingestion,
+    "detection_association": benchmark_detection_association,
+    "furniture_relations": benchmark_furniture_relations,
+    "keyframe_gating": benchmark_keyframe_gating,
+    "graph_log": benchmark_graph_log,
+    "graph_export": benchmark_graph_export,
+    "graph_log_delta": benchmark_graph_log_delta,
+    "trajectory_saving": benchmark_trajectory_saving,
+    "trajectory_layout": benchmark_trajectory_layout,
+    "nearest": benchmark_nearest,
+    "containment": benchmark_containment,
+    "world_descr": benchmark_world_descr,
+    "serialization": benchmark_serialization,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--benchmark",
+        choices=list(BENCHMARKS) + ["all"],
+        default="all",
+    )
+    parser.add_argument("--num-nodes", type=int, default=5000)
+    args = parser.parse_args()
+
+    selected = BENCHMARKS if args.benchmark == "all" else {args.benchmark: None}
+    for name in selected:
+        BENCHMARKS[name](args.num_nodes)